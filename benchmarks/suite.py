@@ -0,0 +1,245 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+'''
+Benchmarks every gandalf client transport against a
+:class:`gandalf.testing.FakeGandalfServer` and prints one JSON document with
+ops/sec, p50/p99 latency and peak RSS for each case, so results can be
+compared across releases. The server runs in its own process and every case
+runs in a new process, so peak RSS only covers the client running that case::
+
+    python -m benchmarks.suite --output bench.json
+    python -m benchmarks.suite --transport tornado --case repository_get
+'''
+import argparse
+import asyncio
+import json
+import multiprocessing
+import platform
+import resource
+import sys
+import time
+from collections import namedtuple
+
+import tornado.gen as gen
+from tornado.httpclient import AsyncHTTPClient
+from tornado.ioloop import IOLoop
+
+import gandalf.asyncio_cli as asyncio_cli
+import gandalf.client as client
+import gandalf.tornado_cli as tornado_cli
+from gandalf.testing import FakeGandalfServer, generate_content
+from gandalf.version import __version__
+
+REPOSITORY = 'bench'
+USER = 'bench'
+BIG_FILE = 'big.bin'
+
+Case = namedtuple('Case', ['name', 'kind', 'method', 'args'])
+
+CASES = [
+    Case('repository_get', 'small', 'repository_get', (REPOSITORY,)),
+    Case('user_get_keys', 'small', 'user_get_keys', (USER,)),
+    Case('repository_archive', 'large', 'repository_archive', (REPOSITORY, 'master')),
+    Case('repository_contents', 'large', 'repository_contents', (REPOSITORY, BIG_FILE)),
+    Case('repository_diff_commits', 'large', 'repository_diff_commits', (REPOSITORY, 'first', 'master')),
+    Case('burst_repository_get', 'burst', 'repository_get', (REPOSITORY,)),
+]
+
+
+def peak_rss():
+    '''
+    Peak resident set size of this process, in bytes.
+    '''
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def percentile(values, percent):
+    ordered = sorted(values)
+    index = int(round(percent / 100.0 * (len(ordered) - 1)))
+    return ordered[index]
+
+
+def summarize(case, transport, latencies, elapsed, rss_before, options):
+    calls = options.iterations * (options.concurrency if case.kind == 'burst' else 1)
+    return {
+        'case': case.name,
+        'kind': case.kind,
+        'transport': transport,
+        'iterations': len(latencies),
+        'calls': calls,
+        'ops_per_sec': calls / elapsed if elapsed else None,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'peak_rss_bytes': peak_rss(),
+        'rss_growth_bytes': peak_rss() - rss_before,
+    }
+
+
+def populate(server, options):
+    server.populate(REPOSITORY, files=options.files, size=options.file_size)
+    server.tag(REPOSITORY, 'first')
+    # Change every other file, so repository_diff_commits has a sizeable diff
+    changed = dict(
+        (path, generate_content(path, options.file_size))
+        for path in sorted(server.gandalf.get_repository(REPOSITORY).files('master'))[::2]
+    )
+    changed[BIG_FILE] = generate_content(BIG_FILE, options.large_size)
+    server.commit(REPOSITORY, changed)
+    client.GandalfClient(server.host, server.port).user_new(USER, {
+        'key{0}'.format(i): 'ssh-rsa AAAA{0} bench@localhost'.format(i) for i in range(5)
+    })
+
+
+def serve(options, ready, stop):
+    # Runs the fake server in its own process, so its memory and CPU aren't
+    # measured with the clients'
+    with FakeGandalfServer(latency=options.latency) as server:
+        populate(server, options)
+        ready.put((server.host, server.port))
+        stop.wait()
+
+
+def run_sync(address, case, options):
+    gandalf = client.GandalfClient(address[0], address[1])
+    method = getattr(gandalf, case.method)
+    for _ in range(options.warmup):
+        method(*case.args)
+
+    rss_before = peak_rss()
+    latencies = []
+    started = time.time()
+    for _ in range(options.iterations):
+        call_started = time.time()
+        if case.kind == 'burst':
+            gandalf.map([(case.method, case.args)] * options.concurrency, max_workers=options.concurrency)
+        else:
+            method(*case.args)
+        latencies.append(time.time() - call_started)
+    elapsed = time.time() - started
+
+    gandalf.client.close()
+    return summarize(case, 'requests', latencies, elapsed, rss_before, options)
+
+
+def run_tornado(address, case, options):
+    AsyncHTTPClient.configure(None, max_clients=options.concurrency)
+    http_client = AsyncHTTPClient(force_instance=True, max_body_size=1024 ** 3)
+    gandalf = tornado_cli.AsyncTornadoGandalfClient(address[0], address[1], http_client.fetch)
+
+    @gen.coroutine
+    def run():
+        method = getattr(gandalf, case.method)
+        for _ in range(options.warmup):
+            yield method(*case.args)
+
+        rss_before = peak_rss()
+        latencies = []
+        started = time.time()
+        for _ in range(options.iterations):
+            call_started = time.time()
+            if case.kind == 'burst':
+                yield [method(*case.args) for _ in range(options.concurrency)]
+            else:
+                yield method(*case.args)
+            latencies.append(time.time() - call_started)
+        elapsed = time.time() - started
+
+        raise gen.Return(summarize(case, 'tornado', latencies, elapsed, rss_before, options))
+
+    try:
+        return IOLoop.current().run_sync(run)
+    finally:
+        http_client.close()
+
+
+def run_asyncio(address, case, options):
+    async def run():
+        http_client = asyncio_cli.AsyncioHTTPClient(max_connections=options.concurrency)
+        gandalf = asyncio_cli.AsyncioGandalfClient(address[0], address[1], http_client.fetch)
+        method = getattr(gandalf, case.method)
+        for _ in range(options.warmup):
+            await method(*case.args)
+
+        rss_before = peak_rss()
+        latencies = []
+        started = time.time()
+        for _ in range(options.iterations):
+            call_started = time.time()
+            if case.kind == 'burst':
+                await asyncio.gather(*[method(*case.args) for _ in range(options.concurrency)])
+            else:
+                await method(*case.args)
+            latencies.append(time.time() - call_started)
+        elapsed = time.time() - started
+
+        http_client.close()
+        return summarize(case, 'asyncio', latencies, elapsed, rss_before, options)
+
+    return asyncio.run(run())
+
+
+TRANSPORTS = {
+    'requests': run_sync,
+    'tornado': run_tornado,
+    'asyncio': run_asyncio,
+}
+
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(description='Benchmarks gandalf-client against a fake gandalf server.')
+    parser.add_argument('--transport', action='append', choices=sorted(TRANSPORTS),
+                        help='transport to benchmark, may be repeated (default: all)')
+    parser.add_argument('--case', action='append', choices=[case.name for case in CASES],
+                        help='case to run, may be repeated (default: all)')
+    parser.add_argument('--iterations', type=int, default=200, help='timed iterations per case')
+    parser.add_argument('--warmup', type=int, default=10, help='untimed iterations per case')
+    parser.add_argument('--concurrency', type=int, default=50, help='concurrent calls in burst cases')
+    parser.add_argument('--files', type=int, default=200, help='files in the benchmark repository')
+    parser.add_argument('--file-size', type=int, default=4096, help='size of each file, in bytes')
+    parser.add_argument('--large-size', type=int, default=4 * 1024 * 1024,
+                        help='size of the file read by repository_contents, in bytes')
+    parser.add_argument('--latency', type=float, default=0, help='seconds the server waits before each response')
+    parser.add_argument('--output', help='file to write the JSON report to (default: stdout)')
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    options = parse_args(args)
+    cases = [case for case in CASES if not options.case or case.name in options.case]
+    transports = options.transport or sorted(TRANSPORTS)
+
+    report = {
+        'version': __version__,
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'options': vars(options),
+        'results': [],
+    }
+    # Fresh interpreters, so peak RSS only covers the case being run
+    context = multiprocessing.get_context('spawn')
+    ready, stop = context.Queue(), context.Event()
+    server = context.Process(target=serve, args=(options, ready, stop))
+    server.start()
+    try:
+        address = ready.get()
+        for transport in transports:
+            for case in cases:
+                with context.Pool(1) as pool:
+                    report['results'].append(pool.apply(TRANSPORTS[transport], (address, case, options)))
+    finally:
+        stop.set()
+        server.join()
+
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if options.output:
+        with open(options.output, 'w') as fileobj:
+            fileobj.write(output + '\n')
+    else:
+        print(output)
+    return report
+
+
+if __name__ == '__main__':
+    main()
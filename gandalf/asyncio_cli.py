@@ -0,0 +1,416 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import asyncio
+import functools
+import logging
+import time
+from urllib.parse import urlencode, urlsplit
+
+import gandalf.client as client
+from gandalf.streams import MultipartEncoder
+
+
+def wake(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class AsyncioResponse(object):
+    '''
+    Response returned by :class:`AsyncioHTTPClient`. It exposes the same
+    attributes as a `requests` response, so the default accessors of
+    :class:`gandalf.client.GandalfClient` work unchanged.
+
+    ``time_info`` holds the seconds spent connecting, DNS lookup included,
+    when a new connection was opened, and until the status line was received
+    (``starttransfer``).
+    '''
+
+    def __init__(self, url, status_code, headers, content, time_info=None):
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self.time_info = time_info or {}
+
+
+def encode_body(data=None, files=None):
+    '''
+    Returns a ``(content_type, body)`` tuple for the given request data,
+    following the same conventions as `requests`: ``files`` produce a
+    streamed multipart body, dicts are form encoded and strings are sent
+    as is.
+    '''
+    if files:
+        data = MultipartEncoder(data, files)
+
+    if isinstance(data, MultipartEncoder):
+        return data.content_type, data
+
+    if isinstance(data, dict):
+        return 'application/x-www-form-urlencoded', urlencode(data).encode('utf-8')
+
+    if data is None:
+        return None, b''
+
+    if not isinstance(data, bytes):
+        data = data.encode('utf-8')
+    return None, data
+
+
+class AsyncioHTTPClient(object):
+    '''
+    Minimal HTTP/1.1 client built on asyncio streams.
+
+    Connections are kept alive and reused per host, and at most
+    ``max_connections`` requests are in flight for each host, so thousands
+    of concurrent calls can share a single event loop.
+
+    :param max_connections: maximum number of open connections per host
+    :param timeout: seconds to wait for a whole request/response exchange
+    '''
+
+    chunk_size = 64 * 1024
+
+    def __init__(self, max_connections=100, timeout=None):
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self._idle = {}
+        self._semaphores = {}
+
+    def _get_semaphore(self, key):
+        if key not in self._semaphores:
+            self._semaphores[key] = asyncio.Semaphore(self.max_connections)
+        return self._semaphores[key]
+
+    async def _connect(self, key, reuse=True):
+        idle = self._idle.get(key) if reuse else None
+        while idle:
+            reader, writer = idle.pop()
+            if not writer.is_closing() and not reader.at_eof():
+                return reader, writer, True
+            writer.close()
+        reader, writer = await asyncio.open_connection(*key)
+        return reader, writer, False
+
+    def _release(self, key, reader, writer, keep_alive):
+        if keep_alive and not writer.is_closing():
+            self._idle.setdefault(key, []).append((reader, writer))
+        else:
+            writer.close()
+
+    async def fetch(self, url, method='GET', data=None, files=None, headers=None,
+                    streaming_callback=None, timeout=None):
+        '''
+        Sends a request and returns an :class:`AsyncioResponse`.
+
+        :param streaming_callback: when given, the body of successful responses
+                                   is passed to it in chunks as it arrives
+                                   instead of being buffered in the response
+        :param timeout: overrides the ``timeout`` of the client for this request
+        '''
+        if timeout is None:
+            timeout = self.timeout
+        parts = urlsplit(url)
+        key = (parts.hostname, parts.port or 80)
+        path = parts.path or '/'
+        if parts.query:
+            path = '{0}?{1}'.format(path, parts.query)
+
+        content_type, body = encode_body(data, files)
+        request_headers = {
+            'Host': parts.netloc,
+            'Connection': 'keep-alive',
+        }
+        if isinstance(body, bytes):
+            request_headers['Content-Length'] = str(len(body))
+        elif body.len is not None:
+            request_headers['Content-Length'] = str(body.len)
+        else:
+            request_headers['Transfer-Encoding'] = 'chunked'
+        if content_type:
+            request_headers['Content-Type'] = content_type
+        request_headers.update(headers or {})
+
+        head = '{0} {1} HTTP/1.1\r\n'.format(method, path)
+        head += ''.join('{0}: {1}\r\n'.format(*item) for item in request_headers.items())
+        head = head.encode('latin-1') + b'\r\n'
+        if isinstance(body, bytes):
+            request = head + body
+        else:
+            chunked = 'Transfer-Encoding' in request_headers
+            request = self._iter_request(head, body, chunked)
+
+        async with self._get_semaphore(key):
+            exchange = self._exchange(key, request, method, streaming_callback)
+            if timeout is not None:
+                exchange = asyncio.wait_for(exchange, timeout)
+            status_code, response_headers, content, time_info = await exchange
+        return AsyncioResponse(url, status_code, response_headers, content, time_info)
+
+    def _iter_request(self, head, body, chunked):
+        yield head
+        for chunk in body:
+            if chunked:
+                chunk = '{0:x}\r\n'.format(len(chunk)).encode('latin-1') + chunk + b'\r\n'
+            yield chunk
+        if chunked:
+            yield b'0\r\n\r\n'
+
+    async def _exchange(self, key, request, method, streaming_callback):
+        # Streamed bodies can't be sent again if a reused connection turns out
+        # to be closed, so they always go through a new connection
+        started = time.time()
+        reader, writer, reused = await self._connect(key, reuse=isinstance(request, bytes))
+        time_info = {} if reused else {'connect': time.time() - started}
+        try:
+            if isinstance(request, bytes):
+                writer.write(request)
+            else:
+                for chunk in request:
+                    writer.write(chunk)
+                    await writer.drain()
+            await writer.drain()
+            status_line = await reader.readline()
+            time_info['starttransfer'] = time.time() - started
+            if not status_line and reused:
+                # The server closed an idle connection, start over on a new one
+                writer.close()
+                return await self._exchange(key, request, method, streaming_callback)
+            result = await self._read_response(reader, status_line, method, streaming_callback)
+        except BaseException:
+            writer.close()
+            raise
+        self._release(key, reader, writer, keep_alive=result[3])
+        return result[:3] + (time_info,)
+
+    async def _read_response(self, reader, status_line, method, streaming_callback):
+        if not status_line:
+            raise ConnectionError('connection closed before receiving a response')
+        version, status_code = status_line.decode('latin-1').split(None, 2)[:2]
+        status_code = int(status_code)
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, value = line.decode('latin-1').split(':', 1)
+            headers[name.strip().lower()] = value.strip()
+
+        keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+
+        chunks = []
+        write = chunks.append
+        if streaming_callback is not None and status_code == 200:
+            write = streaming_callback
+
+        if method == 'HEAD' or status_code in (204, 304) or 100 <= status_code < 200:
+            pass
+        elif headers.get('transfer-encoding', '').lower() == 'chunked':
+            await self._read_chunked(reader, write)
+        elif 'content-length' in headers:
+            await self._read_exactly(reader, int(headers['content-length']), write)
+        else:
+            await self._read_until_eof(reader, write)
+            keep_alive = False
+
+        return status_code, headers, b''.join(chunks), keep_alive
+
+    async def _read_exactly(self, reader, size, write):
+        while size > 0:
+            chunk = await reader.read(min(size, self.chunk_size))
+            if not chunk:
+                raise asyncio.IncompleteReadError(chunk, size)
+            write(chunk)
+            size -= len(chunk)
+
+    async def _read_until_eof(self, reader, write):
+        while True:
+            chunk = await reader.read(self.chunk_size)
+            if not chunk:
+                return
+            write(chunk)
+
+    async def _read_chunked(self, reader, write):
+        while True:
+            size = int((await reader.readline()).split(b';', 1)[0], 16)
+            if size == 0:
+                while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                    pass
+                return
+            await self._read_exactly(reader, size, write)
+            await reader.readexactly(2)
+
+    def close(self):
+        for connections in self._idle.values():
+            for reader, writer in connections:
+                writer.close()
+        self._idle.clear()
+
+
+class AsyncioGandalfClient(client.GandalfClient):
+    '''
+    Gandalf client for plain asyncio applications. Every API method returns
+    an awaitable.
+
+    :param client: coroutine function with the same signature as
+                   :meth:`AsyncioHTTPClient.fetch`. Defaults to the ``fetch``
+                   of a new :class:`AsyncioHTTPClient`.
+    '''
+
+    is_async = True
+
+    def __init__(self, host, port, client=None, **kwargs):
+        if client is None:
+            client = AsyncioHTTPClient().fetch
+        super(AsyncioGandalfClient, self).__init__(host, port, client, **kwargs)
+
+    def streaming_options(self, fileobj):
+        return {'streaming_callback': fileobj.write}
+
+    def write_stream(self, response, fileobj):
+        # Chunks were already written by the streaming callback
+        pass
+
+    def iter_stream(self, response):
+        # Chunks were already passed to the streaming callback
+        return iter(())
+
+    def _resolved(self, value):
+        future = asyncio.get_event_loop().create_future()
+        future.set_result(value)
+        return future
+
+    def _gather(self, results):
+        return asyncio.gather(*results)
+
+    def get_header(self, response, name):
+        return response.headers.get(name.lower())
+
+    def get_timings(self, response):
+        timings = {}
+        if 'connect' in response.time_info:
+            timings['connect'] = response.time_info['connect']
+        if 'starttransfer' in response.time_info:
+            timings['ttfb'] = response.time_info['starttransfer']
+        return timings
+
+    async def _probe(self, server, timeout):
+        try:
+            response = await self.client(url='{0}/healthcheck/'.format(server), method='GET', timeout=timeout)
+        except Exception:
+            return False
+        return self.get_code(response) == 200
+
+    async def _acquire(self, limit):
+        if limit is None:
+            return None
+        started = time.time()
+        loop = asyncio.get_event_loop()
+        woken = loop.create_future()
+        wait = limit.reserve(functools.partial(loop.call_soon_threadsafe, wake, woken))
+        if wait == 0:
+            return 0
+        limit.enqueue()
+        try:
+            while wait != 0:
+                if wait is None:
+                    await woken
+                else:
+                    await asyncio.sleep(wait)
+                woken = loop.create_future()
+                wait = limit.reserve(functools.partial(loop.call_soon_threadsafe, wake, woken))
+        finally:
+            limit.dequeue(time.time() - started)
+        return time.time() - started
+
+    async def _select_endpoint(self, kwargs, tried):
+        if self.pool is None:
+            return None
+        while True:
+            endpoint, probe = self.pool.pick(kwargs.get('method', 'GET'), tried)
+            if not probe or self._endpoint_probed(
+                    endpoint, await self._probe(endpoint.url, self.pool.probe_timeout), tried):
+                return endpoint
+
+    async def _request(self, *args, **kwargs):
+        key = self._coalesce_key(kwargs)
+        if key is None:
+            return await self._dispatch(args, kwargs)
+        # Callers giving up must not cancel the request shared with the others
+        return await asyncio.shield(self.flights.share(
+            key, lambda: asyncio.ensure_future(self._dispatch(args, kwargs))
+        ))
+
+    async def _dispatch(self, args, kwargs):
+        name = self._hedged_route(kwargs)
+        if name is None:
+            return await self._send(args, kwargs, [])
+        return await self._hedged_request(name, args, kwargs)
+
+    async def _hedged_request(self, name, args, kwargs):
+        started = time.time()
+        tried = []
+        tasks = {asyncio.ensure_future(self._send(args, kwargs, tried))}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self.hedge.delay(name))
+            if not done and self.hedge.allow():
+                logging.info('Hedging %s after %.3fs', kwargs['url'], time.time() - started)
+                tasks.add(asyncio.ensure_future(self._send(args, kwargs, list(tried))))
+            while True:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                # A failed attempt only counts once the other one failed too
+                for task in sorted(done, key=lambda task: task.exception() is not None):
+                    if task.exception() is None:
+                        self.hedge.record(name, time.time() - started)
+                        return task.result()
+                    if not tasks:
+                        return task.result()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _send(self, args, kwargs, tried):
+        retries = self.retry.begin() if self.retry is not None else None
+        while True:
+            if self._check_breaker():
+                try:
+                    healthy = await self._probe(self.gandalf_server, self.breaker.probe_timeout)
+                except BaseException:
+                    # Cancelled while probing, let a later call probe again
+                    self.breaker.probed(False)
+                    raise
+                self._probed(healthy)
+            endpoint = await self._select_endpoint(kwargs, tried)
+            tried.append(endpoint)
+            limit = self._request_limit(kwargs)
+            queued = await self._acquire(limit)
+            attempt = self._endpoint_options(endpoint, kwargs)
+            info = self._start_request(attempt, queued)
+            started = time.time()
+            try:
+                response = await self.client(*args, **self._attempt_options(retries, attempt))
+            except asyncio.CancelledError as e:
+                self._cancel_attempt(info, started, endpoint, e)
+                raise
+            except Exception as e:
+                self._record_attempt(started, endpoint=endpoint)
+                self._end_request(info, error=e)
+                delay = self._next_delay(retries, kwargs, endpoint, tried, error=e)
+                if delay is None:
+                    raise
+            else:
+                self._record_attempt(started, self.get_code(response), endpoint)
+                delay = self._next_delay(retries, kwargs, endpoint, tried, status=self.get_code(response))
+                if delay is None:
+                    break
+                self._discard_response(info, response)
+            finally:
+                self._release(limit)
+            await asyncio.sleep(delay)
+
+        self._end_request(info, response)
+        if self.get_code(response) != 200:
+            logging.warning(self.get_content(response))
+        return response
@@ -0,0 +1,127 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import threading
+import time
+from collections import deque
+
+from gandalf import GandalfException
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+
+class CircuitOpenError(GandalfException):
+    '''
+    Raised instead of making a request while the circuit breaker of the
+    gandalf server is open.
+    '''
+
+    def __init__(self, server):
+        self.response = None
+        self.obj = None
+        self.status_code = None
+        self.content = u'{0} is unavailable'.format(server)
+        Exception.__init__(self, u'{0} (circuit breaker open)'.format(self.content))
+
+
+class CircuitBreaker(object):
+    '''
+    Stops calling a gandalf server that is failing or too slow, so callers
+    fail fast instead of waiting for timeouts.
+
+    The breaker keeps the outcome of the calls made in the last ``window``
+    seconds. Once there are at least ``min_calls`` of them and the share of
+    failed calls (connection errors and 5xx responses) reaches
+    ``failure_rate``, or the share of calls slower than ``slow_call_duration``
+    reaches ``slow_call_rate``, the breaker opens and calls raise
+    :class:`CircuitOpenError`. After ``open_timeout`` seconds it's half open:
+    the next call probes the server with a healthcheck first, closing the
+    breaker if the server is healthy or opening it again otherwise. A probe
+    not reported within ``probe_timeout`` seconds, e.g. because its caller
+    was cancelled, lets the next call probe again.
+
+    :param failure_rate: share of failed calls that opens the breaker
+    :param slow_call_duration: seconds after which a call counts as slow,
+                               ``None`` to ignore latency
+    :param slow_call_rate: share of slow calls that opens the breaker
+    :param min_calls: calls needed in the window before the breaker may open
+    :param window: seconds of calls taken into account
+    :param open_timeout: seconds the breaker stays open before probing
+    :param probe_timeout: seconds to wait for the healthcheck probe
+
+    Usage:
+
+    .. code-block:: python
+
+       gandalf = GandalfClient('localhost', 8001, breaker=CircuitBreaker(slow_call_duration=2))
+    '''
+
+    def __init__(self, failure_rate=0.5, slow_call_duration=None, slow_call_rate=0.5,
+                 min_calls=10, window=30, open_timeout=30, probe_timeout=5, clock=time.time):
+        self.failure_rate = failure_rate
+        self.slow_call_duration = slow_call_duration
+        self.slow_call_rate = slow_call_rate
+        self.min_calls = min_calls
+        self.window = window
+        self.open_timeout = open_timeout
+        self.probe_timeout = probe_timeout
+        self.clock = clock
+        self.state = CLOSED
+        self.opened_at = None
+        self.probing_since = None
+        self.calls = deque()
+        self.lock = threading.Lock()
+
+    def before_call(self):
+        '''
+        Returns :data:`CLOSED` when a call may be made, :data:`HALF_OPEN` when
+        the caller must probe the server and report it with :meth:`probed`
+        first, or :data:`OPEN` when the call must fail fast.
+        '''
+        with self.lock:
+            if self.state == CLOSED:
+                return CLOSED
+            now = self.clock()
+            if self.state == OPEN and now - self.opened_at >= self.open_timeout or \
+                    self.state == HALF_OPEN and now - self.probing_since >= self.probe_timeout:
+                # Only this caller probes, the others keep failing fast
+                self.state = HALF_OPEN
+                self.probing_since = now
+                return HALF_OPEN
+        return OPEN
+
+    def probed(self, healthy):
+        with self.lock:
+            if healthy:
+                self.state = CLOSED
+                self.calls.clear()
+            else:
+                self._open()
+
+    def record(self, failed, duration):
+        '''
+        Records the outcome of a call made while the breaker was closed.
+        '''
+        slow = self.slow_call_duration is not None and duration >= self.slow_call_duration
+        with self.lock:
+            if self.state != CLOSED:
+                return
+            now = self.clock()
+            self.calls.append((now, failed, slow))
+            while self.calls[0][0] <= now - self.window:
+                self.calls.popleft()
+
+            total = len(self.calls)
+            if total < self.min_calls:
+                return
+            failures = sum(1 for call in self.calls if call[1])
+            slow_calls = sum(1 for call in self.calls if call[2])
+            if failures >= self.failure_rate * total or \
+                    (self.slow_call_duration is not None and slow_calls >= self.slow_call_rate * total):
+                self._open()
+
+    def _open(self):
+        self.state = OPEN
+        self.opened_at = self.clock()
+        self.calls.clear()
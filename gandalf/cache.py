@@ -0,0 +1,294 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import errno
+import json
+import mmap
+import os
+import re
+import tarfile
+import tempfile
+import threading
+import time
+import zipfile
+from collections import OrderedDict
+
+COMMIT_RE = re.compile(r'^[0-9a-f]{40}$')
+
+
+def is_commit(ref):
+    return bool(COMMIT_RE.match(ref))
+
+
+def makedirs(directory):
+    try:
+        os.makedirs(directory)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+
+
+class LRUCache(object):
+    '''
+    Thread safe least recently used cache bounded by the total size of its
+    values.
+
+    :param max_size: maximum total size of the cached values
+    :param sizeof: function returning the size of a value. Defaults to
+                   ``len``, which bounds a cache of bytes by its byte count.
+    '''
+
+    def __init__(self, max_size, sizeof=len):
+        self.max_size = max_size
+        self.sizeof = sizeof
+        self.size = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._items.pop(key)
+            except KeyError:
+                return default
+            self._items[key] = value
+            return value
+
+    def set(self, key, value):
+        size = self.sizeof(value)
+        if size > self.max_size:
+            return
+        with self._lock:
+            if key in self._items:
+                self.size -= self.sizeof(self._items.pop(key))
+            self._items[key] = value
+            self.size += size
+            while self.size > self.max_size:
+                _, evicted = self._items.popitem(last=False)
+                self.size -= self.sizeof(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.size = 0
+
+
+class DiskCache(object):
+    '''
+    Stores bytes in files under ``directory``, named after their key. Keys
+    must be safe to use as file names, such as git object hashes.
+    '''
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], key[2:])
+
+    def __contains__(self, key):
+        return os.path.exists(self.path(key))
+
+    def get(self, key, default=None):
+        try:
+            with open(self.path(key), 'rb') as cached:
+                return cached.read()
+        except IOError as e:
+            if e.errno != errno.ENOENT:
+                raise
+            return default
+
+    def set(self, key, value):
+        path = self.path(key)
+        directory = os.path.dirname(path)
+        makedirs(directory)
+
+        # Write to a temporary file first so readers never see partial blobs
+        fd, tmp_path = tempfile.mkstemp(dir=directory)
+        with os.fdopen(fd, 'wb') as tmp:
+            tmp.write(value)
+        os.rename(tmp_path, path)
+
+
+class BlobCache(object):
+    '''
+    Content addressed cache of git blobs, keyed by their hash. Blobs are
+    immutable, so cached contents never need to be invalidated.
+
+    Blobs are kept in memory up to ``max_bytes``. When a ``directory`` is
+    given, every blob is also written there and blobs evicted from memory
+    are read back from disk.
+
+    :param max_bytes: memory budget for cached blobs
+    :param directory: optional directory for the on-disk tier
+    '''
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, directory=None):
+        self.memory = LRUCache(max_bytes)
+        self.disk = directory and DiskCache(directory)
+
+    def __contains__(self, blob_hash):
+        return blob_hash in self.memory or bool(self.disk) and blob_hash in self.disk
+
+    def get(self, blob_hash):
+        content = self.memory.get(blob_hash)
+        if content is None and self.disk:
+            content = self.disk.get(blob_hash)
+            if content is not None:
+                self.memory.set(blob_hash, content)
+        return content
+
+    def set(self, blob_hash, content):
+        self.memory.set(blob_hash, content)
+        if self.disk and blob_hash not in self.disk:
+            self.disk.set(blob_hash, content)
+
+
+class MappedFile(mmap.mmap):
+    # zipfile checks whether its file object is seekable, mmap doesn't say so
+    def seekable(self):
+        return True
+
+
+class MappedArchive(object):
+    # Archives don't close the file objects they are given, close the map
+    # along with the archive
+    mapped = None
+
+    def close(self):
+        try:
+            super(MappedArchive, self).close()
+        finally:
+            self.mapped.close()
+
+
+class MappedZipFile(MappedArchive, zipfile.ZipFile):
+    pass
+
+
+class MappedTarFile(MappedArchive, tarfile.TarFile):
+    pass
+
+
+class ArchiveCache(object):
+    '''
+    Keeps repository archives on disk, keyed by repository, commit and format,
+    and opens them memory mapped, so reading a few members of a big archive
+    neither copies nor loads the whole file.
+
+    :param directory: directory where archives are stored
+    '''
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def path(self, name, commit, format):
+        return os.path.join(self.directory, name, '{0}.{1}'.format(commit, format))
+
+    def __contains__(self, key):
+        return os.path.exists(self.path(*key))
+
+    def writer(self, name, commit, format):
+        '''
+        Returns a temporary file to download an archive into. Pass it to
+        :meth:`store` once the download completes, or to :meth:`discard` if
+        it fails.
+        '''
+        directory = os.path.join(self.directory, name)
+        makedirs(directory)
+        return tempfile.NamedTemporaryFile(dir=directory, suffix='.tmp', delete=False)
+
+    def store(self, fileobj, name, commit, format):
+        fileobj.close()
+        os.rename(fileobj.name, self.path(name, commit, format))
+        return self.open(name, commit, format)
+
+    def discard(self, fileobj):
+        fileobj.close()
+        try:
+            os.unlink(fileobj.name)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+
+    def open(self, name, commit, format):
+        '''
+        Opens a stored archive. Closing it also closes its memory map.
+        '''
+        with open(self.path(name, commit, format), 'rb') as archive:
+            mapped = MappedFile(archive.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            if format == 'tar':
+                opened = MappedTarFile(fileobj=mapped)
+            else:
+                opened = MappedZipFile(mapped)
+        except Exception:
+            mapped.close()
+            raise
+        opened.mapped = mapped
+        return opened
+
+
+class RefCache(object):
+    '''
+    Resolves branch and tag names to the commits they point to and caches
+    reads made at those commits.
+
+    Resolved refs expire after ``ttl`` seconds, so reads follow branches as
+    they move. Reads at a commit never change, so they are only evicted to
+    keep the cached reads within ``max_bytes``.
+
+    Decoded JSON results are kept serialized and refs are copied, so every
+    read gets its own copy and callers changing it don't change the cache.
+
+    Entries are keyed by gandalf server, so clients of different servers can
+    share a cache.
+
+    :param ttl: seconds to keep the refs of a repository
+    :param max_bytes: memory budget for cached reads
+    '''
+
+    def __init__(self, ttl=5, max_bytes=64 * 1024 * 1024, clock=time.time):
+        self.ttl = ttl
+        self.clock = clock
+        # Values are (serialized, payload, size in bytes) tuples
+        self.results = LRUCache(max_bytes, sizeof=lambda value: value[2])
+        # (expires, refs) tuples by (server, name)
+        self._refs = {}
+
+    def get_result(self, key):
+        cached = self.results.get(key)
+        if cached is None:
+            return None
+        serialized, payload, size = cached
+        return json.loads(payload) if serialized else payload
+
+    def set_result(self, key, result):
+        serialized = not isinstance(result, (bytes, str))
+        payload = json.dumps(result) if serialized else result
+        size = len(payload.encode('utf-8')) if isinstance(payload, str) else len(payload)
+        self.results.set(key, (serialized, payload, size))
+
+    def get_refs(self, server, name):
+        expires, refs = self._refs.get((server, name), (0, None))
+        if refs is None or expires < self.clock():
+            return None
+        return dict(refs)
+
+    def set_refs(self, server, name, refs):
+        self._refs[(server, name)] = (self.clock() + self.ttl, dict(refs))
+
+    def invalidate(self, name=None):
+        '''
+        Forgets the refs of the repository ``name`` on every server, or of all
+        repositories.
+        '''
+        if name is None:
+            self._refs.clear()
+        else:
+            for key in [key for key in self._refs if key[1] == name]:
+                del self._refs[key]
@@ -1,12 +1,29 @@
 #!/usr/bin/python
 # -*- coding: utf-8 -*-
 
+import functools
 import logging
+import threading
+import time
+import weakref
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
 
-from six import string_types
-
+from gandalf import GandalfException
+from gandalf.breaker import CircuitOpenError, HALF_OPEN, OPEN
+from gandalf.cache import is_commit
+from gandalf.diff import DiffParser
+from gandalf.coalescing import SingleFlight
+from gandalf.instrumentation import RequestInfo, notify, request_size
+from gandalf.log import LogIterator
+from gandalf.pool import LEAST_OUTSTANDING, ServerPool
+from gandalf.routes import match_route
+from gandalf.streams import JSONItemParser, MultipartEncoder, iter_zip
+from gandalf.tree import TreeIndex, diff_trees
 from gandalf.decorators import (
-    may_async, response_bool, response_json, response_raw, response_archive
+    may_async, response_bool, response_json, response_raw, response_archive,
+    response_tar_members, cached_by_ref, then, decode, on_failure, process_future_as_parsed
 )
 
 try:
@@ -15,27 +32,361 @@ except ImportError:
     import json
 
 
+def decode_content(raw):
+    try:
+        return raw.decode('utf-8')
+    except UnicodeDecodeError:
+        return raw
+
+
+class CallResult(namedtuple('CallResult', ['call', 'value', 'error'])):
+    '''
+    Outcome of one call run by :meth:`GandalfClient.map`. ``error`` holds
+    the exception raised by the call, if any.
+    '''
+    __slots__ = ()
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
 class GandalfClient(object):
-    def __init__(self, host, port, client):
+    '''
+    :cvar chunk_size: size of the chunks written by streamed downloads
+    :cvar archive_spool_size: archives streamed without a file object are kept
+                              in memory up to this size and spooled to disk
+                              above it
+    :cvar is_async: whether API methods return awaitables or futures instead
+                    of results
+    :param host: gandalf server host
+    :param port: gandalf server port
+    :param client: callable with the same signature as ``requests.request``.
+                   Defaults to a :class:`gandalf.session.PooledSession`.
+    :param blob_cache: optional :class:`gandalf.cache.BlobCache` used by
+                       :meth:`repository_contents_by_hash`
+    :param ref_cache: optional :class:`gandalf.cache.RefCache`. When set,
+                      :meth:`repository_tree`, :meth:`repository_contents`
+                      and :meth:`repository_log` read at the commit their ref
+                      points to and are cached by that commit.
+    :param archive_cache: optional :class:`gandalf.cache.ArchiveCache` used by
+                          :meth:`repository_cached_archive`
+    :param observers: list of :class:`gandalf.instrumentation.RequestObserver`
+                      notified around every request
+    :param retry: optional :class:`gandalf.retry.RetryPolicy` used to retry
+                  idempotent requests failing with connection errors or
+                  transient status codes
+    :param breaker: optional :class:`gandalf.breaker.CircuitBreaker`. Requests
+                    raise :class:`gandalf.breaker.CircuitOpenError` instead of
+                    reaching the server while it's open.
+    :param pool: optional :class:`gandalf.pool.ServerPool` of replicas the
+                 requests are balanced over, see :meth:`for_servers`. It
+                 ejects and probes failing replicas one by one, so it can't be
+                 combined with a ``breaker``, which would stop every request
+                 when a single replica fails.
+    :param hedge: optional :class:`gandalf.hedging.HedgePolicy`, only used by
+                  the asynchronous clients
+    :param coalesce: when true, concurrent identical GET requests share one
+                     HTTP request and its response. Streamed downloads are
+                     never shared.
+    :param limit: optional :class:`gandalf.limits.Limit`, or
+                  :class:`gandalf.limits.MethodLimits`, bounding the requests
+                  in flight and the rate they are started at
+    '''
+
+    chunk_size = 64 * 1024
+    archive_spool_size = 8 * 1024 * 1024
+    is_async = False
+
+    def __init__(self, host, port, client=None, blob_cache=None, ref_cache=None, archive_cache=None,
+                 observers=None, retry=None, breaker=None, pool=None, hedge=None, coalesce=False,
+                 limit=None):
+        if breaker is not None and pool is not None:
+            raise ValueError('A ServerPool ejects failing servers itself, it can\'t be used with a breaker')
+        if client is None:
+            from gandalf.session import PooledSession
+            client = PooledSession()
         self.host = host
         self.port = port
         self.client = client
+        self.blob_cache = blob_cache
+        self.ref_cache = ref_cache
+        self.archive_cache = archive_cache
+        self.observers = list(observers or [])
+        self.retry = retry
+        self.breaker = breaker
+        self.pool = pool
+        self.hedge = hedge
+        self.flights = SingleFlight() if coalesce else None
+        self.limit = limit
+        # Requests waiting for their response to be decoded, by response
+        self._pending_requests = weakref.WeakKeyDictionary()
+        # Last transport error swallowed by _send, per thread, see map
+        self._failures = threading.local()
         self.gandalf_server = self._get_gandalf_server()
 
+    @classmethod
+    def for_servers(cls, endpoints, client=None, strategy=LEAST_OUTSTANDING, **kwargs):
+        '''
+        Creates a client balancing requests over replicas of a gandalf server
+        sharing the same storage. See :class:`gandalf.pool.ServerPool`.
+
+        :param endpoints: list of ``(host, port)`` tuples. Writes go to the
+                          first healthy one.
+        :param strategy: :data:`gandalf.pool.LEAST_OUTSTANDING` or
+                         :data:`gandalf.pool.EWMA`
+        '''
+        pool = ServerPool(endpoints, strategy)
+        return cls(pool.primary.host, pool.primary.port, client, pool=pool, **kwargs)
+
     def _get_gandalf_server(self):
         return 'http://{0}:{1}'.format(self.host, self.port)
 
     def _get_url(self, route):
         return '{0}/{1}'.format(self.gandalf_server, route.lstrip('/'))
 
+    def add_observer(self, observer):
+        self.observers.append(observer)
+
+    def _start_request(self, kwargs, queued=None):
+        if not self.observers:
+            return None
+        info = RequestInfo(
+            kwargs.get('method', 'GET'), kwargs['url'], request_size(kwargs),
+            streamed=bool(kwargs.get('stream') or kwargs.get('streaming_callback'))
+        )
+        if queued is not None:
+            info.timings['queue'] = queued
+        notify(self.observers, 'request_started', info)
+        return info
+
+    def _end_request(self, info, response=None, error=None):
+        # Observers are notified once the response is decoded, see
+        # _finish_request, unless there is no response to decode
+        if info is None:
+            return
+        info.timings['total'] = time.time() - info.started_at
+        if response is not None:
+            info.status = self.get_code(response)
+            info.timings.update(self.get_timings(response))
+        if error is not None or response is None:
+            info.error = error
+            notify(self.observers, 'request_finished', info)
+            return
+        self._pending_requests[response] = info
+
+    def _finish_request(self, response, decode_time, error=None):
+        info = self._pending_requests.pop(response, None) if response is not None else None
+        if info is None:
+            return
+        info.timings['decode'] = decode_time
+        info.error = error
+        info.bytes_received = self.get_size(response, info.streamed)
+        notify(self.observers, 'request_finished', info)
+
+    def _abandon_response(self, response):
+        # Ends the request of a response that won't be decoded, e.g. the one
+        # of a hedged attempt that lost
+        info = self._pending_requests.pop(response, None)
+        if info is None:
+            return
+        info.bytes_received = self.get_size(response, info.streamed)
+        notify(self.observers, 'request_finished', info)
+
+    def _attempt_options(self, retries, kwargs):
+        remaining = retries.remaining() if retries is not None else None
+        if remaining is None:
+            return kwargs
+        # Transports refuse timeouts of zero
+        return dict(kwargs, **self.timeout_options(max(remaining, 0.001)))
+
+    def _retry_delay(self, retries, kwargs, status=None, error=None):
+        if retries is None or kwargs.get('streaming_callback') is not None:
+            # Chunks already passed to a streaming callback can't be taken back
+            return None
+        delay = retries.delay(kwargs.get('method', 'GET'), status, error)
+        if delay is not None:
+            logging.warning('Retrying %s %s in %.3fs (%s)', kwargs.get('method', 'GET'), kwargs['url'],
+                            delay, error or 'HTTP {0}'.format(status))
+        return delay
+
+    def _discard_response(self, info, response):
+        # Ends an attempt that is going to be retried
+        if info is not None:
+            self._end_request(info, response, error=GandalfException(response, obj=self))
+        close = getattr(response, 'close', None)
+        if close is not None:
+            close()
+
+    def _check_breaker(self):
+        # Returns True when the server must be probed before the request
+        if self.breaker is None:
+            return False
+        state = self.breaker.before_call()
+        if state == OPEN:
+            raise CircuitOpenError(self.gandalf_server)
+        return state == HALF_OPEN
+
+    def _probed(self, healthy):
+        self.breaker.probed(healthy)
+        if not healthy:
+            raise CircuitOpenError(self.gandalf_server)
+
+    def _endpoint_probed(self, endpoint, healthy, tried):
+        self.pool.probed(endpoint, healthy)
+        if not healthy:
+            tried.append(endpoint)
+        return healthy
+
+    def _select_endpoint(self, kwargs, tried):
+        if self.pool is None:
+            return None
+        while True:
+            endpoint, probe = self.pool.pick(kwargs.get('method', 'GET'), tried)
+            if not probe or self._endpoint_probed(
+                    endpoint, self._probe(endpoint.url, self.pool.probe_timeout), tried):
+                return endpoint
+
+    def _endpoint_options(self, endpoint, kwargs):
+        if endpoint is None:
+            return kwargs
+        self.pool.started(endpoint)
+        return dict(kwargs, url=endpoint.url + kwargs['url'][len(self.gandalf_server):])
+
+    def _next_delay(self, retries, kwargs, endpoint, tried, status=None, error=None):
+        # Failed reads go to another replica right away, before retrying
+        if endpoint is not None and (status is None or status >= 500) and \
+                kwargs.get('streaming_callback') is None and \
+                self.pool.can_failover(kwargs.get('method', 'GET'), tried):
+            return 0
+        return self._retry_delay(retries, kwargs, status, error)
+
+    def _record_attempt(self, started, status=None, endpoint=None):
+        failed = status is None or status >= 500
+        if self.breaker is not None:
+            self.breaker.record(failed, time.time() - started)
+        if endpoint is not None:
+            self.pool.finished(endpoint, failed, time.time() - started)
+
+    def _request_limit(self, kwargs):
+        if self.limit is None:
+            return None
+        return self.limit.for_method(kwargs.get('method', 'GET'))
+
+    def _acquire(self, limit):
+        # Waits until the limit lets the request start, returns the seconds
+        # waited
+        if limit is None:
+            return None
+        started = time.time()
+        woken = threading.Event()
+        wait = limit.reserve(woken.set)
+        if wait == 0:
+            return 0
+        limit.enqueue()
+        try:
+            while wait != 0:
+                woken.wait(wait)
+                woken.clear()
+                wait = limit.reserve(woken.set)
+        finally:
+            limit.dequeue(time.time() - started)
+        return time.time() - started
+
+    def _release(self, limit):
+        if limit is not None:
+            limit.release()
+
+    def _coalesce_key(self, kwargs):
+        # Key of a request shared with identical concurrent ones, None if
+        # it can't be shared
+        if self.flights is None or kwargs.get('method', 'GET').upper() != 'GET' or \
+                kwargs.get('stream') or kwargs.get('streaming_callback') is not None:
+            return None
+        return kwargs['url']
+
+    def _hedged_route(self, kwargs):
+        # Name of the route of a request to hedge, None if it isn't hedged
+        if self.hedge is None or kwargs.get('streaming_callback') is not None or \
+                kwargs.get('method', 'GET').upper() != 'GET':
+            return None
+        route, params = match_route('GET', urlsplit(kwargs['url']).path)
+        if route is None or route.name not in self.hedge.routes:
+            return None
+        return route.name
+
+    def _cancel_attempt(self, info, started, endpoint, error):
+        # Ends an attempt given up because its hedged request won
+        if endpoint is not None:
+            self.pool.finished(endpoint, False, time.time() - started)
+        self._end_request(info, error=error)
+
+    def _probe(self, server, timeout):
+        try:
+            response = self.client(
+                url='{0}/healthcheck/'.format(server), method='GET', **self.timeout_options(timeout)
+            )
+        except Exception:
+            return False
+        return self.get_code(response) == 200
+
     def _request(self, *args, **kwargs):
+        key = self._coalesce_key(kwargs)
+        if key is None:
+            return self._send(args, kwargs, [])
+        return self.flights.call(key, functools.partial(self._send, args, kwargs, []))
+
+    def _request_parsed(self, url, parser):
+        # GETs url, feeding the body to parser while it's downloaded, and
+        # returns an iterator of what it parsed. The async transports hand
+        # the body to a callback that can't wait for the caller to consume
+        # the items, so they'd have to keep all of them.
+        if self.is_async:
+            raise TypeError('Asynchronous clients can\'t stream decoded responses, use the unstreamed method')
+        response = self._request(url=url, method="GET", **self.streaming_options(parser))
+        return then(response, decode, obj=self, process=process_future_as_parsed, parser=parser)
+
+    def _send(self, args, kwargs, tried):
+        retries = self.retry.begin() if self.retry is not None else None
+        while True:
+            if self._check_breaker():
+                self._probed(self._probe(self.gandalf_server, self.breaker.probe_timeout))
+            endpoint = self._select_endpoint(kwargs, tried)
+            tried.append(endpoint)
+            limit = self._request_limit(kwargs)
+            queued = self._acquire(limit)
+            attempt = self._endpoint_options(endpoint, kwargs)
+            info = self._start_request(attempt, queued)
+            started = time.time()
+            try:
+                response = self.client(*args, **self._attempt_options(retries, attempt))
+            except Exception as e:
+                self._record_attempt(started, endpoint=endpoint)
+                self._end_request(info, error=e)
+                delay = self._next_delay(retries, kwargs, endpoint, tried, error=e)
+                if delay is None:
+                    logging.error(str(e))
+                    self._failures.error = e
+                    return None
+            else:
+                self._record_attempt(started, self.get_code(response), endpoint)
+                delay = self._next_delay(retries, kwargs, endpoint, tried, status=self.get_code(response))
+                if delay is None:
+                    break
+                self._discard_response(info, response)
+            finally:
+                self._release(limit)
+            time.sleep(delay)
+
         try:
-            response = self.client(*args, **kwargs)
+            self._end_request(info, response)
             if self.get_code(response) != 200:
                 logging.warning(self.get_body(response))
             return response
         except Exception as e:
             logging.error(str(e))
+            self._end_request(info, error=e)
+            self._failures.error = e
             return None
 
     def get_code(self, response):
@@ -47,6 +398,23 @@ class GandalfClient(object):
     def get_body(self, response):
         return self.get_raw(response).decode('utf-8')
 
+    def get_header(self, response, name):
+        return response.headers.get(name)
+
+    def get_size(self, response, streamed=False):
+        # Streamed bodies were consumed while decoding, rely on the headers
+        if streamed:
+            length = self.get_header(response, 'Content-Length')
+            return int(length) if length is not None else None
+        return len(self.get_raw(response))
+
+    def get_timings(self, response):
+        # requests measures the time until the response headers were parsed
+        elapsed = getattr(response, 'elapsed', None)
+        if elapsed is None:
+            return {}
+        return {'ttfb': elapsed.total_seconds()}
+
     def get_content(self, response):
         try:
             body = self.get_body(response)
@@ -55,6 +423,82 @@ class GandalfClient(object):
 
         return body
 
+    def timeout_options(self, timeout):
+        # Transport options limiting a request to the given seconds
+        return {'timeout': timeout}
+
+    def streaming_options(self, fileobj):
+        # Transport options to stream a response body into fileobj
+        return {'stream': True}
+
+    def upload_options(self, encoder):
+        # Transport options to stream a MultipartEncoder as the request body
+        return {'data': encoder, 'headers': {'Content-Type': encoder.content_type}}
+
+    def iter_stream(self, response):
+        return response.iter_content(self.chunk_size)
+
+    def write_stream(self, response, fileobj):
+        for chunk in self.iter_stream(response):
+            fileobj.write(chunk)
+
+    def _resolved(self, value):
+        # Wraps a value computed without a request the same way this client
+        # returns request results. Async clients return a finished future.
+        return value
+
+    def _gather(self, results):
+        # Combines the results of several calls into one list, the same way
+        # this client returns request results
+        return list(results)
+
+    def _call(self, call):
+        method, args = call[0], call[1] if len(call) > 1 else ()
+        kwargs = call[2] if len(call) > 2 else {}
+        # Failed requests return None, report why instead of what decoding
+        # None raised
+        self._failures.error = None
+        try:
+            value = getattr(self, method)(*args, **kwargs)
+        except Exception as e:
+            return CallResult(call, None, self._failures.error or e)
+        if self._failures.error is not None:
+            return CallResult(call, None, self._failures.error)
+        return CallResult(call, value, None)
+
+    def map(self, calls, max_workers=10):
+        '''
+        Runs many client calls concurrently on a bounded thread pool. All calls
+        share this client's transport, so with the default
+        :class:`gandalf.session.PooledSession` they share one connection pool.
+
+        :param calls: calls to run
+        :type calls: iterable of ``(method_name, args)`` or ``(method_name, args, kwargs)`` tuples
+        :param max_workers: maximum number of calls running at the same time
+        :return: list of :class:`CallResult`, in the same order as ``calls``.
+                 A failing call doesn't abort the others.
+
+        Only available on the synchronous client, the asynchronous ones raise
+        ``TypeError``. Gather their futures instead.
+
+        Usage:
+
+        .. code-block:: python
+
+           results = gandalf.map([
+               ('user_new', ('rfloriano', {})),
+               ('repository_new', ('my-repo', ['rfloriano']), {'is_public': True}),
+           ], max_workers=20)
+           failed = [result for result in results if not result.ok]
+        '''
+        if self.is_async:
+            raise TypeError('Asynchronous clients run calls concurrently without map, gather them instead')
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        try:
+            return list(executor.map(self._call, calls))
+        finally:
+            executor.shutdown()
+
     @response_bool
     @may_async
     def repository_new(self, name, users, is_public=False):
@@ -109,6 +553,7 @@ class GandalfClient(object):
             method="GET",
         )
 
+    @cached_by_ref
     @response_json
     @may_async
     def repository_tree(self, name, path='', ref='master'):
@@ -147,6 +592,33 @@ class GandalfClient(object):
             method="GET",
         )
 
+    def repository_tree_stream(self, name, path='', ref='master'):
+        '''
+        Same as :meth:`repository_tree`, but decodes the entries while the
+        response is downloaded instead of decoding it as a whole, keeping
+        memory usage low for trees of any size.
+
+        :return: iterator of tree entries, yielded while the tree is still
+                 being downloaded
+
+        Only available on the synchronous client, the asynchronous ones raise
+        ``TypeError``.
+
+        Usage:
+
+        .. code-block:: python
+
+           for entry in gandalf.repository_tree_stream('my-repo', ref='0.1.0'):
+               print(entry['path'], entry['hash'])
+        '''
+        # router.Get("/repository/:name/tree", http.HandlerFunc(api.GetTree))
+        path = path.lstrip('/')
+        if path != '':
+            path = "&path=%s" % path
+        return self._request_parsed(
+            self._get_url('/repository/{0}/tree?ref={1}{2}'.format(name, ref, path)), JSONItemParser()
+        )
+
     @response_bool
     @may_async
     def repository_update(self, repo_name, **data):
@@ -179,13 +651,165 @@ class GandalfClient(object):
 
     @response_archive
     @may_async
-    def repository_archive(self, name, ref, format='zip', raw=False):
+    def repository_archive(self, name, ref, format='zip', raw=False, fileobj=None, stream=False):
+        '''
+        Downloads an archive of the repository at the given ref.
+
+        :param name: repository name
+        :param ref: tag, branch or commit
+        :param format: ``zip`` or ``tar``
+        :param raw: returns the archive file object instead of opening it
+        :param fileobj: writable and seekable file object the archive is streamed
+                        into, in chunks, instead of being buffered in memory
+        :param stream: streams the archive into a temporary file when no
+                       ``fileobj`` is given. Archives bigger than
+                       ``archive_spool_size`` are spooled to disk.
+        :return: ``zipfile.ZipFile`` or ``tarfile.TarFile``
+        '''
         # router.Get("/repository/:name/archive", http.HandlerFunc(api.GetArchive))
+        options = {}
+        if fileobj is not None:
+            options = self.streaming_options(fileobj)
         return self._request(
             url=self._get_url('/repository/{0}/archive?ref={1}&format={2}'.format(name, ref, format)),
             method="GET",
+            **options
+        )
+
+    def _archive_at(self, commit, name, format):
+        if self.archive_cache is None or not is_commit(commit):
+            return self.repository_archive(name, commit, format, stream=True)
+
+        if (name, commit, format) in self.archive_cache:
+            return self._resolved(self.archive_cache.open(name, commit, format))
+
+        fileobj = self.archive_cache.writer(name, commit, format)
+        discard = functools.partial(self.archive_cache.discard, fileobj)
+        try:
+            response = self.repository_archive(name, commit, format, raw=True, fileobj=fileobj)
+        except Exception:
+            discard()
+            raise
+        return then(
+            on_failure(response, discard), self.archive_cache.store, name=name, commit=commit, format=format
+        )
+
+    def repository_cached_archive(self, name, ref, format='zip'):
+        '''
+        Same as :meth:`repository_archive`, but downloads the archive of the
+        commit ``ref`` points to into the client's ``archive_cache`` and opens
+        it memory mapped. Later calls for the same commit don't download it
+        again.
+
+        Since the archive is requested by commit, its members are prefixed by
+        ``<name>-<commit>/`` instead of ``<name>-<ref>/``.
+
+        Usage:
+
+        .. code-block:: python
+
+           gandalf = GandalfClient("localhost", 8001, archive_cache=ArchiveCache('/var/cache/gandalf'))
+           archive = gandalf.repository_cached_archive('my-repo', 'master')
+        '''
+        return then(self.resolve_ref(name, ref), self._archive_at, name=name, format=format)
+
+    def _index_trees(self, trees):
+        return TreeIndex(entry for tree in trees for entry in tree)
+
+    def _tree_index_at(self, commit, name, paths):
+        return then(
+            self._gather([self.repository_tree(name, path, commit) for path in paths]),
+            self._index_trees
+        )
+
+    def repository_tree_index(self, name, ref='master', paths=None):
+        '''
+        Fetches the tree of the repository and returns a
+        :class:`gandalf.tree.TreeIndex` of it, answering ``ls``, ``glob`` and
+        ``stat`` queries without further requests.
+
+        :param name: repository name
+        :param ref: tag, branch or commit
+        :param paths: optional list of subtrees to index instead of the whole
+                      tree. They are fetched with one request each, made
+                      concurrently by the asynchronous clients, at the commit
+                      ``ref`` points to so they are consistent.
+
+        Usage:
+
+        .. code-block:: python
+
+           index = gandalf.repository_tree_index('my-repo', 'master', paths=['src', 'docs'])
+           sources = index.glob('src/**/*.py')
+        '''
+        if not paths:
+            return then(self.repository_tree(name, ref=ref), TreeIndex)
+        return then(self.resolve_ref(name, ref), self._tree_index_at, name=name, paths=paths)
+
+    def _diff_trees(self, trees):
+        return diff_trees(*trees)
+
+    def repository_tree_diff(self, name, ref_a, ref_b):
+        '''
+        Returns the files changed between two refs, computed locally from the
+        blob hashes of their trees instead of generating a textual diff like
+        :meth:`repository_diff_commits`. Trees are cached by commit when the
+        client has a ``ref_cache``.
+
+        :param name: repository name
+        :param ref_a: tag, branch or commit to compare from
+        :param ref_b: tag, branch or commit to compare to
+        :return: :class:`gandalf.tree.TreeDiff`
+
+        Usage:
+
+        .. code-block:: python
+
+           diff = gandalf.repository_tree_diff('my-repo', '0.1.0', 'master')
+           if any(path.startswith('src/') for path in diff.paths):
+               trigger_build()
+        '''
+        return then(
+            self._gather([self.repository_tree(name, ref=ref_a), self.repository_tree(name, ref=ref_b)]),
+            self._diff_trees
+        )
+
+    @response_tar_members
+    @may_async
+    def repository_archive_members(self, name, ref):
+        '''
+        Downloads a tar archive of the repository and yields its members while
+        the archive is still being downloaded, keeping memory usage constant
+        regardless of the archive size.
+
+        Only available on the synchronous client, with a transport supporting
+        ``stream=True`` such as ``requests``. The asynchronous clients raise
+        ``TypeError``.
+
+        :param name: repository name
+        :param ref: tag, branch or commit
+        :return: iterator of ``(tarfile.TarInfo, file object)`` tuples. The file
+                 object is ``None`` for directories and can only be read before
+                 moving on to the next member.
+
+        Usage:
+
+        .. code-block:: python
+
+           for member, fileobj in gandalf.repository_archive_members('my-repo', 'master'):
+               if member.name.endswith('.py'):
+                   index(member.name, fileobj.read())
+        '''
+        # router.Get("/repository/:name/archive", http.HandlerFunc(api.GetArchive))
+        if self.is_async:
+            raise TypeError('Asynchronous clients can\'t stream archive members')
+        return self._request(
+            url=self._get_url('/repository/{0}/archive?ref={1}&format=tar'.format(name, ref)),
+            method="GET",
+            stream=True,
         )
 
+    @cached_by_ref
     @response_raw
     @may_async
     def repository_contents(self, name, path, ref='master'):
@@ -195,6 +819,96 @@ class GandalfClient(object):
             method="GET",
         )
 
+    def _store_refs(self, tags, name, branches):
+        refs = dict((ref['name'], ref['ref']) for ref in branches)
+        # git looks tags up before branches, so tags win on name clashes
+        refs.update((ref['name'], ref['ref']) for ref in tags)
+        if self.ref_cache is not None:
+            self.ref_cache.set_refs(self.gandalf_server, name, refs)
+        return refs
+
+    def _fetch_tags(self, branches, name):
+        return then(self.repository_tags(name), self._store_refs, name=name, branches=branches)
+
+    def repository_refs(self, name):
+        '''
+        Returns a dict mapping every branch and tag of the repository to the
+        commit it points to. Refs are kept in the client's ``ref_cache``, if
+        any, for its ttl.
+
+        :param name: repository name
+        '''
+        if self.ref_cache is not None:
+            refs = self.ref_cache.get_refs(self.gandalf_server, name)
+            if refs is not None:
+                return self._resolved(refs)
+        return then(self.repository_branches(name), self._fetch_tags, name=name)
+
+    def resolve_ref(self, name, ref):
+        '''
+        Returns the commit a branch or tag points to. Commit hashes are returned
+        as is and unknown refs (e.g. ``HEAD``) are returned unchanged.
+
+        :param name: repository name
+        :param ref: branch, tag or commit
+        '''
+        if is_commit(ref):
+            return self._resolved(ref)
+        return then(self.repository_refs(name), lambda refs: refs.get(ref, ref))
+
+    def _cache_blob(self, content, blob_hash):
+        raw = content.encode('utf-8') if isinstance(content, str) else content
+        self.blob_cache.set(blob_hash, raw)
+        return content
+
+    def repository_contents_by_hash(self, name, blob_hash, path, ref='master'):
+        '''
+        Returns the contents of a blob, reading it from the client's blob cache
+        when it was already fetched from any path or ref of any repository.
+
+        :param name: repository name
+        :param blob_hash: git hash of the blob, as returned by :meth:`repository_tree`
+        :param path: path of the blob in the given ref, used to fetch it on a cache miss
+        :param ref: ref in which ``path`` has the given blob
+        :return: The same as :meth:`repository_contents`
+        '''
+        if self.blob_cache is None:
+            return self.repository_contents(name, path, ref)
+
+        content = self.blob_cache.get(blob_hash)
+        if content is not None:
+            return self._resolved(decode_content(content))
+
+        return then(
+            self.repository_contents(name, path, ref),
+            self._cache_blob, blob_hash=blob_hash
+        )
+
+    def _contents_from_tree(self, tree, name, path, ref):
+        for entry in tree:
+            if entry['path'] == path and entry['filetype'] == 'blob':
+                return self.repository_contents_by_hash(name, entry['hash'], path, ref)
+        return self.repository_contents(name, path, ref)
+
+    def repository_cached_contents(self, name, path, ref='master'):
+        '''
+        Same as :meth:`repository_contents`, but looks up the blob hash of
+        ``path`` with :meth:`repository_tree` first, so unchanged files are
+        served from the blob cache even after ``ref`` moves.
+
+        Usage:
+
+        .. code-block:: python
+
+           gandalf = GandalfClient("localhost", 8001, blob_cache=BlobCache(256 * 1024 * 1024))
+           gandalf.repository_cached_contents('my-repo', 'README', 'master')
+        '''
+        path = path.lstrip('/')
+        return then(
+            self.repository_tree(name, path, ref),
+            self._contents_from_tree, name=name, path=path, ref=ref
+        )
+
     @response_bool
     @may_async
     def repository_delete(self, name):
@@ -222,6 +936,24 @@ class GandalfClient(object):
             method="GET",
         )
 
+    def repository_branches_stream(self, name):
+        '''
+        Same as :meth:`repository_branches`, but decodes the branches while the
+        response is downloaded. Only available on the synchronous client.
+
+        :return: iterator of branches
+        '''
+        return self._request_parsed(self._get_url('/repository/{0}/branches'.format(name)), JSONItemParser())
+
+    def repository_tags_stream(self, name):
+        '''
+        Same as :meth:`repository_tags`, but decodes the tags while the response
+        is downloaded. Only available on the synchronous client.
+
+        :return: iterator of tags
+        '''
+        return self._request_parsed(self._get_url('/repository/{0}/tags'.format(name)), JSONItemParser())
+
     @response_raw
     @may_async
     def repository_diff_commits(self, name, previous_commit, last_commit):
@@ -232,14 +964,50 @@ class GandalfClient(object):
             method="GET"
         )
 
+    def repository_diff_files(self, name, previous_commit, last_commit):
+        '''
+        Same as :meth:`repository_diff_commits`, but parses the diff while it's
+        downloaded instead of returning it as one string, keeping memory usage
+        bounded regardless of the diff size.
+
+        :return: iterator of :class:`gandalf.diff.FileDiff`, with the paths,
+                 modes, hunk headers and line stats of each changed file,
+                 yielded while the diff is still being downloaded
+
+        Only available on the synchronous client, the asynchronous ones raise
+        ``TypeError``.
+
+        Usage:
+
+        .. code-block:: python
+
+           for file_diff in gandalf.repository_diff_files('my-repo', '0.1.0', 'master'):
+               print('{0} +{1} -{2}'.format(file_diff.path, file_diff.added, file_diff.removed))
+        '''
+        # router.Get("/repository/:name/diff/commits", http.HandlerFunc(api.GetDiff))
+        return self._request_parsed(
+            self._get_url('/repository/{0}/diff/commits?previous_commit={1}&last_commit={2}'
+                          .format(name, previous_commit, last_commit)),
+            DiffParser()
+        )
+
     @response_json
     @may_async
     def repository_commit(self, name, message, author_name, author_email, committer_name, committer_email, branch, files):
+        '''
+        Commits the contents of a zip file to a branch of the repository.
+
+        :param files: zip file contents, as bytes, a file object or an iterator
+                      of byte chunks. File objects and iterators are streamed
+                      to the server in chunks. A dict of paths to contents is
+                      zipped on the fly with :func:`gandalf.streams.iter_zip`.
+        '''
+        if isinstance(files, dict):
+            files = iter_zip(files, self.chunk_size)
+
         # router.Post("/repository/:name/commit", http.HandlerFunc(api.Commit))
-        return self._request(
-            url=self._get_url('/repository/{0}/commit'.format(name)),
-            method="POST",
-            data={
+        encoder = MultipartEncoder(
+            fields={
                 "message": message,
                 "author-name": author_name,
                 "author-email": author_email,
@@ -248,8 +1016,15 @@ class GandalfClient(object):
                 "branch": branch,
             },
             files={"zipfile": files},
+            chunk_size=self.chunk_size,
+        )
+        return self._request(
+            url=self._get_url('/repository/{0}/commit'.format(name)),
+            method="POST",
+            **self.upload_options(encoder)
         )
 
+    @cached_by_ref
     @response_json
     @may_async
     def repository_log(self, name, ref, total, path=''):
@@ -259,6 +1034,43 @@ class GandalfClient(object):
             method="GET",
         )
 
+    def repository_log_stream(self, name, ref, total, path=''):
+        '''
+        Same as :meth:`repository_log`, but decodes the commits while the
+        response is downloaded and returns them instead of the whole log. Only
+        available on the synchronous client. See :meth:`repository_history` to
+        page through the history, also with the asynchronous clients.
+
+        :return: iterator of commits
+        '''
+        return self._request_parsed(
+            self._get_url('/repository/{0}/logs?ref={1}&total={2}&path={3}'.format(name, ref, total, path)),
+            JSONItemParser(key='commits')
+        )
+
+    def repository_history(self, name, ref='master', path='', page_size=10, max_page_size=1000):
+        '''
+        Lazily iterates over the commits of the repository, newest first,
+        paging through :meth:`repository_log` in requests that double from
+        ``page_size`` up to ``max_page_size`` commits. Pages are only fetched
+        while the iteration goes on, so breaking out early saves the rest of
+        the history from being requested and memory usage stays bounded by one
+        page regardless of the repository age.
+
+        :return: :class:`gandalf.log.LogIterator`, iterated with ``for`` on the
+                 synchronous client and with ``async for`` on the asynchronous
+                 ones
+
+        Usage:
+
+        .. code-block:: python
+
+           for commit in gandalf.repository_history('my-repo', path='setup.py'):
+               if commit['subject'].startswith('Release'):
+                   break
+        '''
+        return LogIterator(self, name, ref, path, page_size, max_page_size)
+
     @response_bool
     @may_async
     def user_add_key(self, name, keys):
@@ -331,7 +1143,7 @@ class GandalfClient(object):
         if repositories is None:
             repositories = []
 
-        if isinstance(repositories, string_types):
+        if isinstance(repositories, str):
             repositories = [repositories]
 
         return self._request(
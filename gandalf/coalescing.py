@@ -0,0 +1,60 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import functools
+import threading
+from concurrent.futures import Future
+
+
+class SingleFlight(object):
+    '''
+    Shares one call among the concurrent callers asking for the same key:
+    while a call is in flight, callers with the same key wait for it and get
+    its outcome instead of making their own.
+    '''
+
+    def __init__(self):
+        self.flights = {}
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.flights)
+
+    def call(self, key, function):
+        '''
+        Returns the result of ``function()``, or of the call with the same key
+        already running in another thread.
+        '''
+        with self.lock:
+            flight = self.flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.flights[key] = Future()
+        if not leader:
+            return flight.result()
+
+        try:
+            flight.set_result(function())
+        except BaseException as e:
+            flight.set_exception(e)
+        finally:
+            with self.lock:
+                del self.flights[key]
+        return flight.result()
+
+    def share(self, key, start):
+        '''
+        Returns the future of the call with the same key in flight, or the
+        future returned by ``start()``. Meant for calls made from an event
+        loop.
+        '''
+        with self.lock:
+            flight = self.flights.get(key)
+            if flight is None:
+                flight = self.flights[key] = start()
+                flight.add_done_callback(functools.partial(self._landed, key))
+            return flight
+
+    def _landed(self, key, flight):
+        with self.lock:
+            if self.flights.get(key) is flight:
+                del self.flights[key]
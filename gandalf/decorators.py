@@ -1,22 +1,22 @@
 #!/usr/bin/python
 # -*- coding: utf-8 -*-
+import asyncio
+import inspect
 import tarfile
-import zipfile
+import tempfile
+import time
+from functools import wraps
+from io import BytesIO
 
 from gandalf import GandalfException
+from gandalf.cache import is_commit
+from gandalf.streams import open_archive, open_stream
 
 try:
     import ujson as json
 except ImportError:
     import json
 
-try:
-    from StringIO import StringIO
-    IO = StringIO
-except ImportError:
-    from io import BytesIO
-    IO = BytesIO
-
 try:
     from tornado.gen import coroutine
     from tornado.gen import Return
@@ -35,10 +35,101 @@ except ImportError:
 def run_future(future, cb=None, **kwargs):
     result = yield future
     if cb:
-        raise Return(cb(result, **kwargs))
+        result = cb(result, **kwargs)
+        if is_future(result):
+            result = yield result
     raise Return(result)
 
 
+def is_awaitable(value):
+    return asyncio.iscoroutine(value) or isinstance(value, asyncio.Future)
+
+
+# The event loop only keeps weak references to tasks, hold the ones started by
+# run_awaitable until they finish or they may be garbage collected mid request
+_running = set()
+
+
+def _ensure_task(awaitable):
+    task = asyncio.ensure_future(awaitable)
+    _running.add(task)
+    task.add_done_callback(_running.discard)
+    return task
+
+
+def run_awaitable(awaitable, cb=None, **kwargs):
+    future = _ensure_task(awaitable)
+    result = future.get_loop().create_future()
+
+    def forward(future):
+        if result.done():
+            return
+        if future.cancelled():
+            result.cancel()
+        elif future.exception() is not None:
+            result.set_exception(future.exception())
+        else:
+            result.set_result(future.result())
+
+    def done(future):
+        if result.done():
+            return
+        if future.cancelled():
+            result.cancel()
+            return
+        try:
+            value = future.result()
+            if cb:
+                value = cb(value, **kwargs)
+        except Exception as e:
+            result.set_exception(e)
+            return
+        if is_awaitable(value):
+            # Callbacks may chain another request, wait for it as well
+            _ensure_task(value).add_done_callback(forward)
+        else:
+            result.set_result(value)
+
+    def cancel(result):
+        # Callers giving up, e.g. through asyncio.wait_for, stop the request
+        if result.cancelled():
+            future.cancel()
+
+    future.add_done_callback(done)
+    result.add_done_callback(cancel)
+    return result
+
+
+def then(response, cb=None, **kwargs):
+    if is_awaitable(response):
+        return run_awaitable(response, cb, **kwargs)
+    if is_future(response):
+        return run_future(response, cb, **kwargs)
+    if cb:
+        return cb(response, **kwargs)
+    return response
+
+
+def on_failure(response, errback):
+    '''
+    Calls ``errback`` without arguments once an asynchronous response fails
+    or is cancelled, e.g. to clean up after it. The response is returned
+    unchanged, so callers still get its outcome. Synchronous clients raise
+    before there's a response to pass, so they must catch errors themselves.
+    '''
+    if is_awaitable(response):
+        response = _ensure_task(response)
+    elif not is_future(response):
+        return response
+
+    def done(future):
+        if future.cancelled() or future.exception() is not None:
+            errback()
+
+    response.add_done_callback(done)
+    return response
+
+
 def _check_for_error(response, obj):
     code = obj.get_code(response)
 
@@ -69,34 +160,85 @@ def process_future_as_raw(response, obj):
     return body
 
 
-def process_future_as_archive(response, obj, format, raw):
+def process_future_as_archive(response, obj, format, raw, fileobj=None):
     code = obj.get_code(response)
 
     if code != 200:
         raise GandalfException(response=response, obj=obj)
 
-    archive = None
-    content = IO(obj.get_raw(response))
+    if fileobj is None:
+        content = BytesIO(obj.get_raw(response))
+    else:
+        obj.write_stream(response, fileobj)
+        fileobj.seek(0)
+        content = fileobj
 
     if raw:
         return content
 
-    if format == 'tar':
-        archive = tarfile.TarFile(fileobj=content)
-    elif format == 'zip':
-        archive = zipfile.ZipFile(content)
+    return open_archive(content, format)
+
 
-    return archive
+def iter_tar_members(response, obj):
+    try:
+        with tarfile.open(fileobj=open_stream(obj.iter_stream(response)), mode='r|*') as tar:
+            for member in tar:
+                yield member, tar.extractfile(member)
+    finally:
+        response.close()
+
+
+def process_future_as_tar_members(response, obj):
+    if obj.get_code(response) != 200:
+        raise GandalfException(response=response, obj=obj)
+    return iter_tar_members(response, obj)
+
+
+def iter_parsed(response, obj, parser):
+    # Parsers have feed, write and close methods, see gandalf.diff.DiffParser
+    # and gandalf.streams.JSONItemParser
+    try:
+        for chunk in obj.iter_stream(response):
+            for item in parser.feed(chunk):
+                yield item
+        for item in parser.close():
+            yield item
+    finally:
+        close = getattr(response, 'close', None)
+        if close is not None:
+            close()
+
+
+def process_future_as_parsed(response, obj, parser):
+    if obj.get_code(response) != 200:
+        raise GandalfException(response=response, obj=obj)
+    return iter_parsed(response, obj, parser)
+
+
+def decode(response, obj, process, **kwargs):
+    '''
+    Runs ``process`` on the response, timing it for the client's observers.
+    '''
+    if not obj.observers:
+        return process(response, obj, **kwargs)
+
+    started = time.time()
+    try:
+        result = process(response, obj, **kwargs)
+    except Exception as e:
+        obj._finish_request(response, time.time() - started, e)
+        raise
+    obj._finish_request(response, time.time() - started)
+    return result
 
 
 def response_bool(func=None, text=''):
     def _response_bool(func):
+        @wraps(func)
         def wrap(*args, **kwargs):
             obj = args[0]
             response = func(*args, **kwargs)
-            if is_future(response):
-                return run_future(response, process_future_as_bool, obj=obj, text=text)
-            return process_future_as_bool(response, obj, text=text)
+            return then(response, decode, obj=obj, process=process_future_as_bool, text=text)
         return wrap
 
     if func is not None:
@@ -110,45 +252,94 @@ def response_bool(func=None, text=''):
 
 
 def response_json(f):
+    @wraps(f)
     def wrap(*args, **kwargs):
         obj = args[0]
         response = f(*args, **kwargs)
-        if is_future(response):
-            return run_future(response, process_future_as_json, obj=obj)
-        return process_future_as_json(response, obj)
+        return then(response, decode, obj=obj, process=process_future_as_json)
     return wrap
 
 
 def response_raw(f):
+    @wraps(f)
     def wrap(*args, **kwargs):
         obj = args[0]
         response = f(*args, **kwargs)
-        if is_future(response):
-            return run_future(response, process_future_as_raw, obj=obj)
-        return process_future_as_raw(response, obj)
+        return then(response, decode, obj=obj, process=process_future_as_raw)
     return wrap
 
 
 def response_archive(f):
+    @wraps(f)
+    def wrap(*args, **kwargs):
+        obj = args[0]
+        callargs = get_callargs(f, args, kwargs)
+        del callargs['self']
+        if callargs['stream'] and callargs['fileobj'] is None:
+            # Keep small archives in memory, spool big ones to disk
+            callargs['fileobj'] = tempfile.SpooledTemporaryFile(max_size=obj.archive_spool_size)
+        response = f(obj, **callargs)
+        return then(
+            response, decode, obj=obj, process=process_future_as_archive,
+            format=callargs['format'], raw=callargs['raw'], fileobj=callargs['fileobj']
+        )
+    return wrap
+
+
+def response_tar_members(f):
+    @wraps(f)
     def wrap(*args, **kwargs):
         obj = args[0]
-        format = kwargs.get('format')
-        raw = kwargs.get('raw')
-        if not format and len(args) == 4:
-            format = args[3]
-        else:
-            format = 'zip'
         response = f(*args, **kwargs)
-        if is_future(response):
-            return run_future(response, process_future_as_archive, obj=obj, format=format, raw=raw)
-        return process_future_as_archive(response, obj, format, raw)
+        return then(response, decode, obj=obj, process=process_future_as_tar_members)
     return wrap
 
 
 def may_async(f):
+    @wraps(f)
     def wrap(*args, **kwargs):
-        response = f(*args, **kwargs)
-        if is_future(response):
-            response = run_future(response)
-        return response
+        return then(f(*args, **kwargs))
+    return wrap
+
+
+def get_callargs(f, args, kwargs):
+    while hasattr(f, '__wrapped__'):
+        f = f.__wrapped__
+    return inspect.getcallargs(f, *args, **kwargs)
+
+
+def _store_read(result, obj, key):
+    obj.ref_cache.set_result(key, result)
+    return result
+
+
+def _read_at(commit, f, obj, callargs):
+    callargs = dict(callargs, ref=commit)
+    if not is_commit(commit):
+        # Not a branch, tag nor commit hash (e.g. HEAD), can't be cached
+        return f(obj, **callargs)
+
+    key = (obj.gandalf_server, f.__name__) + tuple(sorted(callargs.items()))
+    result = obj.ref_cache.get_result(key)
+    if result is not None:
+        return obj._resolved(result)
+    return then(f(obj, **callargs), _store_read, obj=obj, key=key)
+
+
+def cached_by_ref(f):
+    '''
+    Resolves the ``ref`` argument to a commit with the client's ``ref_cache``
+    and caches the result of the call by that commit.
+    '''
+    @wraps(f)
+    def wrap(*args, **kwargs):
+        obj = args[0]
+        if obj.ref_cache is None:
+            return f(*args, **kwargs)
+        callargs = get_callargs(f, args, kwargs)
+        del callargs['self']
+        return then(
+            obj.resolve_ref(callargs['name'], callargs['ref']),
+            _read_at, f=f, obj=obj, callargs=callargs
+        )
     return wrap
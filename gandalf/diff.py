@@ -0,0 +1,223 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import re
+
+ADDED = 'added'
+DELETED = 'deleted'
+MODIFIED = 'modified'
+RENAMED = 'renamed'
+
+HUNK_HEADER = re.compile(r'^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@')
+
+
+def strip_prefix(path, prefix):
+    if path == '/dev/null':
+        return None
+    return path[len(prefix):] if path.startswith(prefix) else path
+
+
+class Hunk(object):
+    '''
+    A hunk of a :class:`FileDiff`: its ``@@`` header, the line ranges it
+    covers and how many lines it adds and removes. The lines themselves
+    aren't kept.
+    '''
+
+    __slots__ = ('header', 'old_start', 'old_count', 'new_start', 'new_count', 'added', 'removed')
+
+    def __init__(self, header, old_start, old_count, new_start, new_count):
+        self.header = header
+        self.old_start = old_start
+        self.old_count = old_count
+        self.new_start = new_start
+        self.new_count = new_count
+        self.added = 0
+        self.removed = 0
+
+    def __repr__(self):
+        return '<Hunk {0}>'.format(self.header)
+
+
+class FileDiff(object):
+    '''
+    Changes to one file in a git diff, as parsed by :class:`DiffParser`.
+
+    :ivar old_path: path before the change, ``None`` for added files
+    :ivar new_path: path after the change, ``None`` for deleted files
+    :ivar status: :data:`ADDED`, :data:`DELETED`, :data:`MODIFIED` or
+                  :data:`RENAMED`
+    :ivar old_mode: file mode before the change, when known
+    :ivar new_mode: file mode after the change, when known
+    :ivar old_hash: abbreviated blob hash before the change, when known
+    :ivar new_hash: abbreviated blob hash after the change, when known
+    :ivar binary: whether git reported the file as binary
+    :ivar hunks: list of :class:`Hunk`
+    :ivar added: lines added
+    :ivar removed: lines removed
+    '''
+
+    __slots__ = (
+        'old_path', 'new_path', 'status', 'old_mode', 'new_mode', 'old_hash', 'new_hash',
+        'binary', 'hunks', 'added', 'removed',
+    )
+
+    def __init__(self, old_path, new_path):
+        self.old_path = old_path
+        self.new_path = new_path
+        self.status = MODIFIED
+        self.old_mode = None
+        self.new_mode = None
+        self.old_hash = None
+        self.new_hash = None
+        self.binary = False
+        self.hunks = []
+        self.added = 0
+        self.removed = 0
+
+    @property
+    def path(self):
+        return self.new_path if self.new_path is not None else self.old_path
+
+    def __repr__(self):
+        return '<FileDiff {0} {1} +{2} -{3}>'.format(self.status, self.path, self.added, self.removed)
+
+
+def split_git_paths(paths):
+    # "a/<path> b/<path>" is ambiguous when paths have spaces, but both
+    # paths are the same unless the file was renamed, which git reports on
+    # its own lines
+    half = (len(paths) - 1) // 2
+    if len(paths) % 2 and paths[half] == ' ' and paths[2:half] == paths[half + 3:]:
+        return paths[2:half], paths[half + 3:]
+    old, _, new = paths.partition(' b/')
+    return strip_prefix(old, 'a/'), new
+
+
+class DiffParser(object):
+    '''
+    Incremental parser of the git diffs returned by
+    :meth:`gandalf.client.GandalfClient.repository_diff_commits`. It's fed
+    chunks of the diff as they arrive and returns each :class:`FileDiff` once
+    it's complete, keeping only the current line and file in memory, so
+    diffs of any size are parsed with bounded memory.
+
+    Usage:
+
+    .. code-block:: python
+
+       parser = DiffParser()
+       for chunk in chunks:
+           for file_diff in parser.feed(chunk):
+               print(file_diff.path, file_diff.added, file_diff.removed)
+       for file_diff in parser.close():
+           print(file_diff.path, file_diff.added, file_diff.removed)
+    '''
+
+    def __init__(self, encoding='utf-8'):
+        self.encoding = encoding
+        self.buffer = b''
+        self.current = None
+        self.hunk = None
+        self.old_left = 0
+        self.new_left = 0
+        # Files parsed from chunks passed to write
+        self.pending = []
+
+    def feed(self, chunk):
+        '''
+        Parses a chunk of the diff and returns the files completed by it.
+        '''
+        if not isinstance(chunk, bytes):
+            chunk = chunk.encode(self.encoding)
+        lines = (self.buffer + chunk).split(b'\n')
+        self.buffer = lines.pop()
+        done = []
+        for line in lines:
+            self._parse(line.decode(self.encoding, 'replace'), done)
+        return done
+
+    def write(self, chunk):
+        '''
+        Same as :meth:`feed`, keeping the completed files in ``pending``. It
+        lets the parser be used as a file object, e.g. as the streaming
+        callback of a transport.
+        '''
+        self.pending.extend(self.feed(chunk))
+
+    def close(self):
+        '''
+        Parses the rest of the diff and returns the last files.
+        '''
+        done = []
+        if self.buffer:
+            self._parse(self.buffer.decode(self.encoding, 'replace'), done)
+            self.buffer = b''
+        if self.current is not None:
+            done.append(self.current)
+            self.current = None
+        return done
+
+    def _parse(self, line, done):
+        if self.old_left > 0 or self.new_left > 0:
+            return self._parse_hunk_line(line)
+
+        if line.startswith('diff --git '):
+            if self.current is not None:
+                done.append(self.current)
+            self.current = FileDiff(*split_git_paths(line[len('diff --git '):]))
+            return
+
+        current = self.current
+        if current is None:
+            return
+        if line.startswith('@@'):
+            match = HUNK_HEADER.match(line)
+            if match:
+                old_start, old_count, new_start, new_count = match.groups()
+                self.hunk = Hunk(
+                    line, int(old_start), int(old_count or 1), int(new_start), int(new_count or 1)
+                )
+                current.hunks.append(self.hunk)
+                self.old_left, self.new_left = self.hunk.old_count, self.hunk.new_count
+        elif line.startswith('--- '):
+            current.old_path = strip_prefix(line[4:].rstrip('\t'), 'a/')
+        elif line.startswith('+++ '):
+            current.new_path = strip_prefix(line[4:].rstrip('\t'), 'b/')
+        elif line.startswith('new file mode '):
+            current.status, current.old_path = ADDED, None
+            current.new_mode = line[len('new file mode '):]
+        elif line.startswith('deleted file mode '):
+            current.status, current.new_path = DELETED, None
+            current.old_mode = line[len('deleted file mode '):]
+        elif line.startswith('old mode '):
+            current.old_mode = line[len('old mode '):]
+        elif line.startswith('new mode '):
+            current.new_mode = line[len('new mode '):]
+        elif line.startswith('rename from '):
+            current.status, current.old_path = RENAMED, line[len('rename from '):]
+        elif line.startswith('rename to '):
+            current.new_path = line[len('rename to '):]
+        elif line.startswith('index '):
+            hashes, _, mode = line[len('index '):].partition(' ')
+            current.old_hash, _, current.new_hash = hashes.partition('..')
+            if mode:
+                current.old_mode = current.new_mode = mode
+        elif line.startswith('Binary files ') or line == 'GIT binary patch':
+            current.binary = True
+
+    def _parse_hunk_line(self, line):
+        marker = line[:1]
+        if marker == '+':
+            self.new_left -= 1
+            self.hunk.added += 1
+            self.current.added += 1
+        elif marker == '-':
+            self.old_left -= 1
+            self.hunk.removed += 1
+            self.current.removed += 1
+        elif marker == '\\':
+            # "\ No newline at end of file"
+            pass
+        else:
+            self.old_left -= 1
+            self.new_left -= 1
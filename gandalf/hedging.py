@@ -0,0 +1,70 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import threading
+from collections import deque
+
+from gandalf.retry import RetryBudget
+
+
+class HedgePolicy(object):
+    '''
+    Sends a second, hedged, request when a read takes longer than most recent
+    reads of the same route, and keeps whichever response comes first. It
+    trims the latency tail caused by occasional slow responses at the cost of
+    a few extra requests. With a :class:`gandalf.pool.ServerPool` the hedged
+    request goes to another server.
+
+    Only the asynchronous clients hedge requests. Streamed downloads are never
+    hedged.
+
+    :param routes: names of the client methods whose requests are hedged
+    :param percentile: requests are hedged once they took longer than this
+                       percentile of the recent latencies of their route
+    :param delay: seconds before hedging while fewer than ``min_samples``
+                  latencies of the route are known
+    :param min_samples: latencies needed before using the percentile
+    :param window: number of recent latencies kept per route
+    :param budget: :class:`gandalf.retry.RetryBudget` limiting hedged requests
+                   to a share of the requests, 5% by default
+
+    Usage:
+
+    .. code-block:: python
+
+       gandalf = AsyncioGandalfClient('localhost', 8001, hedge=HedgePolicy(percentile=90))
+    '''
+
+    def __init__(self, routes=('repository_contents', 'repository_tree'), percentile=95, delay=0.1,
+                 min_samples=20, window=500, budget=None):
+        self.routes = routes
+        self.percentile = percentile
+        self.default_delay = delay
+        self.min_samples = min_samples
+        self.window = window
+        self.budget = budget if budget is not None else RetryBudget(ratio=0.05, min_tokens=5)
+        self.latencies = {}
+        self.lock = threading.Lock()
+
+    def delay(self, name):
+        '''
+        Returns the seconds after which a new request of the given route is
+        hedged.
+        '''
+        self.budget.deposit()
+        with self.lock:
+            latencies = sorted(self.latencies.get(name, ()))
+        if len(latencies) < self.min_samples:
+            return self.default_delay
+        return latencies[min(len(latencies) - 1, int(len(latencies) * self.percentile / 100.0))]
+
+    def allow(self):
+        '''
+        Returns whether the budget allows another hedged request.
+        '''
+        return self.budget.withdraw()
+
+    def record(self, name, duration):
+        with self.lock:
+            if name not in self.latencies:
+                self.latencies[name] = deque(maxlen=self.window)
+            self.latencies[name].append(duration)
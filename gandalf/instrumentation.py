@@ -0,0 +1,104 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import logging
+import time
+
+from urllib.parse import urlsplit
+
+from gandalf.routes import match_route
+
+
+class RequestInfo(object):
+    '''
+    Describes one request made by a client. It's passed to the observers of
+    the client, see :class:`RequestObserver`.
+
+    :ivar name: client method calling the route, e.g. ``repository_tree``
+    :ivar route: route template, e.g. ``/repository/:name/tree``
+    :ivar http_method: HTTP method
+    :ivar url: requested url
+    :ivar status: HTTP status code, ``None`` when no response was received
+    :ivar bytes_sent: size of the request body, ``None`` when unknown
+    :ivar bytes_received: size of the response body, ``None`` when unknown
+    :ivar error: exception raised by the transport or while decoding the
+                 response, if any
+    :ivar timings: seconds spent on each phase of the request: ``queue``
+                   (waiting for the limit of the client, see
+                   :class:`gandalf.limits.Limit`), ``dns``, ``connect``,
+                   ``ttfb`` (until the response headers), ``total`` (until
+                   the transport returned) and ``decode`` (parsing the
+                   response in the client). Phases the transport doesn't
+                   report are missing.
+    '''
+
+    def __init__(self, http_method, url, bytes_sent=None, streamed=False):
+        route, params = match_route(http_method, urlsplit(url).path)
+        self.name = route.name if route else None
+        self.route = route.template if route else None
+        self.http_method = http_method
+        self.url = url
+        self.status = None
+        self.bytes_sent = bytes_sent
+        self.bytes_received = None
+        self.error = None
+        self.timings = {}
+        self.streamed = streamed
+        self.started_at = time.time()
+
+    def __repr__(self):
+        return '<RequestInfo {0} {1} {2}>'.format(self.http_method, self.route or self.url, self.status)
+
+
+class RequestObserver(object):
+    '''
+    Base class for request observers, added to a client with the
+    ``observers`` argument or :meth:`gandalf.client.GandalfClient.add_observer`.
+    Observers are called from the thread or event loop making the request, so
+    they should be quick. Errors raised by observers are logged and ignored.
+
+    Usage:
+
+    .. code-block:: python
+
+       class SlowRequests(RequestObserver):
+           def request_finished(self, info):
+               if info.timings['total'] > 1:
+                   logging.warning('%s took %.2fs', info.route, info.timings['total'])
+
+       gandalf = GandalfClient('localhost', 8001, observers=[SlowRequests()])
+    '''
+
+    def request_started(self, info):
+        pass
+
+    def request_finished(self, info):
+        '''
+        Called once the response was decoded, or the request failed.
+        '''
+        pass
+
+
+def request_size(kwargs):
+    '''
+    Size of the body sent with the given transport arguments, ``None`` when
+    it's streamed with an unknown length.
+    '''
+    data = kwargs.get('data', kwargs.get('body'))
+    if data is None:
+        length = (kwargs.get('headers') or {}).get('Content-Length')
+        if length is not None:
+            return int(length)
+        return None if 'body_producer' in kwargs else 0
+    if isinstance(data, str):
+        return len(data.encode('utf-8'))
+    if isinstance(data, bytes):
+        return len(data)
+    return getattr(data, 'len', None)
+
+
+def notify(observers, event, info):
+    for observer in observers:
+        try:
+            getattr(observer, event)(info)
+        except Exception:
+            logging.exception('Request observer %r failed', observer)
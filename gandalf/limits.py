@@ -0,0 +1,114 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import threading
+import time
+
+READ_METHODS = ('GET', 'HEAD')
+
+
+class Limit(object):
+    '''
+    Bounds the requests a client has in flight and the rate it starts them
+    at, so bulk jobs don't overwhelm the gandalf server. Requests over the
+    limit wait in the client until they may start.
+
+    The rate is enforced with a token bucket holding up to ``burst`` tokens,
+    refilled with ``rate`` tokens per second. Every request takes one.
+
+    :param max_in_flight: maximum number of requests waiting for a response,
+                          ``None`` for no maximum
+    :param rate: requests started per second, ``None`` for no limit
+    :param burst: requests that may be started at once after an idle period,
+                  ``rate`` by default
+
+    :ivar in_flight: requests waiting for a response
+    :ivar queued: requests waiting for the limit
+    :ivar throttled: total number of requests that had to wait
+    :ivar queue_time: total seconds requests waited
+
+    Usage:
+
+    .. code-block:: python
+
+       gandalf = AsyncTornadoGandalfClient('localhost', 8001, limit=Limit(max_in_flight=20, rate=100))
+    '''
+
+    def __init__(self, max_in_flight=None, rate=None, burst=None, clock=time.time):
+        self.max_in_flight = max_in_flight
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1, rate or 0)
+        self.clock = clock
+        self.tokens = self.burst
+        self.updated = clock()
+        self.in_flight = 0
+        self.queued = 0
+        self.throttled = 0
+        self.queue_time = 0
+        self.waiters = []
+        self.lock = threading.Lock()
+
+    def for_method(self, method):
+        return self
+
+    def reserve(self, wake):
+        '''
+        Takes a slot for a new request. Returns 0 when the request may start,
+        the seconds to wait for a token before calling again, or ``None``
+        when ``max_in_flight`` requests are running, in which case ``wake``
+        is called once one of them is released.
+        '''
+        with self.lock:
+            if self.max_in_flight is not None and self.in_flight >= self.max_in_flight:
+                self.waiters.append(wake)
+                return None
+            if self.rate is not None:
+                now = self.clock()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens < 1:
+                    return (1 - self.tokens) / float(self.rate)
+                self.tokens -= 1
+            self.in_flight += 1
+            return 0
+
+    def release(self):
+        with self.lock:
+            self.in_flight -= 1
+            waiters, self.waiters = self.waiters, []
+        # Every waiter tries again, those finding no slot wait some more
+        for wake in waiters:
+            wake()
+
+    def enqueue(self):
+        with self.lock:
+            self.queued += 1
+            self.throttled += 1
+
+    def dequeue(self, waited):
+        with self.lock:
+            self.queued -= 1
+            self.queue_time += waited
+
+
+class MethodLimits(object):
+    '''
+    Separate limits for reads (GET and HEAD requests) and writes, e.g. to
+    allow many concurrent reads but only a few writes at a time.
+
+    :param reads: :class:`Limit` of reads, ``None`` for no limit
+    :param writes: :class:`Limit` of writes, ``None`` for no limit
+
+    Usage:
+
+    .. code-block:: python
+
+       limit = MethodLimits(reads=Limit(max_in_flight=50), writes=Limit(max_in_flight=5, rate=20))
+       gandalf = AsyncTornadoGandalfClient('localhost', 8001, limit=limit)
+    '''
+
+    def __init__(self, reads=None, writes=None):
+        self.reads = reads
+        self.writes = writes
+
+    def for_method(self, method):
+        return self.reads if method.upper() in READ_METHODS else self.writes
@@ -0,0 +1,71 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+from collections import deque
+
+from gandalf.decorators import then
+
+
+class LogIterator(object):
+    '''
+    Lazily iterates over the commits of a repository history, newest first,
+    fetching them with :meth:`gandalf.client.GandalfClient.repository_log` in
+    pages continuing from the first commit not returned yet. Pages start
+    small, so scans stopping early make small requests, and double up to
+    ``max_page_size`` commits, so long scans make few requests while at most
+    one page is kept in memory.
+
+    Iterate with ``for`` on the synchronous client and with ``async for`` on
+    the asynchronous ones.
+
+    :param client: :class:`gandalf.client.GandalfClient`
+    :param name: repository name
+    :param ref: tag, branch or commit to start from
+    :param path: only return commits changing this path
+    :param page_size: commits fetched by the first request
+    :param max_page_size: maximum number of commits fetched by a request
+    '''
+
+    def __init__(self, client, name, ref='master', path='', page_size=10, max_page_size=1000):
+        self.client = client
+        self.name = name
+        self.path = path
+        self.page_size = page_size
+        self.max_page_size = max_page_size
+        self.commits = deque()
+        # Ref of the next page, None once the history was fetched
+        self.next_ref = ref
+
+    def _fetch(self):
+        ref, self.next_ref = self.next_ref, None
+        size, self.page_size = self.page_size, min(self.page_size * 2, self.max_page_size)
+        return then(self.client.repository_log(self.name, ref, size, self.path), self._store)
+
+    def _store(self, page):
+        self.commits.extend(page['commits'])
+        self.next_ref = page.get('next') or None
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.client.is_async:
+            raise TypeError('Asynchronous clients must iterate the log with async for')
+        while not self.commits:
+            if self.next_ref is None:
+                raise StopIteration
+            self._fetch()
+        return self.commits.popleft()
+
+    def __aiter__(self):
+        return self
+
+    def __anext__(self):
+        if self.commits:
+            return self.client._resolved(self.commits.popleft())
+        if self.next_ref is None:
+            raise StopAsyncIteration
+        return then(self._fetch(), self._fetched)
+
+    def _fetched(self, result):
+        # Pages filtered by path may be empty, go on with the next one
+        return self.__anext__()
@@ -0,0 +1,228 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import bisect
+import threading
+
+from gandalf.instrumentation import RequestObserver
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def format_labels(names, values):
+    if not names:
+        return ''
+    escaped = (
+        str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        for value in values
+    )
+    return '{' + ','.join('{0}="{1}"'.format(*item) for item in zip(names, escaped)) + '}'
+
+
+class Metric(object):
+    '''
+    Base class of the metrics kept by a :class:`MetricsRegistry`. Values are
+    kept per combination of label values, passed in the order of
+    ``labels``.
+    '''
+
+    type = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def get(self, *labels):
+        with self.lock:
+            return self.values.get(tuple(labels), 0)
+
+    def samples(self):
+        with self.lock:
+            items = sorted(self.values.items())
+        for labels, value in items:
+            yield self.name, labels, value
+
+    def render(self):
+        lines = [
+            '# HELP {0} {1}'.format(self.name, self.help),
+            '# TYPE {0} {1}'.format(self.name, self.type),
+        ]
+        for name, labels, value in self.samples():
+            names = self.labels + (('le',) if len(labels) > len(self.labels) else ())
+            lines.append('{0}{1} {2}'.format(name, format_labels(names, labels), format_value(value)))
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, labels=(), amount=1):
+        labels = tuple(labels)
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+
+class Gauge(Metric):
+    type = 'gauge'
+
+    def inc(self, labels=(), amount=1):
+        labels = tuple(labels)
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def dec(self, labels=(), amount=1):
+        self.inc(labels, -amount)
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        super(Histogram, self).__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value, labels=()):
+        labels = tuple(labels)
+        with self.lock:
+            counts, total = self.values.get(labels, ([0] * len(self.buckets), 0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.values[labels] = (counts, total + value)
+
+    def get(self, *labels):
+        '''
+        Returns a ``(count, sum)`` tuple for the given label values.
+        '''
+        with self.lock:
+            counts, total = self.values.get(tuple(labels), ([0], 0))
+            return sum(counts), total
+
+    def samples(self):
+        with self.lock:
+            items = sorted((labels, (list(counts), total)) for labels, (counts, total) in self.values.items())
+        for labels, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                yield self.name + '_bucket', labels + (format_value(bound),), cumulative
+            yield self.name + '_sum', labels, total
+            yield self.name + '_count', labels, cumulative
+
+
+class MetricsRegistry(object):
+    '''
+    In process collection of metrics, rendered in the Prometheus text
+    exposition format by :meth:`render`.
+    '''
+
+    def __init__(self):
+        self.metrics = []
+        self.lock = threading.Lock()
+
+    def register(self, metric):
+        with self.lock:
+            if any(registered.name == metric.name for registered in self.metrics):
+                raise ValueError('Metric {0} is already registered'.format(metric.name))
+            self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self.register(Counter(name, help, labels))
+
+    def gauge(self, name, help, labels=()):
+        return self.register(Gauge(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def render(self):
+        with self.lock:
+            metrics = list(self.metrics)
+        return ''.join(metric.render() + '\n' for metric in metrics)
+
+
+class GandalfMetrics(RequestObserver):
+    '''
+    Request observer keeping latency histograms, in flight gauges, error and
+    byte counters for each gandalf route. Metrics are labeled by the client
+    method calling the route (``method``) and the route template (``route``).
+
+    :param registry: :class:`MetricsRegistry` the metrics are added to,
+                     a new one by default
+    :param prefix: prefix of the metric names
+    :param buckets: upper bounds, in seconds, of the latency histogram buckets
+
+    Usage:
+
+    .. code-block:: python
+
+       metrics = GandalfMetrics()
+       gandalf = GandalfClient('localhost', 8001, observers=[metrics])
+       ...
+       # e.g. from a /metrics handler of your application
+       self.set_header('Content-Type', gandalf.metrics.CONTENT_TYPE)
+       self.write(metrics.registry.render())
+    '''
+
+    def __init__(self, registry=None, prefix='gandalf_client', buckets=DEFAULT_BUCKETS):
+        self.registry = registry if registry is not None else MetricsRegistry()
+        labels = ('method', 'route')
+        self.requests = self.registry.counter(
+            prefix + '_requests_total', 'Requests finished, by response status.', labels + ('status',)
+        )
+        self.errors = self.registry.counter(
+            prefix + '_request_errors_total', 'Requests that failed, by error.', labels + ('error',)
+        )
+        self.in_flight = self.registry.gauge(
+            prefix + '_requests_in_flight', 'Requests waiting for a response.', labels
+        )
+        self.latency = self.registry.histogram(
+            prefix + '_request_duration_seconds', 'Time until the response was received.', labels, buckets
+        )
+        self.queue_latency = self.registry.histogram(
+            prefix + '_queue_duration_seconds', 'Time requests waited for the client limit.', labels, buckets
+        )
+        self.decode_latency = self.registry.histogram(
+            prefix + '_decode_duration_seconds', 'Time spent decoding responses.', labels, buckets
+        )
+        self.bytes_sent = self.registry.counter(
+            prefix + '_sent_bytes_total', 'Bytes sent in request bodies.', labels
+        )
+        self.bytes_received = self.registry.counter(
+            prefix + '_received_bytes_total', 'Bytes received in response bodies.', labels
+        )
+
+    def _labels(self, info):
+        return (info.name or 'unknown', info.route or 'unknown')
+
+    def request_started(self, info):
+        self.in_flight.inc(self._labels(info))
+
+    def request_finished(self, info):
+        labels = self._labels(info)
+        self.in_flight.dec(labels)
+        # Label values are strings, so label tuples sort when rendered
+        self.requests.inc(labels + (str(info.status) if info.status is not None else 'none',))
+        if info.error is not None:
+            self.errors.inc(labels + (type(info.error).__name__,))
+        if 'total' in info.timings:
+            self.latency.observe(info.timings['total'], labels)
+        if 'queue' in info.timings:
+            self.queue_latency.observe(info.timings['queue'], labels)
+        if 'decode' in info.timings:
+            self.decode_latency.observe(info.timings['decode'], labels)
+        if info.bytes_sent:
+            self.bytes_sent.inc(labels, info.bytes_sent)
+        if info.bytes_received:
+            self.bytes_received.inc(labels, info.bytes_received)
@@ -0,0 +1,156 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import random
+import threading
+import time
+
+LEAST_OUTSTANDING = 'least-outstanding'
+EWMA = 'ewma'
+
+READ_METHODS = ('GET', 'HEAD')
+
+
+class Endpoint(object):
+    '''
+    A gandalf server of a :class:`ServerPool`, with the load and health
+    information used to pick it.
+    '''
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.url = 'http://{0}:{1}'.format(host, port)
+        self.outstanding = 0
+        self.latency = None
+        self.failures = 0
+        self.ejected_at = None
+
+    @property
+    def ejected(self):
+        return self.ejected_at is not None
+
+    def __repr__(self):
+        return '<Endpoint {0}>'.format(self.url)
+
+
+class ServerPool(object):
+    '''
+    Replicas of a gandalf server sharing the same storage.
+
+    Reads (GET requests) are spread over the healthy servers, picking the one
+    with the least requests in flight, or with ``strategy=EWMA`` the one with
+    the lowest moving average of latency weighted by its requests in flight.
+    A failed read (connection error or 5xx response) is retried right away on
+    another server. Writes always go to the first healthy server, in the
+    given order, so they are applied by a single server at a time.
+
+    Servers failing ``eject_after`` requests in a row are ejected for
+    ``eject_for`` seconds, after which they must answer a healthcheck before
+    getting requests again.
+
+    :param endpoints: list of ``(host, port)`` tuples
+    :param strategy: :data:`LEAST_OUTSTANDING` or :data:`EWMA`
+    :param eject_after: consecutive failures that eject a server
+    :param eject_for: seconds a server stays ejected before being probed
+    :param probe_timeout: seconds to wait for the healthcheck probe
+    :param ewma_weight: weight of the last request in the latency average
+
+    Usage:
+
+    .. code-block:: python
+
+       gandalf = GandalfClient.for_servers([('gandalf-1', 8001), ('gandalf-2', 8001)])
+    '''
+
+    def __init__(self, endpoints, strategy=LEAST_OUTSTANDING, eject_after=3, eject_for=30,
+                 probe_timeout=5, ewma_weight=0.3, clock=time.time):
+        if not endpoints:
+            raise ValueError('ServerPool needs at least one endpoint')
+        if strategy not in (LEAST_OUTSTANDING, EWMA):
+            raise ValueError('Unknown strategy {0}'.format(strategy))
+        self.endpoints = [Endpoint(host, port) for host, port in endpoints]
+        self.strategy = strategy
+        self.eject_after = eject_after
+        self.eject_for = eject_for
+        self.probe_timeout = probe_timeout
+        self.ewma_weight = ewma_weight
+        self.clock = clock
+        self.lock = threading.Lock()
+
+    @property
+    def primary(self):
+        return self.endpoints[0]
+
+    def _available(self, exclude):
+        now = self.clock()
+        return [
+            endpoint for endpoint in self.endpoints
+            if endpoint not in exclude and (not endpoint.ejected or now - endpoint.ejected_at >= self.eject_for)
+        ]
+
+    def _score(self, endpoint):
+        if self.strategy == LEAST_OUTSTANDING:
+            return endpoint.outstanding
+        return (endpoint.latency or 0) * (endpoint.outstanding + 1)
+
+    def pick(self, method, exclude=()):
+        '''
+        Returns an ``(endpoint, probe)`` tuple for a request with the given
+        HTTP method, avoiding the endpoints in ``exclude``. When ``probe`` is
+        true the endpoint was ejected and must be probed with a healthcheck,
+        reported with :meth:`probed`, before it's used.
+        '''
+        with self.lock:
+            available = self._available(exclude)
+            probe = True
+            if not available:
+                # Every server was tried or is ejected, keep trying them
+                # rather than failing without a request
+                available = [endpoint for endpoint in self.endpoints if endpoint not in exclude] or self.endpoints
+                probe = False
+
+            if method.upper() in READ_METHODS:
+                best = min(self._score(endpoint) for endpoint in available)
+                endpoint = random.choice([
+                    candidate for candidate in available if self._score(candidate) == best
+                ])
+            else:
+                endpoint = available[0]
+            return endpoint, probe and endpoint.ejected
+
+    def probed(self, endpoint, healthy):
+        with self.lock:
+            if healthy:
+                endpoint.ejected_at = None
+                endpoint.failures = 0
+            else:
+                endpoint.ejected_at = self.clock()
+
+    def can_failover(self, method, tried):
+        '''
+        Returns whether a failed request with the given HTTP method can be
+        sent again to a server not ``tried`` yet.
+        '''
+        if method.upper() not in READ_METHODS:
+            return False
+        with self.lock:
+            return any(endpoint not in tried and not endpoint.ejected for endpoint in self.endpoints)
+
+    def started(self, endpoint):
+        with self.lock:
+            endpoint.outstanding += 1
+
+    def finished(self, endpoint, failed, duration):
+        with self.lock:
+            endpoint.outstanding -= 1
+            if endpoint.latency is None:
+                endpoint.latency = duration
+            else:
+                endpoint.latency += self.ewma_weight * (duration - endpoint.latency)
+
+            if not failed:
+                endpoint.failures = 0
+                return
+            endpoint.failures += 1
+            if endpoint.failures >= self.eject_after:
+                endpoint.ejected_at = self.clock()
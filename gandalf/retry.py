@@ -0,0 +1,131 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import random
+import threading
+import time
+
+
+class RetryBudget(object):
+    '''
+    Token bucket limiting retries to a share of the requests made, so a
+    struggling gandalf server isn't flooded by retries. Every request adds
+    ``ratio`` tokens, up to ``max_tokens``, and every retry takes one.
+
+    :param ratio: retries allowed per request, e.g. 0.2 allows one retry for
+                  every 5 requests
+    :param min_tokens: tokens available from the start, so clients making few
+                       requests can still retry
+    :param max_tokens: maximum number of tokens saved up
+    '''
+
+    def __init__(self, ratio=0.2, min_tokens=10, max_tokens=100):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.tokens = min_tokens
+        self.lock = threading.Lock()
+
+    def deposit(self):
+        with self.lock:
+            self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def withdraw(self):
+        with self.lock:
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+class RetryPolicy(object):
+    '''
+    Retries idempotent requests failing with connection errors or with one of
+    the given status codes, waiting an exponentially growing, jittered, delay
+    between attempts.
+
+    :param attempts: maximum number of attempts, the first one included
+    :param backoff: delay before the first retry, in seconds. It doubles with
+                    every retry, up to ``max_backoff``.
+    :param max_backoff: maximum delay between attempts, in seconds
+    :param jitter: waits a random delay between zero and the backoff ("full
+                   jitter"), so clients don't retry in lockstep
+    :param methods: HTTP methods that are safe to retry
+    :param statuses: status codes worth retrying. 599 is used by tornado for
+                     connection errors and timeouts.
+    :param errors: exceptions raised by the transport worth retrying
+    :param deadline: seconds a call may take, retries included. Attempts are
+                     given the remaining time as timeout and no retry is
+                     started after it.
+    :param budget: :class:`RetryBudget` shared by the calls using this policy,
+                   a new one by default
+
+    Usage:
+
+    .. code-block:: python
+
+       gandalf = GandalfClient('localhost', 8001, retry=RetryPolicy(attempts=5, deadline=10))
+    '''
+
+    def __init__(self, attempts=3, backoff=0.1, max_backoff=5, jitter=True,
+                 methods=('GET', 'HEAD', 'DELETE'), statuses=(502, 503, 504, 599),
+                 errors=(IOError, OSError), deadline=None, budget=None,
+                 clock=time.time, random=random.random):
+        self.attempts = attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.methods = methods
+        self.statuses = statuses
+        self.errors = errors
+        self.deadline = deadline
+        self.budget = budget if budget is not None else RetryBudget()
+        self.clock = clock
+        self.random = random
+
+    def begin(self):
+        '''
+        Returns the :class:`Retries` of a new call.
+        '''
+        self.budget.deposit()
+        return Retries(self, self.clock())
+
+
+class Retries(object):
+    '''
+    Keeps track of the attempts of one call.
+    '''
+
+    def __init__(self, policy, started):
+        self.policy = policy
+        self.started = started
+        self.attempt = 1
+
+    def remaining(self):
+        '''
+        Seconds left until the deadline, ``None`` without deadline.
+        '''
+        if self.policy.deadline is None:
+            return None
+        return max(0, self.started + self.policy.deadline - self.policy.clock())
+
+    def delay(self, method, status=None, error=None):
+        '''
+        Returns the seconds to wait before retrying an attempt that failed
+        with the given status code or error, or ``None`` if it shouldn't be
+        retried.
+        '''
+        policy = self.policy
+        if self.attempt >= policy.attempts or method.upper() not in policy.methods:
+            return None
+        if status not in policy.statuses and not isinstance(error, policy.errors):
+            return None
+
+        delay = min(policy.max_backoff, policy.backoff * 2 ** (self.attempt - 1))
+        if policy.jitter:
+            delay *= policy.random()
+        remaining = self.remaining()
+        if remaining is not None and delay >= remaining:
+            return None
+        if not policy.budget.withdraw():
+            return None
+        self.attempt += 1
+        return delay
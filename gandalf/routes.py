@@ -0,0 +1,61 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import re
+from collections import namedtuple
+
+
+class Route(namedtuple('Route', ['method', 'template', 'name', 'regex'])):
+    '''
+    A gandalf server route, named after the client method that calls it.
+    '''
+    __slots__ = ()
+
+    def match(self, method, path):
+        if method != self.method:
+            return None
+        match = self.regex.match(path)
+        return match and match.groupdict()
+
+
+def route(method, template, name):
+    pattern = re.sub(r':(\w+)', r'(?P<\1>[^/]+)', template.rstrip('/'))
+    return Route(method, template, name, re.compile('^{0}/?$'.format(pattern)))
+
+
+# Routes with literal segments come before the routes with parameters they
+# would otherwise match, e.g. /repository/revoke before /repository/:name
+ROUTES = [
+    route('POST', '/repository', 'repository_new'),
+    route('POST', '/repository/grant', 'repository_grant'),
+    route('DELETE', '/repository/revoke', 'repository_revoke'),
+    route('GET', '/repository/:name', 'repository_get'),
+    route('PUT', '/repository/:name', 'repository_update'),
+    route('DELETE', '/repository/:name', 'repository_delete'),
+    route('GET', '/repository/:name/tree', 'repository_tree'),
+    route('GET', '/repository/:name/archive', 'repository_archive'),
+    route('GET', '/repository/:name/contents', 'repository_contents'),
+    route('GET', '/repository/:name/branches', 'repository_branches'),
+    route('GET', '/repository/:name/tags', 'repository_tags'),
+    route('GET', '/repository/:name/diff/commits', 'repository_diff_commits'),
+    route('POST', '/repository/:name/commit', 'repository_commit'),
+    route('GET', '/repository/:name/logs', 'repository_log'),
+    route('POST', '/user', 'user_new'),
+    route('DELETE', '/user/:name', 'user_delete'),
+    route('POST', '/user/:name/key', 'user_add_key'),
+    route('GET', '/user/:name/keys', 'user_get_keys'),
+    route('DELETE', '/user/:name/key/:keyname', 'user_delete_key'),
+    route('POST', '/hook/:name', 'hook_add'),
+    route('GET', '/healthcheck/', 'healthcheck'),
+]
+
+
+def match_route(method, path):
+    '''
+    Returns a ``(route, params)`` tuple for the route matching the given HTTP
+    method and path, without query string, or ``(None, None)``.
+    '''
+    for candidate in ROUTES:
+        params = candidate.match(method, path)
+        if params is not None:
+            return candidate, params
+    return None, None
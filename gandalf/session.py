@@ -0,0 +1,53 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class PooledSession(object):
+    '''
+    Callable with the same signature as ``requests.request`` that keeps
+    connections alive and reuses them between calls.
+
+    Each thread gets its own ``requests.Session``, but every session mounts
+    the same adapter, so all threads share a single connection pool.
+
+    :param pool_connections: number of hosts to keep a connection pool for
+    :param pool_maxsize: maximum number of connections kept alive per host
+    :param timeout: default timeout in seconds for requests that don't set one
+
+    Usage:
+
+    .. code-block:: python
+
+       gandalf = GandalfClient("localhost", 8001, PooledSession(pool_maxsize=50))
+    '''
+
+    def __init__(self, pool_connections=10, pool_maxsize=10, timeout=None):
+        self.timeout = timeout
+        self.adapter = HTTPAdapter(
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            pool_block=True,
+        )
+        self._local = threading.local()
+
+    @property
+    def session(self):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            session.mount('http://', self.adapter)
+            session.mount('https://', self.adapter)
+            self._local.session = session
+        return session
+
+    def __call__(self, method, url, **kwargs):
+        if self.timeout is not None:
+            kwargs.setdefault('timeout', self.timeout)
+        return self.session.request(method=method, url=url, **kwargs)
+
+    def close(self):
+        self.adapter.close()
@@ -0,0 +1,366 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import codecs
+import io
+import json
+import os
+import re
+import tarfile
+import time
+import uuid
+import zipfile
+
+
+class IterStream(io.RawIOBase):
+    '''
+    Read only, non seekable file object over an iterator of byte chunks.
+    Chunks are only pulled from the iterator as they are read, so wrapping
+    a streamed response body keeps memory usage constant.
+    '''
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buffer = b''
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self._buffer:
+            try:
+                self._buffer = next(self._chunks)
+            except StopIteration:
+                return 0
+        size = min(len(b), len(self._buffer))
+        b[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        return size
+
+
+def open_stream(chunks, buffer_size=io.DEFAULT_BUFFER_SIZE):
+    return io.BufferedReader(IterStream(chunks), buffer_size)
+
+
+def open_archive(fileobj, format):
+    if format == 'tar':
+        return tarfile.TarFile(fileobj=fileobj)
+    elif format == 'zip':
+        return zipfile.ZipFile(fileobj)
+
+
+def iter_chunks(content, chunk_size):
+    if isinstance(content, str):
+        content = content.encode('utf-8')
+    if isinstance(content, bytes):
+        yield content
+    elif hasattr(content, 'read'):
+        for chunk in iter(lambda: content.read(chunk_size), b''):
+            yield chunk
+    else:
+        for chunk in content:
+            yield chunk
+
+
+def _remaining_size(content):
+    if isinstance(content, bytes):
+        return len(content)
+    try:
+        return os.fstat(content.fileno()).st_size - content.tell()
+    except (AttributeError, IOError, OSError, ValueError):
+        pass
+    try:
+        position = content.tell()
+        content.seek(0, os.SEEK_END)
+        size = content.tell() - position
+        content.seek(position)
+        return size
+    except (AttributeError, IOError, OSError, ValueError):
+        return None
+
+
+class MultipartEncoder(object):
+    '''
+    Streams a ``multipart/form-data`` body. Files are read in chunks while
+    the body is sent instead of being loaded in memory.
+
+    It can be iterated over, yielding the body in chunks, or read like a file
+    object, as expected by ``requests``.
+
+    :param fields: dict of form field names to text values
+    :param files: dict of form field names to bytes, file objects or
+                  iterators of byte chunks
+    :param chunk_size: size of the chunks read from file objects
+    '''
+
+    def __init__(self, fields=None, files=None, chunk_size=64 * 1024):
+        self.boundary = uuid.uuid4().hex
+        self.content_type = 'multipart/form-data; boundary={0}'.format(self.boundary)
+        self.chunk_size = chunk_size
+        self.parts = []
+
+        for name, value in (fields or {}).items():
+            if isinstance(value, str):
+                value = value.encode('utf-8')
+            self.parts.append((self._header(name), value))
+        for name, content in (files or {}).items():
+            self.parts.append((self._header(name, filename=name), content))
+
+        self.len = self._length()
+        self._stream = None
+
+    def _header(self, name, filename=None):
+        header = '--{0}\r\nContent-Disposition: form-data; name="{1}"'.format(self.boundary, name)
+        if filename is not None:
+            header += '; filename="{0}"\r\nContent-Type: application/octet-stream'.format(filename)
+        return (header + '\r\n\r\n').encode('utf-8')
+
+    def _footer(self):
+        return '--{0}--\r\n'.format(self.boundary).encode('utf-8')
+
+    def _length(self):
+        length = len(self._footer())
+        for header, content in self.parts:
+            size = _remaining_size(content)
+            if size is None:
+                # Length of iterators is unknown, the body must be sent chunked
+                return None
+            length += len(header) + size + 2
+        return length
+
+    def __iter__(self):
+        for header, content in self.parts:
+            yield header
+            for chunk in iter_chunks(content, self.chunk_size):
+                if chunk:
+                    yield chunk
+            yield b'\r\n'
+        yield self._footer()
+
+    def read(self, size=-1):
+        if self._stream is None:
+            self._stream = open_stream(iter(self), self.chunk_size)
+        return self._stream.read(size)
+
+
+class _ZipSink(object):
+    # Unseekable file object zipfile writes to, buffering until drained
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        chunks, self.chunks = self.chunks, []
+        return chunks
+
+
+def iter_zip(entries, chunk_size=64 * 1024, compression=zipfile.ZIP_DEFLATED):
+    '''
+    Builds a zip archive on the fly, yielding it in chunks as entries are
+    compressed, so it can be streamed without temporary files.
+
+    :param entries: dict of paths to contents, or iterable of ``(path, content)``
+                    tuples. Contents may be bytes, text, file objects or
+                    iterators of byte chunks.
+
+    Usage:
+
+    .. code-block:: python
+
+       gandalf.repository_commit(
+           'my-repo', 'Scaffold', 'Author', 'author@example.com',
+           'Committer', 'committer@example.com', 'master',
+           iter_zip({'README': b'my repo', 'src/main.py': open('main.py', 'rb')})
+       )
+    '''
+    if hasattr(entries, 'items'):
+        entries = entries.items()
+
+    sink = _ZipSink()
+    with zipfile.ZipFile(sink, 'w', compression) as archive:
+        for path, content in entries:
+            info = zipfile.ZipInfo(path, date_time=time.localtime()[:6])
+            info.compress_type = compression
+            info.external_attr = 0o644 << 16
+            with archive.open(info, 'w', force_zip64=True) as entry:
+                for chunk in iter_chunks(content, chunk_size):
+                    entry.write(chunk)
+                    for data in sink.drain():
+                        yield data
+            for data in sink.drain():
+                yield data
+    for data in sink.drain():
+        yield data
+
+
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+# Characters that may follow a complete value, the empty string excluded
+DELIMITERS = frozenset(' \t\n\r,:]}')
+
+# States of JSONItemParser
+START, ITEMS, MEMBERS, DONE = 'start', 'items', 'members', 'done'
+# What JSONItemParser expects next in an array or object: a value or its end
+# right after it's opened, a comma or its end after a value, a value after a
+# comma
+OPENED, SEPARATOR, VALUE = 'opened', 'separator', 'value'
+
+
+class JSONItemParser(object):
+    '''
+    Incremental parser of a JSON array, or of an array member of a JSON
+    object, returning its items as soon as they are complete. Only the item
+    being received is kept as text, so big responses are decoded while they
+    arrive without holding the whole body and its decoded value at once.
+
+    :param key: when set, the document is an object and the items of its
+                ``key`` member are returned. Its other members are kept in
+                ``fields``.
+
+    Usage:
+
+    .. code-block:: python
+
+       parser = JSONItemParser(key='commits')
+       for chunk in chunks:
+           for commit in parser.feed(chunk):
+               print(commit['ref'])
+       for commit in parser.close():
+           print(commit['ref'])
+       parser.fields['next']
+    '''
+
+    def __init__(self, key=None, encoding='utf-8'):
+        self.key = key
+        self.fields = {}
+        self.buffer = ''
+        self.state = START
+        self.expect = OPENED
+        self.decoder = codecs.getincrementaldecoder(encoding)()
+        self.json = json.JSONDecoder()
+        # Items parsed from chunks passed to write
+        self.pending = []
+        self.error = None
+
+    def feed(self, chunk):
+        '''
+        Parses a chunk of the document and returns the items completed by it.
+
+        :raises: ValueError if the document isn't the expected JSON
+        '''
+        if isinstance(chunk, bytes):
+            chunk = self.decoder.decode(chunk)
+        self.buffer += chunk
+        return self._parse(final=False)
+
+    def write(self, chunk):
+        '''
+        Same as :meth:`feed`, keeping the completed items in ``pending``. It
+        lets the parser be used as a file object, e.g. as the streaming
+        callback of a transport. Errors are raised by :meth:`close`, as
+        transports also stream the bodies of error responses.
+        '''
+        if self.error is not None:
+            return
+        try:
+            self.pending.extend(self.feed(chunk))
+        except ValueError as e:
+            self.error = e
+
+    def close(self):
+        '''
+        Parses the rest of the document and returns the last items.
+
+        :raises: ValueError if the document is invalid or truncated
+        '''
+        if self.error is not None:
+            raise self.error
+        self.buffer += self.decoder.decode(b'', final=True)
+        items = self._parse(final=True)
+        if self.state != DONE:
+            raise ValueError('Truncated JSON document')
+        return items
+
+    def _decode(self, pos, final):
+        # Returns the value at pos and where it ends, or None if it may not
+        # have been received entirely
+        try:
+            value, end = self.json.raw_decode(self.buffer, pos)
+        except ValueError:
+            if final:
+                raise
+            return None
+        if not final and self.buffer[end:end + 1] not in DELIMITERS:
+            # Numbers may go on in the next chunk, e.g. "-25" followed by "00.0"
+            return None
+        return value, end
+
+    def _skip(self, pos):
+        return WHITESPACE.match(self.buffer, pos).end()
+
+    def _parse(self, final):
+        buffer, items, pos = self.buffer, [], 0
+        while True:
+            pos = self._skip(pos)
+            if pos == len(buffer):
+                break
+            char = buffer[pos]
+
+            if self.state == START:
+                if char != ('[' if self.key is None else '{'):
+                    raise ValueError('Unexpected {0!r} at the start of the JSON document'.format(char))
+                self.state = ITEMS if self.key is None else MEMBERS
+                pos += 1
+            elif self.state == DONE:
+                raise ValueError('Extra data after the JSON document')
+            elif char == ',':
+                if self.expect != SEPARATOR:
+                    raise ValueError('Unexpected \',\' in the JSON document')
+                self.expect = VALUE
+                pos += 1
+            elif char == (']' if self.state == ITEMS else '}'):
+                if self.expect == VALUE:
+                    raise ValueError('Trailing \',\' before {0!r}'.format(char))
+                self.state = MEMBERS if self.state == ITEMS and self.key is not None else DONE
+                self.expect = SEPARATOR
+                pos += 1
+            elif self.expect == SEPARATOR:
+                raise ValueError('Expected \',\' or the end of the {0}, got {1!r}'.format(
+                    'array' if self.state == ITEMS else 'object', char))
+            elif self.state == ITEMS:
+                decoded = self._decode(pos, final)
+                if decoded is None:
+                    break
+                item, pos = decoded
+                items.append(item)
+                self.expect = SEPARATOR
+            else:
+                decoded = self._decode(pos, final)
+                if decoded is None:
+                    break
+                name, colon = decoded
+                colon = self._skip(colon)
+                start = self._skip(colon + 1)
+                if start >= len(buffer):
+                    if final:
+                        raise ValueError('Truncated JSON document')
+                    break
+                if buffer[colon] != ':':
+                    raise ValueError('Expected \':\' after {0!r}'.format(name))
+                if name == self.key and buffer[start] == '[':
+                    self.state = ITEMS
+                    self.expect = OPENED
+                    pos = start + 1
+                    continue
+                decoded = self._decode(start, final)
+                if decoded is None:
+                    break
+                self.fields[name], pos = decoded
+                self.expect = SEPARATOR
+
+        self.buffer = buffer[pos:]
+        return items
@@ -0,0 +1,574 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import difflib
+import hashlib
+import io
+import json
+import socket
+import socketserver
+import sys
+import tarfile
+import threading
+import time
+import zipfile
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from gandalf.routes import match_route
+
+HOOKS = ('post-receive', 'pre-receive', 'update')
+EMPTY_HASH = '0' * 40
+
+
+class FakeGandalfError(Exception):
+    def __init__(self, status_code, message):
+        super(FakeGandalfError, self).__init__(message)
+        self.status_code = status_code
+        self.message = message
+
+
+def git_hash(content):
+    return hashlib.sha1(b'blob ' + str(len(content)).encode('ascii') + b'\0' + content).hexdigest()
+
+
+def generate_content(seed, size):
+    '''
+    Returns ``size`` bytes of deterministic text, in lines of 64 characters.
+    '''
+    line = hashlib.sha256(str(seed).encode('utf-8')).hexdigest()[:63] + '\n'
+    content = line.encode('ascii') * (size // 64 + 1)
+    return content[:size]
+
+
+def parse_multipart(content_type, body):
+    boundary = content_type.split('boundary=', 1)[1].strip('"').encode('ascii')
+    fields = {}
+    for part in body.split(b'--' + boundary)[1:-1]:
+        headers, _, value = part[2:-2].partition(b'\r\n\r\n')
+        name = headers.split(b'name="', 1)[1].split(b'"', 1)[0].decode('utf-8')
+        fields[name] = value
+    return fields
+
+
+class FakeRepository(object):
+    def __init__(self, name, users=None, readonly_users=None, public=False):
+        self.name = name
+        self.users = list(users or [])
+        self.readonly_users = list(readonly_users or [])
+        self.public = public
+        self.hooks = {}
+        self.commits = {}
+        self.branches = {}
+        self.tags = {}
+
+    def resolve(self, ref):
+        if ref == 'HEAD':
+            ref = 'master'
+        if ref in self.tags:
+            return self.tags[ref]['ref']
+        if ref in self.branches:
+            return self.branches[ref]
+        if ref in self.commits:
+            return ref
+        raise FakeGandalfError(400, 'Error when trying to obtain ref {0} of repository {1} '
+                                    '(Invalid ref).'.format(ref, self.name))
+
+    def commit(self, files, message, branch='master', author=None, committer=None):
+        author = author or ('Author', 'author@gandalf.local')
+        committer = committer or author
+        parent = self.branches.get(branch)
+        tree = dict(self.commits[parent]['files']) if parent else {}
+        for path, content in files.items():
+            if isinstance(content, str):
+                content = content.encode('utf-8')
+            if content is None:
+                tree.pop(path, None)
+            else:
+                tree[path.lstrip('/')] = content
+
+        date = time.strftime('%a %b %d %H:%M:%S %Y -0000', time.gmtime())
+        sha = hashlib.sha1('{0}\n{1}\n{2}\n{3}\n{4}'.format(
+            sorted((path, git_hash(content)) for path, content in tree.items()),
+            parent, message, date, len(self.commits)
+        ).encode('utf-8')).hexdigest()
+        self.commits[sha] = {
+            'ref': sha,
+            'parent': [parent] if parent else [],
+            'files': tree,
+            'subject': message,
+            'author': {'name': author[0], 'email': '<{0}>'.format(author[1]), 'date': date},
+            'committer': {'name': committer[0], 'email': '<{0}>'.format(committer[1]), 'date': date},
+            'createdAt': date,
+        }
+        self.branches[branch] = sha
+        return sha
+
+    def ref_json(self, name, sha):
+        commit = self.commits[sha]
+        return {
+            'ref': sha,
+            'name': name,
+            'author': commit['author'],
+            'committer': commit['committer'],
+            'subject': commit['subject'],
+            'createdAt': commit['createdAt'],
+            '_links': {
+                'zipArchive': '/repository/{0}/archive?ref={1}&format=zip'.format(self.name, name),
+                'tarArchive': '/repository/{0}/archive?ref={1}&format=tar'.format(self.name, name),
+            },
+        }
+
+    def files(self, ref, path=''):
+        path = path.strip('/')
+        files = self.commits[self.resolve(ref)]['files']
+        return dict(
+            (file_path, content) for file_path, content in files.items()
+            if not path or file_path == path or file_path.startswith(path + '/')
+        )
+
+
+class FakeGandalf(object):
+    '''
+    In memory implementation of the gandalf server API. Handler methods are
+    named after the :class:`gandalf.client.GandalfClient` methods calling them.
+    '''
+
+    def __init__(self, host='localhost:8001'):
+        self.host = host
+        self.users = {}
+        self.repositories = {}
+        self.hooks = {}
+        self.lock = threading.RLock()
+
+    def get_repository(self, name):
+        if name not in self.repositories:
+            raise FakeGandalfError(404, 'repository not found')
+        return self.repositories[name]
+
+    def get_user(self, name):
+        if name not in self.users:
+            raise FakeGandalfError(404, 'user not found')
+        return self.users[name]
+
+    def validate_keys(self, keys):
+        for key in keys.values():
+            if not key.split(' ', 1)[0] in ('ssh-rsa', 'ssh-dss', 'ssh-ed25519') and \
+                    not key.startswith('ecdsa-'):
+                raise FakeGandalfError(400, 'Invalid key')
+
+    # Repositories
+
+    def repository_new(self, body, **params):
+        data = json.loads(body.decode('utf-8'))
+        if data['name'] in self.repositories:
+            raise FakeGandalfError(409, 'Could not create repository: repository already exists')
+        self.repositories[data['name']] = FakeRepository(
+            data['name'], data.get('users'), data.get('readonlyusers'), data.get('ispublic', False)
+        )
+        return 'Repository "{0}" successfully created\n'.format(data['name'])
+
+    def repository_get(self, name, **params):
+        repository = self.get_repository(name)
+        return {
+            'name': repository.name,
+            'public': repository.public,
+            'git_url': 'git://{0}/{1}.git'.format(self.host, repository.name),
+            'ssh_url': 'git@{0}:{1}.git'.format(self.host, repository.name),
+        }
+
+    def repository_update(self, name, body, **params):
+        repository = self.get_repository(name)
+        data = json.loads(body.decode('utf-8'))
+        if 'name' in data and data['name'] != name:
+            repository.name = data['name']
+            self.repositories[data['name']] = self.repositories.pop(name)
+        repository.users = data.get('users', repository.users)
+        repository.readonly_users = data.get('readonlyusers', repository.readonly_users)
+        repository.public = data.get('ispublic', repository.public)
+        return ''
+
+    def repository_grant(self, body, **params):
+        data = json.loads(body.decode('utf-8'))
+        for name in data['repositories']:
+            repository = self.get_repository(name)
+            repository.users.extend(user for user in data['users'] if user not in repository.users)
+        return 'Successfully granted access to users'
+
+    def repository_revoke(self, body, **params):
+        data = json.loads(body.decode('utf-8'))
+        for name in data['repositories']:
+            repository = self.get_repository(name)
+            repository.users = [user for user in repository.users if user not in data['users']]
+        return 'Successfully revoked access to users'
+
+    def repository_delete(self, name, **params):
+        self.get_repository(name)
+        del self.repositories[name]
+        return 'Repository "{0}" successfully removed\n'.format(name)
+
+    def repository_tree(self, name, query, **params):
+        repository = self.get_repository(name)
+        files = repository.files(query.get('ref', 'master'), query.get('path', ''))
+        return [{
+            'filetype': 'blob',
+            'hash': git_hash(content),
+            'path': path,
+            'rawPath': path,
+            'permission': '100644',
+        } for path, content in sorted(files.items())]
+
+    def repository_contents(self, name, query, **params):
+        repository = self.get_repository(name)
+        files = repository.files(query.get('ref', 'master'))
+        path = query.get('path', '').lstrip('/')
+        if path not in files:
+            raise FakeGandalfError(400, 'Error when trying to obtain {0} on ref {1} of repository '
+                                        '{2} (Path does not exist).'.format(path, query.get('ref'), name))
+        return files[path]
+
+    def repository_archive(self, name, query, **params):
+        repository = self.get_repository(name)
+        ref = query.get('ref', 'master')
+        files = repository.files(ref)
+        prefix = '{0}-{1}/'.format(name, ref)
+        content = io.BytesIO()
+        if query.get('format') == 'tar':
+            with tarfile.open(fileobj=content, mode='w') as archive:
+                for path, data in sorted(files.items()):
+                    info = tarfile.TarInfo(prefix + path)
+                    info.size = len(data)
+                    archive.addfile(info, io.BytesIO(data))
+        else:
+            with zipfile.ZipFile(content, 'w') as archive:
+                for path, data in sorted(files.items()):
+                    archive.writestr(prefix + path, data)
+        return content.getvalue()
+
+    def repository_branches(self, name, **params):
+        repository = self.get_repository(name)
+        return [repository.ref_json(branch, sha) for branch, sha in sorted(repository.branches.items())]
+
+    def repository_tags(self, name, **params):
+        repository = self.get_repository(name)
+        tags = []
+        for tag, data in sorted(repository.tags.items()):
+            ref = repository.ref_json(tag, data['ref'])
+            if data['annotation'] is not None:
+                ref['subject'] = data['annotation']
+                ref['tagger'] = ref['committer']
+            tags.append(ref)
+        return tags
+
+    def repository_diff_commits(self, name, query, **params):
+        repository = self.get_repository(name)
+        previous = repository.files(query['previous_commit'])
+        last = repository.files(query['last_commit'])
+        diff = []
+        for path in sorted(set(previous) | set(last)):
+            old, new = previous.get(path), last.get(path)
+            if old == new:
+                continue
+            diff.append('diff --git a/{0} b/{0}\n'.format(path))
+            old_hash = git_hash(old)[:7] if old is not None else EMPTY_HASH[:7]
+            new_hash = git_hash(new)[:7] if new is not None else EMPTY_HASH[:7]
+            if old is None:
+                diff.append('new file mode 100644\nindex {0}..{1}\n'.format(old_hash, new_hash))
+            elif new is None:
+                diff.append('deleted file mode 100644\nindex {0}..{1}\n'.format(old_hash, new_hash))
+            else:
+                diff.append('index {0}..{1} 100644\n'.format(old_hash, new_hash))
+            lines = difflib.unified_diff(
+                (old or b'').decode('utf-8', 'replace').splitlines(True),
+                (new or b'').decode('utf-8', 'replace').splitlines(True),
+                'a/' + path if old is not None else '/dev/null',
+                'b/' + path if new is not None else '/dev/null',
+                n=3,
+            )
+            diff.extend(lines)
+        return ''.join(diff)
+
+    def repository_commit(self, name, body, content_type, **params):
+        repository = self.get_repository(name)
+        fields = parse_multipart(content_type, body)
+        files = {}
+        with zipfile.ZipFile(io.BytesIO(fields.pop('zipfile'))) as archive:
+            for info in archive.infolist():
+                if not info.filename.endswith('/'):
+                    files[info.filename] = archive.read(info)
+        fields = dict((key, value.decode('utf-8')) for key, value in fields.items())
+        sha = repository.commit(
+            files, fields['message'], fields['branch'],
+            author=(fields['author-name'], fields['author-email']),
+            committer=(fields['committer-name'], fields['committer-email']),
+        )
+        return repository.ref_json(fields['branch'], sha)
+
+    def repository_log(self, name, query, **params):
+        repository = self.get_repository(name)
+        sha = repository.resolve(query.get('ref', 'master'))
+        total = int(query.get('total', 1))
+        path = query.get('path', '').strip('/')
+
+        commits = []
+        while sha:
+            commit = repository.commits[sha]
+            parent = commit['parent'][0] if commit['parent'] else None
+            if path:
+                files = repository.files(sha, path)
+                changed = not parent or files != repository.files(parent, path)
+            else:
+                changed = True
+            if changed:
+                if len(commits) == total:
+                    return {'commits': commits, 'next': sha}
+                commits.append(dict(
+                    (key, value) for key, value in commit.items() if key != 'files'
+                ))
+            sha = parent
+        return {'commits': commits, 'next': ''}
+
+    # Users
+
+    def user_new(self, body, **params):
+        data = json.loads(body.decode('utf-8'))
+        if data['name'] in self.users:
+            raise FakeGandalfError(409, 'Could not create user: user already exists')
+        keys = data.get('keys') or {}
+        self.validate_keys(keys)
+        self.users[data['name']] = dict(keys)
+        return 'User "{0}" successfully created\n'.format(data['name'])
+
+    def user_delete(self, name, **params):
+        self.get_user(name)
+        del self.users[name]
+        return 'User "{0}" successfully removed\n'.format(name)
+
+    def user_add_key(self, name, body, **params):
+        keys = self.get_user(name)
+        new_keys = json.loads(body.decode('utf-8'))
+        self.validate_keys(new_keys)
+        for keyname in new_keys:
+            if keyname in keys:
+                raise FakeGandalfError(409, 'Key already exists')
+        keys.update(new_keys)
+        return 'Key(s) successfully created'
+
+    def user_get_keys(self, name, **params):
+        return self.get_user(name)
+
+    def user_delete_key(self, name, keyname, **params):
+        keys = self.get_user(name)
+        if keyname not in keys:
+            raise FakeGandalfError(404, 'Key not found')
+        del keys[keyname]
+        return 'Key "{0}" successfully removed'.format(keyname)
+
+    # Hooks and healthcheck
+
+    def hook_add(self, name, body, **params):
+        if name not in HOOKS:
+            raise FakeGandalfError(400, 'Unsupported hook, valid options are: {0}'.format(', '.join(HOOKS)))
+        data = json.loads(body.decode('utf-8'))
+        repositories = data.get('repositories') or []
+        for repository in repositories:
+            self.get_repository(repository).hooks[name] = data['content']
+        if not repositories:
+            self.hooks[name] = data['content']
+        return 'hook {0} successfully created\n'.format(name)
+
+    def healthcheck(self, **params):
+        return 'WORKING'
+
+
+class FakeGandalfHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written separately, keep Nagle from delaying the
+    # body of keep-alive responses
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def _read_body(self):
+        if self.headers.get('Transfer-Encoding', '').lower() != 'chunked':
+            return self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        chunks = []
+        while True:
+            size = int(self.rfile.readline().split(b';', 1)[0].strip(), 16)
+            chunks.append(self.rfile.read(size))
+            self.rfile.readline()
+            if not size:
+                return b''.join(chunks)
+
+    def _reply(self, status_code, content, content_type='text/plain; charset=utf-8'):
+        self.send_response(status_code)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def _handle(self):
+        server = self.server
+        parts = urlsplit(self.path)
+        route, params = match_route(self.command, parts.path)
+        body = self._read_body()
+        if route is None:
+            return self._reply(404, b'404 page not found\n')
+
+        server.calls[route.name] += 1
+        latency = server.latency(route.name) if callable(server.latency) else server.latency
+        if latency:
+            time.sleep(latency)
+
+        failed, status_code = server.next_fault(route.name)
+        if failed and status_code is None:
+            # Drop the connection without answering
+            self.close_connection = True
+            return
+        if failed:
+            return self._reply(status_code, b'Injected failure\n')
+
+        query = dict((key, values[0]) for key, values in parse_qs(parts.query).items())
+        try:
+            with server.gandalf.lock:
+                result = getattr(server.gandalf, route.name)(
+                    body=body, query=query,
+                    content_type=self.headers.get('Content-Type', ''),
+                    **params
+                )
+        except FakeGandalfError as e:
+            return self._reply(e.status_code, (e.message + '\n').encode('utf-8'))
+
+        if isinstance(result, (dict, list)):
+            return self._reply(200, json.dumps(result).encode('utf-8'), 'application/json')
+        if isinstance(result, str):
+            result = result.encode('utf-8')
+        self._reply(200, result, 'application/octet-stream')
+
+    do_GET = do_POST = do_PUT = do_DELETE = _handle
+
+
+class FakeGandalfServer(socketserver.ThreadingMixIn, HTTPServer):
+    '''
+    In process stand in for gandalf-server, keeping users, repositories and
+    commits in memory. It serves every route used by
+    :class:`gandalf.client.GandalfClient` from a background thread, so it
+    works with every client and transport, and needs neither git nor MongoDB.
+
+    :param host: interface to listen on
+    :param port: port to listen on, a free one is picked by default
+    :param latency: seconds to wait before handling each request, or a
+                    function receiving the route name (e.g. ``repository_get``)
+                    and returning them
+
+    Usage:
+
+    .. code-block:: python
+
+       with FakeGandalfServer(latency=0.005) as server:
+           server.populate('my-repo', files=1000, size=4096, commits=10)
+           gandalf = GandalfClient('localhost', server.port)
+           gandalf.repository_tree('my-repo')
+    '''
+
+    daemon_threads = True
+    allow_reuse_address = True
+    # Bursts of concurrent clients overflow the default backlog of 5
+    request_queue_size = 128
+
+    def __init__(self, host='localhost', port=0, latency=0):
+        HTTPServer.__init__(self, (host, port), FakeGandalfHandler)
+        self.host, self.port = self.server_address[:2]
+        self.latency = latency
+        self.calls = Counter()
+        self.faults = []
+        self.gandalf = FakeGandalf('{0}:{1}'.format(self.host, self.port))
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def handle_error(self, request, client_address):
+        # Clients giving up on slow or failing requests close their connections
+        if not isinstance(sys.exc_info()[1], socket.error):
+            HTTPServer.handle_error(self, request, client_address)
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def fail(self, times=1, status_code=503, route=None):
+        '''
+        Makes the next ``times`` requests fail with ``status_code``, or by
+        closing the connection without answering when it's ``None``.
+
+        :param route: only fail requests to this route, e.g. ``repository_get``
+        '''
+        with self.gandalf.lock:
+            self.faults.append([route, status_code, times])
+
+    def next_fault(self, route):
+        with self.gandalf.lock:
+            for fault in self.faults:
+                if fault[0] in (None, route):
+                    fault[2] -= 1
+                    if not fault[2]:
+                        self.faults.remove(fault)
+                    return True, fault[1]
+        return False, None
+
+    def create_repository(self, name, files=None, users=None, public=False):
+        '''
+        Creates a repository, with an initial commit of ``files`` on master
+        when given.
+
+        :param files: dict of paths to contents
+        '''
+        with self.gandalf.lock:
+            repository = FakeRepository(name, users, public=public)
+            self.gandalf.repositories[name] = repository
+            if files:
+                repository.commit(files, 'Initial commit')
+        return repository
+
+    def commit(self, name, files, message='Commit', branch='master', author=None):
+        '''
+        Commits ``files`` to a branch and returns the commit hash. Files whose
+        contents are ``None`` are removed.
+        '''
+        with self.gandalf.lock:
+            return self.gandalf.get_repository(name).commit(files, message, branch, author=author)
+
+    def branch(self, name, branch, ref='master'):
+        with self.gandalf.lock:
+            repository = self.gandalf.get_repository(name)
+            repository.branches[branch] = repository.resolve(ref)
+
+    def tag(self, name, tag, ref='master', annotation=None):
+        with self.gandalf.lock:
+            repository = self.gandalf.get_repository(name)
+            repository.tags[tag] = {'ref': repository.resolve(ref), 'annotation': annotation}
+
+    def populate(self, name, files=100, size=1024, commits=1):
+        '''
+        Creates a repository with ``files`` files of ``size`` bytes each and
+        ``commits`` commits, each changing every file. Contents are
+        deterministic, so runs are reproducible.
+        '''
+        self.create_repository(name)
+        for commit in range(commits):
+            self.commit(name, dict(
+                ('dir{0}/file{1}.txt'.format(i % 10, i), generate_content((commit, i), size))
+                for i in range(files)
+            ), message='Commit {0}'.format(commit))
@@ -1,28 +1,258 @@
 #!/usr/bin/python
 # -*- coding: utf-8 -*-
+import functools
+import logging
+import time
+from datetime import timedelta
+
 import tornado.gen as gen
 import tornado.httpclient as httpclient
+from tornado.concurrent import Future, future_set_result_unless_cancelled
+from tornado.httputil import parse_response_start_line
+from tornado.ioloop import IOLoop
 
 import gandalf
 import gandalf.client as client
 
 
+@gen.coroutine
+def produce_body(encoder, write):
+    for chunk in encoder:
+        yield write(chunk)
+
+
+class SuccessfulBodyWriter(object):
+    '''
+    Streams response bodies into ``fileobj`` only when their status is 200.
+    Tornado passes error bodies to the streaming callback too, the status line
+    seen by the header callback tells them apart.
+    '''
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.status_code = None
+
+    def header_callback(self, line):
+        if line.startswith('HTTP/'):
+            self.status_code = parse_response_start_line(line.strip()).code
+
+    def streaming_callback(self, chunk):
+        if self.status_code == 200:
+            self.fileobj.write(chunk)
+
+
 class AsyncTornadoGandalfClient(client.GandalfClient):
-    @gen.coroutine
+    '''
+    Gandalf client for tornado applications. Every API method returns a
+    future.
+
+    :param client: callable with the same signature as
+                   ``tornado.httpclient.AsyncHTTPClient.fetch``. Defaults to
+                   the ``fetch`` of the shared ``AsyncHTTPClient``.
+    '''
+
+    is_async = True
+
+    def __init__(self, host, port, client=None, **kwargs):
+        if client is None:
+            client = httpclient.AsyncHTTPClient().fetch
+        super(AsyncTornadoGandalfClient, self).__init__(host, port, client, **kwargs)
+
     def _request(self, *args, **kwargs):
-        url = kwargs.pop('url')
-        data = kwargs.pop('data', None)
-        if data:
-            kwargs['body'] = data
+        key = self._coalesce_key(kwargs)
+        if key is None:
+            return self._dispatch(args, kwargs)
+        return self.flights.share(key, lambda: self._dispatch(args, kwargs))
+
+    def _dispatch(self, args, kwargs):
+        name = self._hedged_route(kwargs)
+        if name is None:
+            return self._send(args, kwargs, [])
+        return self._hedged_request(name, args, kwargs)
+
+    @gen.coroutine
+    def _hedged_request(self, name, args, kwargs):
+        # Tornado can't abort a request, the attempt that loses is left to
+        # finish and its outcome is ignored
+        started = time.time()
+        tried = []
+        attempts = [self._send(args, kwargs, tried)]
+        winner = None
+        try:
+            try:
+                response = yield gen.with_timeout(
+                    timedelta(seconds=self.hedge.delay(name)), attempts[0], quiet_exceptions=Exception
+                )
+            except gen.TimeoutError:
+                pass
+            else:
+                winner = attempts[0]
+                self.hedge.record(name, time.time() - started)
+                raise gen.Return(response)
+
+            if self.hedge.allow():
+                logging.info('Hedging %s after %.3fs', kwargs['url'], time.time() - started)
+                attempts.append(self._send(args, kwargs, list(tried)))
+            waiter = gen.WaitIterator(*attempts)
+            while True:
+                try:
+                    response = yield waiter.next()
+                except Exception:
+                    # A failed attempt only counts once the other one failed too
+                    if waiter.done():
+                        raise
+                else:
+                    winner = waiter.current_future
+                    self.hedge.record(name, time.time() - started)
+                    raise gen.Return(response)
+        finally:
+            for attempt in attempts:
+                if attempt is not winner:
+                    attempt.add_done_callback(self._ignore_attempt)
 
+    def _ignore_attempt(self, future):
+        # Retrieves the exception of an attempt whose outcome is ignored, so
+        # it isn't logged, and ends the request of its unused response
+        if future.exception() is None:
+            self._abandon_response(future.result())
+
+    @gen.coroutine
+    def _send(self, args, kwargs, tried):
+        retries = self.retry.begin() if self.retry is not None else None
+        while True:
+            if self._check_breaker():
+                healthy = yield self._probe(self.gandalf_server, self.breaker.probe_timeout)
+                self._probed(healthy)
+            endpoint = yield self._select_endpoint(kwargs, tried)
+            tried.append(endpoint)
+            limit = self._request_limit(kwargs)
+            queued = yield self._acquire(limit)
+            attempt = self._endpoint_options(endpoint, kwargs)
+            options = dict(attempt)
+            url = options.pop('url')
+            data = options.pop('data', None)
+            if data:
+                options['body'] = data
+
+            info = self._start_request(attempt, queued)
+            started = time.time()
+            try:
+                response = yield self.client(url, *args, **self._attempt_options(retries, options))
+            except httpclient.HTTPError as e:
+                self._record_attempt(started, e.code, endpoint)
+                self._end_request(info, e.response, error=e)
+                delay = self._next_delay(retries, kwargs, endpoint, tried, status=e.code, error=e)
+                if delay is None:
+                    if e.response is None:
+                        # Timeouts (HTTP 599) have no response to report
+                        raise
+                    raise gandalf.GandalfException(e.response, obj=self)
+            except Exception as e:
+                self._record_attempt(started, endpoint=endpoint)
+                self._end_request(info, error=e)
+                delay = self._next_delay(retries, kwargs, endpoint, tried, error=e)
+                if delay is None:
+                    raise
+            else:
+                self._record_attempt(started, response.code, endpoint)
+                self._end_request(info, response)
+                raise gen.Return(response)
+            finally:
+                self._release(limit)
+            yield gen.sleep(delay)
+
+    @gen.coroutine
+    def _acquire(self, limit):
+        if limit is None:
+            raise gen.Return(None)
+        started = time.time()
+        io_loop = IOLoop.current()
+        woken = Future()
+        wait = limit.reserve(functools.partial(io_loop.add_callback, future_set_result_unless_cancelled, woken, None))
+        if wait == 0:
+            raise gen.Return(0)
+        limit.enqueue()
         try:
-            response = yield self.client(url, *args, **kwargs)
-        except httpclient.HTTPError as e:
-            raise gandalf.GandalfException(e.response, obj=self)
-        raise gen.Return(response)
+            while wait != 0:
+                if wait is None:
+                    yield woken
+                else:
+                    yield gen.sleep(wait)
+                woken = Future()
+                wait = limit.reserve(
+                    functools.partial(io_loop.add_callback, future_set_result_unless_cancelled, woken, None)
+                )
+        finally:
+            limit.dequeue(time.time() - started)
+        raise gen.Return(time.time() - started)
+
+    @gen.coroutine
+    def _probe(self, server, timeout):
+        try:
+            yield self.client('{0}/healthcheck/'.format(server), method='GET', request_timeout=timeout)
+        except Exception:
+            raise gen.Return(False)
+        raise gen.Return(True)
+
+    @gen.coroutine
+    def _select_endpoint(self, kwargs, tried):
+        if self.pool is None:
+            raise gen.Return(None)
+        while True:
+            endpoint, probe = self.pool.pick(kwargs.get('method', 'GET'), tried)
+            if not probe:
+                raise gen.Return(endpoint)
+            healthy = yield self._probe(endpoint.url, self.pool.probe_timeout)
+            if self._endpoint_probed(endpoint, healthy, tried):
+                raise gen.Return(endpoint)
+
+    def timeout_options(self, timeout):
+        return {'request_timeout': timeout}
+
+    def streaming_options(self, fileobj):
+        writer = SuccessfulBodyWriter(fileobj)
+        return {'streaming_callback': writer.streaming_callback, 'header_callback': writer.header_callback}
+
+    def upload_options(self, encoder):
+        headers = {'Content-Type': encoder.content_type}
+        if encoder.len is not None:
+            headers['Content-Length'] = str(encoder.len)
+        return {
+            'body_producer': functools.partial(produce_body, encoder),
+            'headers': headers,
+        }
+
+    def write_stream(self, response, fileobj):
+        # Chunks were already written by the streaming callback
+        pass
+
+    def iter_stream(self, response):
+        # Chunks were already passed to the streaming callback
+        return iter(())
+
+    def _resolved(self, value):
+        future = Future()
+        future.set_result(value)
+        return future
+
+    def _gather(self, results):
+        return gen.multi(results)
 
     def get_code(self, response):
         return response.code
 
+    def get_timings(self, response):
+        # Only curl_httpclient reports connection timings, as offsets from
+        # the start of the request
+        time_info = response.time_info
+        timings = {}
+        if 'namelookup' in time_info:
+            timings['dns'] = time_info['namelookup']
+        if 'connect' in time_info:
+            timings['connect'] = time_info['connect'] - time_info.get('namelookup', 0)
+        if 'starttransfer' in time_info:
+            timings['ttfb'] = time_info['starttransfer']
+        return timings
+
     def get_raw(self, response):
         return response.body
@@ -0,0 +1,237 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+from collections import namedtuple
+from fnmatch import fnmatchcase
+
+BLOB = 'blob'
+TREE = 'tree'
+
+
+def join(directory, name):
+    return '{0}/{1}'.format(directory, name) if directory else name
+
+
+def has_magic(pattern):
+    return any(char in pattern for char in '*?[')
+
+
+class TreeDiff(namedtuple('TreeDiff', ['added', 'removed', 'modified', 'renamed'])):
+    '''
+    Files changed between two trees, as returned by :func:`diff_trees`.
+    ``added``, ``removed`` and ``modified`` are sorted lists of paths and
+    ``renamed`` a sorted list of ``(old path, new path)`` tuples.
+    '''
+    __slots__ = ()
+
+    @property
+    def paths(self):
+        '''
+        Sorted list of every path touched, both paths of renames included.
+        '''
+        paths = set(self.added) | set(self.removed) | set(self.modified)
+        for old, new in self.renamed:
+            paths.update((old, new))
+        return sorted(paths)
+
+    def __bool__(self):
+        return any(self)
+
+
+
+def diff_trees(old, new):
+    '''
+    Compares two tree listings, as returned by
+    :meth:`gandalf.client.GandalfClient.repository_tree`, by blob hash. Paths
+    are matched with dicts and the lists returned are sorted, so it runs in
+    O(n log n) time. A file is modified when its hash or permission changed.
+    A removed file with the same hash as an added one is reported as renamed.
+    Only blobs are paired, identical subtrees are never reported as renamed.
+
+    :return: :class:`TreeDiff`
+    '''
+    old = dict((entry['path'], entry) for entry in old)
+    new = dict((entry['path'], entry) for entry in new)
+
+    modified = []
+    for path, entry in new.items():
+        previous = old.get(path)
+        if previous is not None and (
+                previous['hash'] != entry['hash'] or previous.get('permission') != entry.get('permission')):
+            modified.append(path)
+
+    removed, removed_by_hash = [], {}
+    for path in sorted(path for path in old if path not in new):
+        if old[path].get('filetype', BLOB) == BLOB:
+            removed_by_hash.setdefault(old[path]['hash'], []).append(path)
+        else:
+            removed.append(path)
+
+    added, renamed = [], []
+    for path in sorted(path for path in new if path not in old):
+        candidates = new[path].get('filetype', BLOB) == BLOB and removed_by_hash.get(new[path]['hash'])
+        if candidates:
+            renamed.append((candidates.pop(0), path))
+        else:
+            added.append(path)
+    removed = sorted(removed + [path for paths in removed_by_hash.values() for path in paths])
+
+    return TreeDiff(added, removed, sorted(modified), renamed)
+
+
+class TreeEntry(object):
+    '''
+    A file or a directory of a :class:`TreeIndex`. Directories are implied by
+    the paths of the files listed by gandalf, so they have neither hash nor
+    permission.
+    '''
+
+    __slots__ = ('path', 'filetype', 'hash', 'permission')
+
+    def __init__(self, path, filetype=BLOB, hash=None, permission=None):
+        self.path = path
+        self.filetype = filetype
+        self.hash = hash
+        self.permission = permission
+
+    @property
+    def name(self):
+        return self.path.rsplit('/', 1)[-1]
+
+    @property
+    def is_dir(self):
+        return self.filetype == TREE
+
+    def __eq__(self, other):
+        return isinstance(other, TreeEntry) and all(
+            getattr(self, attr) == getattr(other, attr) for attr in self.__slots__
+        )
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return '<TreeEntry {0} {1}>'.format(self.filetype, self.path or '/')
+
+
+class TreeIndex(object):
+    '''
+    In memory index of a repository tree, as listed by
+    :meth:`gandalf.client.GandalfClient.repository_tree`, answering ``ls``,
+    ``glob`` and ``stat`` queries without further requests. It keeps one
+    :class:`TreeEntry` per path and the sorted names of the children of each
+    directory.
+
+    Paths are relative to the root of the repository, without leading slash.
+    The root directory is ``''``.
+
+    :param entries: tree entries, dicts with ``path``, ``filetype``, ``hash``
+                    and ``permission`` keys
+
+    Usage:
+
+    .. code-block:: python
+
+       index = gandalf.repository_tree_index('my-repo', 'master')
+       index.ls('docs')
+       index.glob('src/**/*.py')
+       index.stat('setup.py').hash
+    '''
+
+    def __init__(self, entries=()):
+        self.entries = {'': TreeEntry('', TREE)}
+        self.children = {'': []}
+        self.files = 0
+        for entry in entries:
+            self._add(entry)
+        for names in self.children.values():
+            names.sort()
+
+    def _add(self, entry):
+        path = entry['path'].strip('/')
+        if path in self.entries:
+            # Overlapping subtrees list the same files
+            return
+        self.entries[path] = TreeEntry(path, entry.get('filetype', BLOB), entry.get('hash'), entry.get('permission'))
+        self.files += 1
+
+        while path:
+            directory, _, name = path.rpartition('/')
+            if directory in self.children:
+                self.children[directory].append(name)
+                return
+            self.entries[directory] = TreeEntry(directory, TREE)
+            self.children[directory] = [name]
+            path = directory
+
+    def __len__(self):
+        '''
+        Number of files in the index.
+        '''
+        return self.files
+
+    def __contains__(self, path):
+        return path.strip('/') in self.entries
+
+    def stat(self, path):
+        '''
+        Returns the :class:`TreeEntry` of a file or directory.
+
+        :raises: KeyError if there's no such path
+        '''
+        return self.entries[path.strip('/')]
+
+    def ls(self, path=''):
+        '''
+        Returns the entries of a directory, sorted by name, or a list holding
+        the entry of ``path`` when it's a file.
+
+        :raises: KeyError if there's no such path
+        '''
+        path = path.strip('/')
+        if path not in self.children:
+            return [self.stat(path)]
+        return [self.entries[join(path, name)] for name in self.children[path]]
+
+    def glob(self, pattern):
+        '''
+        Returns the entries matching a shell pattern, sorted by path. ``*``,
+        ``?`` and ``[...]`` match within a path segment and a ``**`` segment
+        matches any number of directories, e.g. ``src/**/*.py``.
+        '''
+        found = set()
+        parts = [part for part in pattern.strip('/').split('/') if part]
+        if parts:
+            self._glob('', parts, found)
+        return [self.entries[path] for path in sorted(found)]
+
+    def _glob(self, directory, parts, found):
+        if not parts:
+            found.add(directory)
+            return
+        part, rest = parts[0], parts[1:]
+        names = self.children.get(directory, ())
+
+        if part == '**':
+            if not rest:
+                found.update(path for path in self._descendants(directory))
+                return
+            self._glob(directory, rest, found)
+            for name in names:
+                child = join(directory, name)
+                if child in self.children:
+                    self._glob(child, parts, found)
+        elif not has_magic(part):
+            child = join(directory, part)
+            if child in self.entries and (not rest or child in self.children):
+                self._glob(child, rest, found)
+        else:
+            for name in names:
+                if fnmatchcase(name, part):
+                    self._glob(join(directory, name), rest, found)
+
+    def _descendants(self, directory):
+        for name in self.children.get(directory, ()):
+            child = join(directory, name)
+            yield child
+            for path in self._descendants(child):
+                yield path
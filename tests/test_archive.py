@@ -0,0 +1,274 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import io
+import mmap
+import os
+import shutil
+import tarfile
+import tempfile
+import unittest
+import zipfile
+
+from preggy import expect
+import requests
+import requests_mock
+from tornado.httpclient import AsyncHTTPClient
+
+from gandalf import GandalfException
+import gandalf.asyncio_cli as asyncio_cli
+from gandalf.cache import ArchiveCache
+import gandalf.client as client
+from gandalf.testing import FakeGandalfServer
+import gandalf.tornado_cli as tornado_cli
+from tests.base import TestCase
+from tests.utils import FIXTURES, start_stub_server
+
+ARCHIVE_URL = 'http://localhost:8001/repository/doge/archive'
+MASTER = '6f3a27b391d65e0526acd152db9a1c3747791ff1'
+
+
+def read_fixture(name):
+    with open('{0}/{1}'.format(FIXTURES, name), 'rb') as fixture:
+        return fixture.read()
+
+
+def make_tar(files):
+    content = io.BytesIO()
+    with tarfile.open(fileobj=content, mode='w') as tar:
+        for path, data in files:
+            info = tarfile.TarInfo(path)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+    return content.getvalue()
+
+
+class TestStreamedArchive(TestCase):
+
+    def setUp(self):
+        self.gandalf = client.GandalfClient('localhost', 8001, requests.request)
+        self.gandalf.chunk_size = 16
+
+    @requests_mock.Mocker()
+    def test_streams_archive_into_file_object(self, m):
+        m.get(ARCHIVE_URL, content=read_fixture('scaffold.zip'))
+
+        with tempfile.TemporaryFile() as fileobj:
+            archive = self.gandalf.repository_archive('doge', 'master', fileobj=fileobj)
+            expect(archive.read('doge.txt')).to_equal(read_fixture('scaffold/doge.txt'))
+            expect(m.last_request.qs).to_equal({'ref': ['master'], 'format': ['zip']})
+
+    @requests_mock.Mocker()
+    def test_spools_big_streamed_archives_to_disk(self, m):
+        m.get(ARCHIVE_URL, content=make_tar([('doge-master/much.txt', b'MUCH WOW' * 100)]))
+        self.gandalf.archive_spool_size = 100
+
+        archive = self.gandalf.repository_archive('doge', 'master', format='tar', stream=True)
+
+        expect(archive.fileobj._rolled).to_be_true()
+        expect(archive.extractfile('doge-master/much.txt').read()).to_equal(b'MUCH WOW' * 100)
+
+    @requests_mock.Mocker()
+    def test_raw_streamed_archive_returns_file_object(self, m):
+        m.get(ARCHIVE_URL, content=b'zip-content')
+
+        content = self.gandalf.repository_archive('doge', 'master', raw=True, stream=True)
+
+        expect(content.read()).to_equal(b'zip-content')
+
+
+class TestArchiveMembers(TestCase):
+
+    def setUp(self):
+        self.gandalf = client.GandalfClient('localhost', 8001, requests.request)
+        self.gandalf.chunk_size = 1024
+
+    @requests_mock.Mocker()
+    def test_yields_members_while_downloading(self, m):
+        body = io.BytesIO(make_tar([
+            ('doge-master/doge.txt', b'VERY COMMIT' * 1000),
+            ('doge-master/much.txt', b'MUCH WOW' * 1000),
+        ]))
+        m.get(ARCHIVE_URL, body=body)
+
+        members = self.gandalf.repository_archive_members('doge', 'master')
+        member, fileobj = next(members)
+        expect(member.name).to_equal('doge-master/doge.txt')
+        expect(fileobj.read()).to_equal(b'VERY COMMIT' * 1000)
+        expect(body.tell()).to_be_lesser_than(len(body.getvalue()))
+
+        member, fileobj = next(members)
+        expect(member.name).to_equal('doge-master/much.txt')
+        expect(fileobj.read()).to_equal(b'MUCH WOW' * 1000)
+        expect(list(members)).to_be_empty()
+        expect(m.last_request.qs).to_equal({'ref': ['master'], 'format': ['tar']})
+
+
+class TestCachedArchive(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.gandalf = client.GandalfClient(
+            'localhost', 8001, requests.request, archive_cache=ArchiveCache(self.directory)
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def mock_refs(self, m):
+        m.get('http://localhost:8001/repository/doge/branches', json=[{'name': 'master', 'ref': MASTER}])
+        m.get('http://localhost:8001/repository/doge/tags', json=[])
+
+    @requests_mock.Mocker()
+    def test_archives_are_downloaded_once_per_commit(self, m):
+        self.mock_refs(m)
+        archive = m.get(ARCHIVE_URL, content=read_fixture('scaffold.zip'))
+
+        for ref in ('master', MASTER):
+            zip_ = self.gandalf.repository_cached_archive('doge', ref)
+            expect(zip_.fp).to_be_instance_of(mmap.mmap)
+            expect(zip_.read('doge.txt')).to_equal(read_fixture('scaffold/doge.txt'))
+
+        expect(archive.call_count).to_equal(1)
+        expect(archive.last_request.qs).to_equal({'ref': [MASTER], 'format': ['zip']})
+
+    @requests_mock.Mocker()
+    def test_cached_tar_archives(self, m):
+        self.mock_refs(m)
+        m.get(ARCHIVE_URL, content=make_tar([('doge-%s/much.txt' % MASTER, b'MUCH WOW')]))
+
+        for _ in range(2):
+            tar = self.gandalf.repository_cached_archive('doge', 'master', format='tar')
+            expect(tar.extractfile('doge-%s/much.txt' % MASTER).read()).to_equal(b'MUCH WOW')
+
+    @requests_mock.Mocker()
+    def test_closing_archives_closes_their_memory_map(self, m):
+        self.mock_refs(m)
+        m.get(ARCHIVE_URL, content=read_fixture('scaffold.zip'))
+
+        with self.gandalf.repository_cached_archive('doge', 'master') as zip_:
+            mapped = zip_.fp
+        expect(mapped.closed).to_be_true()
+
+    @requests_mock.Mocker()
+    def test_failed_downloads_leave_no_temporary_file(self, m):
+        self.mock_refs(m)
+        m.get(ARCHIVE_URL, status_code=500, text='Internal error')
+
+        with expect.error_to_happen(GandalfException):
+            self.gandalf.repository_cached_archive('doge', 'master')
+
+        expect(os.listdir(os.path.join(self.directory, 'doge'))).to_be_empty()
+
+    @requests_mock.Mocker()
+    def test_refs_that_are_not_commits_are_not_cached(self, m):
+        self.mock_refs(m)
+        archive = m.get(ARCHIVE_URL, content=read_fixture('scaffold.zip'))
+
+        for _ in range(2):
+            self.gandalf.repository_cached_archive('doge', 'HEAD')
+
+        expect(archive.call_count).to_equal(2)
+
+
+class TestAsyncioStreamedArchive(unittest.IsolatedAsyncioTestCase, TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = start_stub_server()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    async def test_refuses_to_stream_archive_members(self):
+        http_client = asyncio_cli.AsyncioHTTPClient()
+        gandalf = asyncio_cli.AsyncioGandalfClient('localhost', self.server.server_address[1], http_client.fetch)
+
+        with expect.error_to_happen(TypeError):
+            gandalf.repository_archive_members('doge', 'master')
+        http_client.close()
+
+    async def test_failed_cached_downloads_leave_no_temporary_file(self):
+        server = FakeGandalfServer().start()
+        self.addCleanup(server.stop)
+        server.create_repository('doge')
+        commit = server.commit('doge', {'much.txt': 'MUCH WOW'})
+        server.fail(1, 500, 'repository_archive')
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        http_client = asyncio_cli.AsyncioHTTPClient()
+        gandalf = asyncio_cli.AsyncioGandalfClient(
+            'localhost', server.port, http_client.fetch, archive_cache=ArchiveCache(directory)
+        )
+
+        with expect.error_to_happen(GandalfException):
+            await gandalf.repository_cached_archive('doge', commit)
+        http_client.close()
+
+        expect(os.listdir(os.path.join(directory, 'doge'))).to_be_empty()
+
+    async def test_streams_archive_into_file_object(self):
+        http_client = asyncio_cli.AsyncioHTTPClient()
+        http_client.chunk_size = 16
+        gandalf = asyncio_cli.AsyncioGandalfClient('localhost', self.server.server_address[1], http_client.fetch)
+
+        with tempfile.TemporaryFile() as fileobj:
+            archive = await gandalf.repository_archive('doge', 'master', fileobj=fileobj)
+            expect(zipfile.is_zipfile(fileobj)).to_be_true()
+            expect(archive.read('much.txt')).to_equal(read_fixture('scaffold/much.txt'))
+        http_client.close()
+
+
+class TestTornadoStreamedArchive(unittest.IsolatedAsyncioTestCase, TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = start_stub_server()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.http_client = AsyncHTTPClient(force_instance=True)
+        self.gandalf = tornado_cli.AsyncTornadoGandalfClient(
+            'localhost', self.server.server_address[1], self.http_client.fetch
+        )
+
+    def tearDown(self):
+        self.http_client.close()
+
+    async def test_streams_archive_into_file_object(self):
+        with tempfile.TemporaryFile() as fileobj:
+            archive = await self.gandalf.repository_archive('doge', 'master', fileobj=fileobj)
+            expect(zipfile.is_zipfile(fileobj)).to_be_true()
+            expect(archive.read('much.txt')).to_equal(read_fixture('scaffold/much.txt'))
+
+    async def test_does_not_stream_error_bodies_into_file_object(self):
+        server = FakeGandalfServer().start()
+        self.addCleanup(server.stop)
+        server.create_repository('doge')
+        server.fail(1, 500, 'repository_archive')
+        gandalf = tornado_cli.AsyncTornadoGandalfClient('localhost', server.port, self.http_client.fetch)
+
+        with tempfile.TemporaryFile() as fileobj:
+            with expect.error_to_happen(GandalfException):
+                await gandalf.repository_archive('doge', 'master', fileobj=fileobj)
+            with expect.error_to_happen(GandalfException):
+                await gandalf.repository_archive('missing', 'master', fileobj=fileobj)
+            expect(fileobj.tell()).to_equal(0)
+
+    async def test_refuses_to_stream_archive_members(self):
+        with expect.error_to_happen(TypeError):
+            self.gandalf.repository_archive_members('doge', 'master')
+
+    async def test_spools_big_streamed_archives_to_disk(self):
+        self.gandalf.archive_spool_size = 100
+
+        archive = await self.gandalf.repository_archive('doge', 'master', stream=True)
+
+        expect(archive.fp._rolled).to_be_true()
+        expect(archive.read('much.txt')).to_equal(read_fixture('scaffold/much.txt'))
@@ -0,0 +1,143 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import asyncio
+import gc
+import json
+import unittest
+import weakref
+
+from preggy import expect
+
+from gandalf import GandalfException
+from gandalf.cache import BlobCache, RefCache
+import gandalf.asyncio_cli as client
+from tests.base import TestCase
+from tests.utils import start_stub_server
+
+
+class TestAsyncioGandalfClient(unittest.IsolatedAsyncioTestCase, TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = start_stub_server()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.server.connections = 0
+        self.server.bodies = []
+        self.http_client = client.AsyncioHTTPClient(max_connections=4)
+        self.gandalf = client.AsyncioGandalfClient(
+            'localhost', self.server.server_address[1], self.http_client.fetch
+        )
+
+    def tearDown(self):
+        self.http_client.close()
+
+    async def test_can_get_repository(self):
+        response = await self.gandalf.repository_get('doge')
+        expect(response).to_equal({'name': 'doge'})
+
+    async def test_get_repository_raise_exception_if_repository_doesnt_exist(self):
+        with expect.error_to_happen(GandalfException, message="repository not found (Gandalf server response HTTP 404)"):
+            await self.gandalf.repository_get('missing')
+
+    async def test_can_get_healthcheck_with_chunked_response(self):
+        response = await self.gandalf.healthcheck()
+        expect(response).to_be_true()
+
+    async def test_can_create_user(self):
+        created = await self.gandalf.user_new('rfloriano', {})
+        expect(created).to_be_true()
+        expect(self.server.bodies).to_equal([
+            (None, b'{"name": "rfloriano", "keys": {}}'),
+        ])
+
+    async def test_commit_sends_multipart_body(self):
+        await self.gandalf.repository_commit(
+            'doge', 'message', 'author', 'author@globo.com',
+            'committer', 'committer@globo.com', 'master', b'zip-content'
+        )
+        content_type, body = self.server.bodies[0]
+        body = body.decode('utf-8')
+        expect(content_type).to_include('multipart/form-data; boundary=')
+        expect(body).to_include('name="branch"\r\n\r\nmaster\r\n')
+        expect(body).to_include('filename="zipfile"')
+        expect(body).to_include('zip-content')
+
+    async def test_reuses_connections_between_calls(self):
+        for name in ('a', 'b', 'c'):
+            await self.gandalf.repository_get(name)
+        expect(self.server.connections).to_equal(1)
+
+    async def test_limits_concurrent_connections_per_host(self):
+        names = [str(i) for i in range(20)]
+        results = await asyncio.gather(*[self.gandalf.repository_get(name) for name in names])
+        expect([result['name'] for result in results]).to_equal(names)
+        expect(self.server.connections).to_be_lesser_or_equal_to(4)
+
+    async def test_cached_contents_are_looked_up_by_tree(self):
+        urls = []
+
+        async def fetch(url, **kwargs):
+            urls.append(url)
+            if '/tree' in url:
+                body = json.dumps([{'path': 'README', 'filetype': 'blob', 'hash': 'e69de29b'}])
+            else:
+                body = 'MUCH WOW'
+            return client.AsyncioResponse(url, 200, {}, body.encode('utf-8'))
+
+        gandalf = client.AsyncioGandalfClient('localhost', 8001, fetch, blob_cache=BlobCache())
+        for ref in ('master', 'other-branch'):
+            content = await gandalf.repository_cached_contents('doge', 'README', ref)
+            expect(content).to_equal('MUCH WOW')
+
+        expect([url for url in urls if '/contents' in url]).to_length(1)
+        expect(urls).to_length(3)
+
+    async def test_pending_requests_are_not_garbage_collected(self):
+        waiters = []
+
+        async def fetch(url, **kwargs):
+            # Nothing but the request task itself references this future
+            waiter = asyncio.get_event_loop().create_future()
+            waiters.append(weakref.ref(waiter))
+            return await waiter
+
+        gandalf = client.AsyncioGandalfClient('localhost', 8001, fetch)
+        result = gandalf.repository_get('doge')
+        await asyncio.sleep(0)
+        gc.collect()
+
+        waiter = waiters[0]()
+        expect(waiter).not_to_be_null()
+        waiter.set_result(client.AsyncioResponse('', 200, {}, b'{"name": "doge"}'))
+        expect(await result).to_equal({'name': 'doge'})
+
+    async def test_requests_chained_by_callbacks_are_not_garbage_collected(self):
+        waiters = []
+
+        async def fetch(url, **kwargs):
+            if '/branches' in url:
+                return client.AsyncioResponse(url, 200, {}, b'[{"name": "master", "ref": "' + b'1' * 40 + b'"}]')
+            if '/tags' in url:
+                return client.AsyncioResponse(url, 200, {}, b'[]')
+            # Started by the callback resolving master, once the refs arrived
+            waiter = asyncio.get_event_loop().create_future()
+            waiters.append(weakref.ref(waiter))
+            return await waiter
+
+        gandalf = client.AsyncioGandalfClient('localhost', 8001, fetch, ref_cache=RefCache())
+        result = gandalf.repository_tree('doge', ref='master')
+        while not waiters:
+            await asyncio.sleep(0)
+        gc.collect()
+
+        waiter = waiters[0]()
+        expect(waiter).not_to_be_null()
+        waiter.set_result(client.AsyncioResponse('', 200, {}, b'[{"path": "doge.txt"}]'))
+        expect(await result).to_equal([{'path': 'doge.txt'}])
@@ -0,0 +1,212 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import asyncio
+import unittest
+
+from preggy import expect
+from tornado.httpclient import AsyncHTTPClient
+
+from gandalf import GandalfException
+import gandalf.asyncio_cli as asyncio_cli
+from gandalf.breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError
+import gandalf.client as client
+import gandalf.tornado_cli as tornado_cli
+from gandalf.testing import FakeGandalfServer
+from tests.base import TestCase
+
+
+class TestCircuitBreaker(TestCase):
+
+    def setUp(self):
+        self.now = 0
+        self.breaker = CircuitBreaker(
+            failure_rate=0.5, slow_call_duration=1, min_calls=4, window=10, open_timeout=30,
+            clock=lambda: self.now
+        )
+
+    def test_opens_when_failure_rate_is_reached(self):
+        for failed in (False, True, False):
+            self.breaker.record(failed, 0.1)
+        expect(self.breaker.before_call()).to_equal(CLOSED)
+
+        self.breaker.record(True, 0.1)
+        expect(self.breaker.before_call()).to_equal(OPEN)
+
+    def test_opens_when_slow_call_rate_is_reached(self):
+        for duration in (0.1, 2, 0.1, 3):
+            self.breaker.record(False, duration)
+
+        expect(self.breaker.state).to_equal(OPEN)
+
+    def test_only_counts_calls_in_the_window(self):
+        for _ in range(3):
+            self.breaker.record(True, 0.1)
+        self.now = 10
+        for _ in range(3):
+            self.breaker.record(False, 0.1)
+
+        expect(self.breaker.state).to_equal(CLOSED)
+        expect(self.breaker.calls).to_length(3)
+
+    def test_lets_one_caller_probe_once_open_timeout_passed(self):
+        for _ in range(4):
+            self.breaker.record(True, 0.1)
+
+        self.now = 29
+        expect(self.breaker.before_call()).to_equal(OPEN)
+        self.now = 30
+        expect(self.breaker.before_call()).to_equal(HALF_OPEN)
+        expect(self.breaker.before_call()).to_equal(OPEN)
+
+        self.breaker.probed(False)
+        expect(self.breaker.before_call()).to_equal(OPEN)
+        self.now = 60
+        expect(self.breaker.before_call()).to_equal(HALF_OPEN)
+        self.breaker.probed(True)
+        expect(self.breaker.before_call()).to_equal(CLOSED)
+
+    def test_lets_another_caller_probe_when_a_probe_is_not_reported(self):
+        for _ in range(4):
+            self.breaker.record(True, 0.1)
+
+        self.now = 30
+        expect(self.breaker.before_call()).to_equal(HALF_OPEN)
+        self.now = 34
+        expect(self.breaker.before_call()).to_equal(OPEN)
+        self.now = 35
+        expect(self.breaker.before_call()).to_equal(HALF_OPEN)
+        expect(self.breaker.before_call()).to_equal(OPEN)
+
+
+class TestGandalfClientCircuitBreaker(TestCase):
+
+    def setUp(self):
+        self.now = 0
+        self.server = FakeGandalfServer().start()
+        self.server.populate('doge', files=1)
+        self.breaker = CircuitBreaker(min_calls=2, open_timeout=30, clock=lambda: self.now)
+        self.gandalf = client.GandalfClient('localhost', self.server.port, breaker=self.breaker)
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_fails_fast_while_open_and_probes_with_healthcheck(self):
+        self.server.fail(2, 503)
+        for _ in range(2):
+            with expect.error_to_happen(GandalfException):
+                self.gandalf.repository_get('doge')
+
+        message = 'http://localhost:{0} is unavailable (circuit breaker open)'.format(self.server.port)
+        with expect.error_to_happen(CircuitOpenError, message=message):
+            self.gandalf.repository_get('doge')
+        expect(self.server.calls['repository_get']).to_equal(2)
+
+        self.now = 30
+        expect(self.gandalf.repository_get('doge')['name']).to_equal('doge')
+        expect(self.server.calls['healthcheck']).to_equal(1)
+        expect(self.breaker.state).to_equal(CLOSED)
+
+    def test_stays_open_when_probe_fails(self):
+        self.server.fail(3, None)
+        for _ in range(2):
+            expect(self.gandalf.user_delete('doge')).to_be_null()
+
+        self.now = 30
+        with expect.error_to_happen(CircuitOpenError):
+            self.gandalf.user_delete('doge')
+        expect(self.server.calls['healthcheck']).to_equal(1)
+        expect(self.server.calls['user_delete']).to_equal(2)
+        expect(self.breaker.state).to_equal(OPEN)
+
+    def test_client_errors_do_not_open_the_breaker(self):
+        for _ in range(3):
+            with expect.error_to_happen(GandalfException):
+                self.gandalf.repository_get('not-a-repository')
+
+        expect(self.breaker.state).to_equal(CLOSED)
+
+
+class TestAsyncGandalfClientCircuitBreaker(unittest.IsolatedAsyncioTestCase, TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = FakeGandalfServer().start()
+        cls.server.populate('doge', files=1)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def setUp(self):
+        self.now = 0
+        self.server.calls.clear()
+        self.breaker = CircuitBreaker(min_calls=2, open_timeout=30, clock=lambda: self.now)
+
+    async def test_asyncio_client_fails_fast_and_probes(self):
+        http_client = asyncio_cli.AsyncioHTTPClient()
+        gandalf = asyncio_cli.AsyncioGandalfClient(
+            'localhost', self.server.port, http_client.fetch, breaker=self.breaker
+        )
+        self.server.fail(2, 503)
+        for _ in range(2):
+            with expect.error_to_happen(GandalfException):
+                await gandalf.repository_get('doge')
+
+        with expect.error_to_happen(CircuitOpenError):
+            await gandalf.repository_get('doge')
+        self.now = 30
+        result = await gandalf.repository_get('doge')
+        http_client.close()
+
+        expect(result['name']).to_equal('doge')
+        expect(self.server.calls['repository_get']).to_equal(3)
+        expect(self.server.calls['healthcheck']).to_equal(1)
+
+    async def test_asyncio_client_reopens_the_breaker_when_a_probe_is_cancelled(self):
+        http_client = asyncio_cli.AsyncioHTTPClient()
+        gandalf = asyncio_cli.AsyncioGandalfClient(
+            'localhost', self.server.port, http_client.fetch, breaker=self.breaker
+        )
+        self.server.fail(2, 503)
+        for _ in range(2):
+            with expect.error_to_happen(GandalfException):
+                await gandalf.repository_get('doge')
+
+        self.now = 30
+        self.server.latency = lambda route: 0.5 if route == 'healthcheck' else 0
+        try:
+            with expect.error_to_happen(asyncio.TimeoutError):
+                await asyncio.wait_for(gandalf.repository_get('doge'), 0.05)
+        finally:
+            self.server.latency = 0
+        # Let the cancellation reach the probe
+        await asyncio.sleep(0.05)
+        expect(self.breaker.state).to_equal(OPEN)
+
+        self.now = 60
+        result = await gandalf.repository_get('doge')
+        http_client.close()
+
+        expect(result['name']).to_equal('doge')
+        expect(self.breaker.state).to_equal(CLOSED)
+
+    async def test_tornado_client_fails_fast_and_probes(self):
+        http_client = AsyncHTTPClient(force_instance=True)
+        gandalf = tornado_cli.AsyncTornadoGandalfClient(
+            'localhost', self.server.port, http_client.fetch, breaker=self.breaker
+        )
+        self.server.fail(2, 502)
+        for _ in range(2):
+            with expect.error_to_happen(GandalfException):
+                await gandalf.repository_tree('doge')
+
+        with expect.error_to_happen(CircuitOpenError):
+            await gandalf.repository_tree('doge')
+        self.now = 30
+        tree = await gandalf.repository_tree('doge')
+        http_client.close()
+
+        expect(tree).to_length(1)
+        expect(self.server.calls['repository_tree']).to_equal(3)
+        expect(self.server.calls['healthcheck']).to_equal(1)
@@ -0,0 +1,217 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import shutil
+import tempfile
+
+from preggy import expect
+import requests
+import requests_mock
+
+from gandalf.cache import BlobCache, LRUCache, RefCache
+import gandalf.client as client
+from tests.base import TestCase
+
+BLOB_HASH = 'cb508ee85be1e116233ae7c18e2d9bcc9553d209'
+IMG_HASH = '93e2c0ea4fa1d6e6ab3b7d1b4d48d1d9f1b2f0a1'
+MASTER = '6f3a27b391d65e0526acd152db9a1c3747791ff1'
+MASTER_MOVED = '9d2bc558ffbea2cac3800f764e7affa53f7dab73'
+TAG = 'c5545f629c01a7597c9d4f9d5b68626062551622'
+
+
+class TestLRUCache(TestCase):
+
+    def test_evicts_least_recently_used_items_over_budget(self):
+        cache = LRUCache(10)
+        cache.set('a', b'12345')
+        cache.set('b', b'12345')
+        cache.get('a')
+        cache.set('c', b'12345')
+
+        expect(cache.get('a')).to_equal(b'12345')
+        expect(cache.get('b')).to_be_null()
+        expect(cache.get('c')).to_equal(b'12345')
+        expect(cache.size).to_equal(10)
+
+    def test_ignores_values_bigger_than_budget(self):
+        cache = LRUCache(4)
+        cache.set('a', b'12345')
+        expect(cache).to_length(0)
+        expect(cache.size).to_equal(0)
+
+
+class TestBlobCache(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_reads_blobs_evicted_from_memory_from_disk(self):
+        cache = BlobCache(max_bytes=4, directory=self.directory)
+        cache.set(BLOB_HASH, b'FOO BAR\n')
+
+        expect(cache.memory).to_length(0)
+        expect(cache.get(BLOB_HASH)).to_equal(b'FOO BAR\n')
+        expect(BlobCache(directory=self.directory).get(BLOB_HASH)).to_equal(b'FOO BAR\n')
+
+    def test_returns_none_for_unknown_blobs(self):
+        cache = BlobCache(directory=self.directory)
+        expect(cache.get(BLOB_HASH)).to_be_null()
+        expect(BLOB_HASH in cache).to_be_false()
+
+
+class TestGandalfClientBlobCache(TestCase):
+
+    def setUp(self):
+        self.gandalf = client.GandalfClient('localhost', 8001, requests.request, blob_cache=BlobCache())
+
+    @requests_mock.Mocker()
+    def test_contents_by_hash_are_fetched_once(self, m):
+        m.get('http://localhost:8001/repository/doge/contents', text='FOO BAR\n')
+
+        content = self.gandalf.repository_contents_by_hash('doge', BLOB_HASH, 'some/path/doge.txt', 'master')
+        expect(content).to_equal('FOO BAR\n')
+        content = self.gandalf.repository_contents_by_hash('wow', BLOB_HASH, 'other.txt', '0.1.0')
+        expect(content).to_equal('FOO BAR\n')
+
+        expect(m.call_count).to_equal(1)
+
+    @requests_mock.Mocker()
+    def test_binary_contents_by_hash(self, m):
+        m.get('http://localhost:8001/repository/doge/contents', content=b'\xff\xd8\xff')
+
+        for _ in range(2):
+            content = self.gandalf.repository_contents_by_hash('doge', IMG_HASH, 'thumbnail.jpg')
+            expect(content).to_equal(b'\xff\xd8\xff')
+
+        expect(m.call_count).to_equal(1)
+
+    @requests_mock.Mocker()
+    def test_cached_contents_are_looked_up_by_tree(self, m):
+        m.get('http://localhost:8001/repository/doge/tree', json=[{
+            u'rawPath': u'some/path/doge.txt',
+            u'path': u'some/path/doge.txt',
+            u'filetype': u'blob',
+            u'hash': BLOB_HASH,
+            u'permission': u'100644'
+        }])
+        contents = m.get('http://localhost:8001/repository/doge/contents', text='FOO BAR\n')
+
+        for ref in ('master', 'other-branch'):
+            content = self.gandalf.repository_cached_contents('doge', '/some/path/doge.txt', ref)
+            expect(content).to_equal('FOO BAR\n')
+
+        expect(contents.call_count).to_equal(1)
+        expect(m.request_history[0].qs).to_equal({'ref': ['master'], 'path': ['some/path/doge.txt']})
+
+
+class TestGandalfClientRefCache(TestCase):
+
+    def setUp(self):
+        self.now = 0
+        self.ref_cache = RefCache(ttl=5, clock=lambda: self.now)
+        self.gandalf = client.GandalfClient('localhost', 8001, requests.request, ref_cache=self.ref_cache)
+
+    def mock_refs(self, m, master=MASTER):
+        m.get('http://localhost:8001/repository/doge/branches', json=[{'name': 'master', 'ref': master}])
+        m.get('http://localhost:8001/repository/doge/tags', json=[{'name': '0.1.0', 'ref': TAG}])
+
+    @requests_mock.Mocker()
+    def test_resolves_branches_and_tags(self, m):
+        self.mock_refs(m)
+
+        expect(self.gandalf.resolve_ref('doge', 'master')).to_equal(MASTER)
+        expect(self.gandalf.resolve_ref('doge', '0.1.0')).to_equal(TAG)
+        expect(self.gandalf.resolve_ref('doge', MASTER_MOVED)).to_equal(MASTER_MOVED)
+        expect(self.gandalf.resolve_ref('doge', 'HEAD')).to_equal('HEAD')
+        expect(m.call_count).to_equal(2)
+
+    @requests_mock.Mocker()
+    def test_reads_are_cached_by_resolved_commit(self, m):
+        self.mock_refs(m)
+        tree = m.get('http://localhost:8001/repository/doge/tree', json=[])
+
+        self.gandalf.repository_tree('doge', '/some/path', 'master')
+        self.gandalf.repository_tree('doge', path='/some/path', ref=MASTER)
+        expect(tree.call_count).to_equal(1)
+        expect(tree.last_request.qs['ref']).to_equal([MASTER])
+
+        self.now = 10
+        self.gandalf.repository_tree('doge', '/some/path', 'master')
+        expect(tree.call_count).to_equal(1)
+
+        self.mock_refs(m, master=MASTER_MOVED)
+        self.now = 20
+        self.gandalf.repository_tree('doge', '/some/path', 'master')
+        expect(tree.call_count).to_equal(2)
+        expect(tree.last_request.qs['ref']).to_equal([MASTER_MOVED])
+
+    @requests_mock.Mocker()
+    def test_cached_reads_are_copies(self, m):
+        self.mock_refs(m)
+        m.get('http://localhost:8001/repository/doge/tree', json=[{'path': 'doge.txt'}])
+
+        tree = self.gandalf.repository_tree('doge', ref='master')
+        tree.append({'path': 'changed.txt'})
+        cached = self.gandalf.repository_tree('doge', ref='master')
+        cached[0]['path'] = 'changed.txt'
+
+        expect(self.gandalf.repository_tree('doge', ref='master')).to_equal([{'path': 'doge.txt'}])
+
+    @requests_mock.Mocker()
+    def test_cached_reads_are_bounded_by_size(self, m):
+        self.ref_cache = RefCache(max_bytes=100)
+        self.gandalf = client.GandalfClient('localhost', 8001, requests.request, ref_cache=self.ref_cache)
+        self.mock_refs(m)
+        contents = m.get('http://localhost:8001/repository/doge/contents', text='x' * 60)
+
+        for path in ('a.txt', 'b.txt', 'a.txt'):
+            expect(self.gandalf.repository_contents('doge', path, 'master')).to_equal('x' * 60)
+
+        expect(contents.call_count).to_equal(3)
+        expect(self.ref_cache.results.size).to_equal(60)
+
+    @requests_mock.Mocker()
+    def test_cached_reads_are_sized_by_encoded_bytes(self, m):
+        self.mock_refs(m)
+        m.get('http://localhost:8001/repository/doge/contents', text=u'é' * 30)
+
+        self.gandalf.repository_contents('doge', 'a.txt', 'master')
+
+        expect(self.ref_cache.results.size).to_equal(60)
+
+    @requests_mock.Mocker()
+    def test_cached_refs_are_copies(self, m):
+        self.mock_refs(m)
+
+        refs = self.gandalf.repository_refs('doge')
+        refs['master'] = MASTER_MOVED
+
+        expect(self.gandalf.repository_refs('doge')['master']).to_equal(MASTER)
+        expect(m.call_count).to_equal(2)
+
+    @requests_mock.Mocker()
+    def test_cache_is_keyed_by_server(self, m):
+        self.mock_refs(m)
+        m.get('http://localhost:8002/repository/doge/branches', json=[{'name': 'master', 'ref': MASTER_MOVED}])
+        m.get('http://localhost:8002/repository/doge/tags', json=[])
+        m.get('http://localhost:8001/repository/doge/tree', json=[{'path': 'doge.txt'}])
+        m.get('http://localhost:8002/repository/doge/tree', json=[{'path': 'much.txt'}])
+        other = client.GandalfClient('localhost', 8002, requests.request, ref_cache=self.ref_cache)
+
+        expect(self.gandalf.resolve_ref('doge', 'master')).to_equal(MASTER)
+        expect(other.resolve_ref('doge', 'master')).to_equal(MASTER_MOVED)
+        expect(self.gandalf.repository_tree('doge', ref=MASTER)).to_equal([{'path': 'doge.txt'}])
+        expect(other.repository_tree('doge', ref=MASTER)).to_equal([{'path': 'much.txt'}])
+
+    @requests_mock.Mocker()
+    def test_unknown_refs_are_not_cached(self, m):
+        self.mock_refs(m)
+        log = m.get('http://localhost:8001/repository/doge/logs', json={'commits': [], 'next': ''})
+
+        for _ in range(2):
+            expect(self.gandalf.repository_log('doge', 'HEAD', 1)).to_equal({'commits': [], 'next': ''})
+        expect(log.call_count).to_equal(2)
+        expect(log.last_request.qs['ref']).to_equal(['head'])
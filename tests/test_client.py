@@ -6,13 +6,6 @@ import os
 import tempfile
 import shutil
 
-try:
-    from StringIO import StringIO
-    IO = StringIO
-except ImportError:
-    from io import BytesIO
-    IO = BytesIO
-
 from preggy import expect
 import requests
 import requests_mock
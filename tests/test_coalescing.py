@@ -0,0 +1,141 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import asyncio
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from preggy import expect
+from tornado.httpclient import AsyncHTTPClient
+
+import gandalf.asyncio_cli as asyncio_cli
+import gandalf.client as client
+from gandalf.coalescing import SingleFlight
+import gandalf.tornado_cli as tornado_cli
+from gandalf.testing import FakeGandalfServer
+from tests.base import TestCase
+
+
+class TestSingleFlight(TestCase):
+
+    def setUp(self):
+        self.flights = SingleFlight()
+        self.calls = []
+        self.release = threading.Event()
+
+    def slow_call(self, result):
+        def call():
+            self.calls.append(result)
+            self.release.wait(5)
+            if isinstance(result, Exception):
+                raise result
+            return result
+        return call
+
+    def test_concurrent_callers_share_one_call(self):
+        with ThreadPoolExecutor(4) as executor:
+            futures = [executor.submit(self.flights.call, 'key', self.slow_call(1)) for _ in range(4)]
+            while not self.calls:
+                pass
+            self.release.set()
+            results = [future.result() for future in futures]
+
+        expect(results).to_equal([1, 1, 1, 1])
+        expect(self.calls).to_length(1)
+        expect(self.flights).to_length(0)
+
+    def test_callers_get_the_error_of_the_shared_call(self):
+        with ThreadPoolExecutor(2) as executor:
+            futures = [executor.submit(self.flights.call, 'key', self.slow_call(ValueError('boom'))) for _ in range(2)]
+            while not self.calls:
+                pass
+            self.release.set()
+            for future in futures:
+                with expect.error_to_happen(ValueError, message='boom'):
+                    future.result()
+
+        expect(self.calls).to_length(1)
+
+    def test_calls_with_other_keys_or_made_later_are_not_shared(self):
+        self.release.set()
+
+        expect(self.flights.call('a', self.slow_call(1))).to_equal(1)
+        expect(self.flights.call('a', self.slow_call(2))).to_equal(2)
+        expect(self.flights.call('b', self.slow_call(3))).to_equal(3)
+
+
+class TestGandalfClientCoalescing(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = FakeGandalfServer(latency=0.2).start()
+        cls.server.populate('doge', files=1)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def setUp(self):
+        self.server.calls.clear()
+
+    def test_concurrent_identical_reads_share_one_request(self):
+        gandalf = client.GandalfClient('localhost', self.server.port, coalesce=True)
+
+        with ThreadPoolExecutor(5) as executor:
+            repositories = list(executor.map(lambda _: gandalf.repository_get('doge'), range(5)))
+
+        expect(self.server.calls['repository_get']).to_equal(1)
+        expect(set(repository['name'] for repository in repositories)).to_equal({'doge'})
+        # Every caller decodes its own copy of the response
+        expect(repositories[0] is repositories[1]).to_be_false()
+
+    def test_does_not_share_writes(self):
+        gandalf = client.GandalfClient('localhost', self.server.port, coalesce=True)
+
+        with ThreadPoolExecutor(2) as executor:
+            list(executor.map(lambda _: gandalf.user_delete('not-a-user'), range(2)))
+
+        expect(self.server.calls['user_delete']).to_equal(2)
+
+
+class TestAsyncGandalfClientCoalescing(unittest.IsolatedAsyncioTestCase, TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = FakeGandalfServer(latency=0.2).start()
+        cls.server.populate('doge', files=1)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def setUp(self):
+        self.server.calls.clear()
+
+    async def test_asyncio_client_shares_identical_reads(self):
+        http_client = asyncio_cli.AsyncioHTTPClient()
+        gandalf = asyncio_cli.AsyncioGandalfClient('localhost', self.server.port, http_client.fetch, coalesce=True)
+
+        cancelled = asyncio.ensure_future(gandalf.repository_branches('doge'))
+        calls = [gandalf.repository_branches('doge') for _ in range(4)]
+        await asyncio.sleep(0.05)
+        cancelled.cancel()
+        branches = await asyncio.gather(*calls)
+        http_client.close()
+
+        expect(self.server.calls['repository_branches']).to_equal(1)
+        expect([len(result) for result in branches]).to_equal([1, 1, 1, 1])
+        expect(gandalf.flights).to_length(0)
+
+    async def test_tornado_client_shares_identical_reads(self):
+        http_client = AsyncHTTPClient(force_instance=True)
+        gandalf = tornado_cli.AsyncTornadoGandalfClient(
+            'localhost', self.server.port, http_client.fetch, coalesce=True
+        )
+
+        repositories = await asyncio.gather(*[gandalf.repository_get('doge') for _ in range(4)])
+        http_client.close()
+
+        expect(self.server.calls['repository_get']).to_equal(1)
+        expect(set(repository['name'] for repository in repositories)).to_equal({'doge'})
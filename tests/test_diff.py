@@ -0,0 +1,155 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from preggy import expect
+from tornado.httpclient import AsyncHTTPClient
+
+import gandalf.asyncio_cli as asyncio_cli
+import gandalf.client as client
+from gandalf.diff import ADDED, DELETED, MODIFIED, RENAMED, DiffParser
+import gandalf.tornado_cli as tornado_cli
+from gandalf.testing import FakeGandalfServer
+from tests.base import TestCase
+
+DIFF = b'''diff --git a/README.md b/README.md
+index 0123456..789abcd 100644
+--- a/README.md
++++ b/README.md
+@@ -1,3 +1,4 @@ Title
+ first
+--- not a header
++++ not a header either
+ last
++appended
+\\ No newline at end of file
+@@ -10 +11,0 @@
+-gone
+diff --git a/new file.txt b/new file.txt
+new file mode 100644
+index 0000000..e69de29
+--- /dev/null
++++ b/new file.txt
+@@ -0,0 +1 @@
++hello
+diff --git a/old.txt b/old.txt
+deleted file mode 100755
+index e69de29..0000000
+--- a/old.txt
++++ /dev/null
+@@ -1,2 +0,0 @@
+-one
+-two
+diff --git a/run.sh b/bin/run.sh
+old mode 100644
+new mode 100755
+similarity index 90%
+rename from run.sh
+rename to bin/run.sh
+diff --git a/logo.png b/logo.png
+index 1111111..2222222 100644
+Binary files a/logo.png and b/logo.png differ
+'''
+
+
+def parse(chunks):
+    parser = DiffParser()
+    files = []
+    for chunk in chunks:
+        files.extend(parser.feed(chunk))
+    return files + parser.close()
+
+
+class TestDiffParser(TestCase):
+
+    def test_parses_files_hunks_and_line_stats(self):
+        readme, new, old, script, logo = parse([DIFF])
+
+        expect(readme.path).to_equal('README.md')
+        expect(readme.status).to_equal(MODIFIED)
+        expect((readme.old_hash, readme.new_hash, readme.new_mode)).to_equal(('0123456', '789abcd', '100644'))
+        expect((readme.added, readme.removed)).to_equal((2, 2))
+        expect([hunk.header for hunk in readme.hunks]).to_equal(['@@ -1,3 +1,4 @@ Title', '@@ -10 +11,0 @@'])
+        expect([(hunk.old_start, hunk.old_count, hunk.new_start, hunk.new_count) for hunk in readme.hunks]).to_equal(
+            [(1, 3, 1, 4), (10, 1, 11, 0)]
+        )
+        expect([(hunk.added, hunk.removed) for hunk in readme.hunks]).to_equal([(2, 1), (0, 1)])
+
+        expect((new.status, new.old_path, new.new_path, new.new_mode)).to_equal(
+            (ADDED, None, 'new file.txt', '100644')
+        )
+        expect((new.added, new.removed)).to_equal((1, 0))
+        expect((old.status, old.path, old.new_path, old.old_mode, old.removed)).to_equal(
+            (DELETED, 'old.txt', None, '100755', 2)
+        )
+        expect((script.status, script.old_path, script.new_path)).to_equal((RENAMED, 'run.sh', 'bin/run.sh'))
+        expect((script.old_mode, script.new_mode, script.hunks)).to_equal(('100644', '100755', []))
+        expect((logo.binary, logo.added)).to_equal((True, 0))
+
+    def test_parses_diffs_split_in_any_chunks(self):
+        whole = [(f.path, f.status, f.added, f.removed, len(f.hunks)) for f in parse([DIFF])]
+        bytewise = [(f.path, f.status, f.added, f.removed, len(f.hunks)) for f in parse(
+            DIFF[i:i + 1] for i in range(len(DIFF))
+        )]
+
+        expect(bytewise).to_equal(whole)
+
+    def test_returns_files_as_soon_as_they_are_complete(self):
+        parser = DiffParser()
+
+        expect(parser.feed(DIFF[:DIFF.index(b'diff --git a/new')])).to_be_empty()
+        expect([f.path for f in parser.feed(b'diff --git a/x b/x\n')]).to_equal(['README.md'])
+        expect([f.path for f in parser.close()]).to_equal(['x'])
+
+
+class DiffTestCase(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = FakeGandalfServer().start()
+        cls.server.create_repository('doge', files={'a.txt': 'one\ntwo\n', 'b.txt': 'b\n'})
+        cls.server.tag('doge', 'first')
+        cls.server.commit('doge', {'a.txt': 'one\n2\nthree\n', 'b.txt': None, 'c.txt': 'c\n'})
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def expect_files(self, files):
+        expect([(f.path, f.status, f.added, f.removed) for f in files]).to_equal([
+            ('a.txt', MODIFIED, 2, 1),
+            ('b.txt', DELETED, 0, 1),
+            ('c.txt', ADDED, 1, 0),
+        ])
+
+
+class TestGandalfClientDiffFiles(DiffTestCase):
+
+    def test_yields_files_while_downloading_the_diff(self):
+        gandalf = client.GandalfClient('localhost', self.server.port)
+        gandalf.chunk_size = 16
+
+        files = gandalf.repository_diff_files('doge', 'first', 'master')
+
+        expect(next(files).path).to_equal('a.txt')
+        self.expect_files(list(gandalf.repository_diff_files('doge', 'first', 'master')))
+
+
+class TestAsyncGandalfClientDiffFiles(unittest.IsolatedAsyncioTestCase, DiffTestCase):
+
+    async def test_asyncio_client_refuses_to_stream_the_diff(self):
+        http_client = asyncio_cli.AsyncioHTTPClient()
+        gandalf = asyncio_cli.AsyncioGandalfClient('localhost', self.server.port, http_client.fetch)
+
+        with expect.error_to_happen(TypeError):
+            gandalf.repository_diff_files('doge', 'first', 'master')
+        http_client.close()
+
+    async def test_tornado_client_refuses_to_stream_the_diff(self):
+        http_client = AsyncHTTPClient(force_instance=True)
+        gandalf = tornado_cli.AsyncTornadoGandalfClient('localhost', self.server.port, http_client.fetch)
+
+        with expect.error_to_happen(TypeError):
+            gandalf.repository_diff_files('doge', 'first', 'master')
+        http_client.close()
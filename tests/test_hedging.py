@@ -0,0 +1,155 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import asyncio
+import time
+import unittest
+
+from preggy import expect
+from tornado.httpclient import AsyncHTTPClient
+
+import gandalf.asyncio_cli as asyncio_cli
+from gandalf.hedging import HedgePolicy
+from gandalf.metrics import GandalfMetrics
+from gandalf.retry import RetryBudget
+import gandalf.tornado_cli as tornado_cli
+from gandalf.testing import FakeGandalfServer
+from tests.base import TestCase
+
+
+def slow_first_request(seconds):
+    calls = []
+
+    def latency(route):
+        calls.append(route)
+        return seconds if len(calls) == 1 else 0
+    return latency
+
+
+class TestHedgePolicy(TestCase):
+
+    def test_uses_the_default_delay_until_enough_latencies_are_known(self):
+        hedge = HedgePolicy(delay=0.5, min_samples=3, percentile=50)
+        hedge.record('repository_tree', 0.1)
+        hedge.record('repository_tree', 0.3)
+
+        expect(hedge.delay('repository_tree')).to_equal(0.5)
+        hedge.record('repository_tree', 0.2)
+        expect(hedge.delay('repository_tree')).to_equal(0.2)
+        expect(hedge.delay('repository_contents')).to_equal(0.5)
+
+    def test_hedges_after_the_percentile_of_recent_latencies(self):
+        hedge = HedgePolicy(min_samples=10, window=100, percentile=95)
+        for latency in range(200):
+            hedge.record('repository_tree', latency / 1000.0)
+
+        expect(hedge.delay('repository_tree')).to_equal(0.195)
+
+    def test_hedged_requests_are_limited_by_the_budget(self):
+        hedge = HedgePolicy(budget=RetryBudget(ratio=0.5, min_tokens=0))
+
+        hedge.delay('repository_tree')
+        expect(hedge.allow()).to_be_false()
+        hedge.delay('repository_tree')
+        expect(hedge.allow()).to_be_true()
+
+
+class TestAsyncGandalfClientHedging(unittest.IsolatedAsyncioTestCase, TestCase):
+
+    def setUp(self):
+        self.server = FakeGandalfServer(latency=slow_first_request(1)).start()
+        self.server.populate('doge', files=1)
+        self.hedge = HedgePolicy(delay=0.05)
+
+    def tearDown(self):
+        self.server.stop()
+
+    async def test_asyncio_client_hedges_slow_reads(self):
+        http_client = asyncio_cli.AsyncioHTTPClient()
+        gandalf = asyncio_cli.AsyncioGandalfClient('localhost', self.server.port, http_client.fetch, hedge=self.hedge)
+
+        started = time.time()
+        tree = await gandalf.repository_tree('doge')
+        elapsed = time.time() - started
+        http_client.close()
+
+        expect(tree).to_length(1)
+        expect(elapsed).to_be_lesser_than(0.5)
+        expect(self.server.calls['repository_tree']).to_equal(2)
+        expect(list(self.hedge.latencies['repository_tree'])).to_length(1)
+
+    async def test_asyncio_client_does_not_hedge_other_routes(self):
+        http_client = asyncio_cli.AsyncioHTTPClient()
+        gandalf = asyncio_cli.AsyncioGandalfClient(
+            'localhost', self.server.port, http_client.fetch, hedge=HedgePolicy(delay=0.05, routes=())
+        )
+
+        await gandalf.repository_tree('doge')
+        http_client.close()
+
+        expect(self.server.calls['repository_tree']).to_equal(1)
+
+    async def test_tornado_client_hedges_slow_reads(self):
+        http_client = AsyncHTTPClient(force_instance=True)
+        gandalf = tornado_cli.AsyncTornadoGandalfClient(
+            'localhost', self.server.port, http_client.fetch, hedge=self.hedge
+        )
+
+        started = time.time()
+        content = await gandalf.repository_contents('doge', 'dir0/file0.txt')
+        elapsed = time.time() - started
+
+        expect(content).not_to_be_null()
+        expect(elapsed).to_be_lesser_than(0.5)
+        expect(self.server.calls['repository_contents']).to_equal(2)
+        http_client.close()
+
+    async def test_tornado_client_ends_the_request_of_the_losing_attempt(self):
+        http_client = AsyncHTTPClient(force_instance=True)
+        metrics = GandalfMetrics()
+        gandalf = tornado_cli.AsyncTornadoGandalfClient(
+            'localhost', self.server.port, http_client.fetch, hedge=self.hedge, observers=[metrics]
+        )
+        labels = ('repository_tree', '/repository/:name/tree')
+
+        await gandalf.repository_tree('doge')
+        # The slow attempt finishes after the hedged one
+        for _ in range(50):
+            if metrics.requests.get(*labels + ('200',)) == 2:
+                break
+            await asyncio.sleep(0.05)
+        http_client.close()
+
+        expect(metrics.requests.get(*labels + ('200',))).to_equal(2)
+        expect(metrics.in_flight.get(*labels)).to_equal(0)
+
+
+class TestAsyncGandalfClientHedgingPool(unittest.IsolatedAsyncioTestCase, TestCase):
+
+    def setUp(self):
+        self.servers = [FakeGandalfServer(latency=slow_first_request(1)).start(), FakeGandalfServer().start()]
+        self.servers[1].gandalf = self.servers[0].gandalf
+        self.servers[0].populate('doge', files=1)
+
+    def tearDown(self):
+        for server in self.servers:
+            server.stop()
+
+    async def test_hedged_request_goes_to_another_server(self):
+        http_client = asyncio_cli.AsyncioHTTPClient()
+        gandalf = asyncio_cli.AsyncioGandalfClient.for_servers(
+            [('localhost', server.port) for server in self.servers], http_client.fetch,
+            hedge=HedgePolicy(delay=0.05)
+        )
+        first, second = gandalf.pool.endpoints
+        # The second server looks busy so the first one is tried first
+        gandalf.pool.started(second)
+
+        tree = await gandalf.repository_tree('doge')
+        http_client.close()
+
+        expect(tree).to_length(1)
+        expect(self.servers[0].calls['repository_tree']).to_equal(1)
+        expect(self.servers[1].calls['repository_tree']).to_equal(1)
+        expect(first.outstanding).to_equal(0)
+        expect(second.outstanding).to_equal(1)
@@ -0,0 +1,169 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import socket
+import unittest
+
+from preggy import expect
+from tornado.httpclient import AsyncHTTPClient
+
+from gandalf import GandalfException
+import gandalf.asyncio_cli as asyncio_cli
+import gandalf.client as client
+from gandalf.instrumentation import RequestObserver
+import gandalf.tornado_cli as tornado_cli
+from gandalf.testing import FakeGandalfServer
+from tests.base import TestCase
+
+
+class RecordingObserver(RequestObserver):
+    def __init__(self):
+        self.started = []
+        self.finished = []
+
+    def request_started(self, info):
+        self.started.append(info)
+
+    def request_finished(self, info):
+        self.finished.append(info)
+
+
+class BrokenObserver(RequestObserver):
+    def request_finished(self, info):
+        raise ValueError('much broken')
+
+
+def free_port():
+    sock = socket.socket()
+    sock.bind(('localhost', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+class TestRequestObservers(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = FakeGandalfServer().start()
+        cls.server.populate('doge', files=10, size=100)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def setUp(self):
+        self.observer = RecordingObserver()
+        self.gandalf = client.GandalfClient('localhost', self.server.port, observers=[self.observer])
+
+    def test_reports_route_status_sizes_and_timings(self):
+        result = self.gandalf.repository_get('doge')
+
+        expect(self.observer.started).to_length(1)
+        expect(self.observer.finished).to_equal(self.observer.started)
+        info = self.observer.finished[0]
+        expect(info.name).to_equal('repository_get')
+        expect(info.route).to_equal('/repository/:name')
+        expect(info.http_method).to_equal('GET')
+        expect(info.status).to_equal(200)
+        expect(info.bytes_sent).to_equal(0)
+        expect(info.bytes_received).to_equal(len(client.json.dumps(result)))
+        expect(info.error).to_be_null()
+        expect(sorted(info.timings)).to_equal(['decode', 'total', 'ttfb'])
+
+    def test_reports_request_body_size(self):
+        self.gandalf.repository_commit(
+            'doge', 'Much commit', 'Author', 'author@doge.com', 'Committer', 'committer@doge.com',
+            'master', {'wow.txt': b'WOW'}
+        )
+        self.gandalf.user_new('instrumented', {})
+
+        commit, user_new = self.observer.finished
+        expect(commit.route).to_equal('/repository/:name/commit')
+        expect(commit.bytes_sent).to_be_null()
+        expect(user_new.bytes_sent).to_equal(len('{"name": "instrumented", "keys": {}}'))
+
+    def test_streamed_responses_are_sized_by_their_headers(self):
+        archive = self.gandalf.repository_archive('doge', 'master', stream=True)
+
+        info = self.observer.finished[0]
+        expect(info.route).to_equal('/repository/:name/archive')
+        archive.fp.seek(0, 2)
+        expect(info.bytes_received).to_equal(archive.fp.tell())
+
+    def test_reports_error_responses(self):
+        with expect.error_to_happen(GandalfException):
+            self.gandalf.repository_get('not-a-repository')
+
+        info = self.observer.finished[0]
+        expect(info.status).to_equal(404)
+        expect(info.error).to_be_instance_of(GandalfException)
+        expect(info.timings).to_include('decode')
+
+    def test_reports_transport_errors(self):
+        gandalf = client.GandalfClient('localhost', free_port(), observers=[self.observer])
+
+        expect(gandalf.user_delete('doge')).to_be_null()
+
+        info = self.observer.finished[0]
+        expect(info.name).to_equal('user_delete')
+        expect(info.status).to_be_null()
+        expect(info.error).not_to_be_null()
+        expect(info.timings).not_to_include('decode')
+
+    def test_broken_observers_do_not_break_requests(self):
+        self.gandalf.add_observer(BrokenObserver())
+
+        expect(self.gandalf.healthcheck()).to_be_true()
+        expect(self.observer.finished).to_length(1)
+
+
+class TestAsyncRequestObservers(unittest.IsolatedAsyncioTestCase, TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = FakeGandalfServer().start()
+        cls.server.populate('doge', files=10, size=100)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    async def test_asyncio_reports_connection_timings(self):
+        observer = RecordingObserver()
+        http_client = asyncio_cli.AsyncioHTTPClient()
+        gandalf = asyncio_cli.AsyncioGandalfClient(
+            'localhost', self.server.port, http_client.fetch, observers=[observer]
+        )
+
+        tree = await gandalf.repository_tree('doge')
+        await gandalf.repository_contents('doge', tree[0]['path'])
+        http_client.close()
+
+        first, second = observer.finished
+        expect(first.route).to_equal('/repository/:name/tree')
+        expect(sorted(first.timings)).to_equal(['connect', 'decode', 'total', 'ttfb'])
+        expect(second.route).to_equal('/repository/:name/contents')
+        expect(second.bytes_received).to_equal(100)
+        # The connection was reused
+        expect(second.timings).not_to_include('connect')
+
+    async def test_tornado_reports_requests(self):
+        observer = RecordingObserver()
+        http_client = AsyncHTTPClient(force_instance=True)
+        gandalf = tornado_cli.AsyncTornadoGandalfClient(
+            'localhost', self.server.port, http_client.fetch, observers=[observer]
+        )
+
+        await gandalf.repository_get('doge')
+        with expect.error_to_happen(GandalfException):
+            await gandalf.user_get_keys('not-a-user')
+        http_client.close()
+
+        repository, keys = observer.finished
+        expect(repository.route).to_equal('/repository/:name')
+        expect(repository.status).to_equal(200)
+        expect(repository.timings).to_include('decode')
+        expect(keys.name).to_equal('user_get_keys')
+        expect(keys.status).to_equal(404)
+        expect(keys.error).not_to_be_null()
@@ -0,0 +1,201 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import asyncio
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from preggy import expect
+from tornado import gen
+from tornado.httpclient import AsyncHTTPClient
+
+import gandalf.asyncio_cli as asyncio_cli
+import gandalf.client as client
+from gandalf.instrumentation import RequestObserver
+from gandalf.limits import Limit, MethodLimits
+from gandalf.session import PooledSession
+import gandalf.tornado_cli as tornado_cli
+from gandalf.testing import FakeGandalfServer
+from tests.base import TestCase
+
+
+class ConcurrencyProbe(object):
+    '''
+    Wraps a transport to record the highest number of concurrent requests.
+    '''
+
+    def __init__(self):
+        self.current = 0
+        self.highest = 0
+        self.lock = threading.Lock()
+
+    def enter(self):
+        with self.lock:
+            self.current += 1
+            self.highest = max(self.highest, self.current)
+
+    def exit(self):
+        with self.lock:
+            self.current -= 1
+
+    def wrap(self, transport):
+        def request(*args, **kwargs):
+            self.enter()
+            try:
+                return transport(*args, **kwargs)
+            finally:
+                self.exit()
+        return request
+
+    def wrap_async(self, transport):
+        async def request(*args, **kwargs):
+            self.enter()
+            try:
+                return await transport(*args, **kwargs)
+            finally:
+                self.exit()
+        return request
+
+    def wrap_tornado(self, transport):
+        @gen.coroutine
+        def request(*args, **kwargs):
+            self.enter()
+            try:
+                response = yield transport(*args, **kwargs)
+            finally:
+                self.exit()
+            raise gen.Return(response)
+        return request
+
+
+class QueueTimes(RequestObserver):
+
+    def __init__(self):
+        self.times = []
+
+    def request_finished(self, info):
+        self.times.append(info.timings['queue'])
+
+
+class TestLimit(TestCase):
+
+    def setUp(self):
+        self.now = 0
+        self.woken = []
+
+    def test_wakes_waiters_when_a_request_is_released(self):
+        limit = Limit(max_in_flight=1)
+
+        expect(limit.reserve(lambda: self.woken.append(1))).to_equal(0)
+        expect(limit.reserve(lambda: self.woken.append(2))).to_be_null()
+        expect(self.woken).to_be_empty()
+
+        limit.release()
+        expect(self.woken).to_equal([2])
+        expect(limit.reserve(lambda: self.woken.append(3))).to_equal(0)
+        expect(limit.in_flight).to_equal(1)
+
+    def test_limits_the_rate_with_a_token_bucket(self):
+        limit = Limit(rate=10, burst=2, clock=lambda: self.now)
+
+        expect(limit.reserve(None)).to_equal(0)
+        expect(limit.reserve(None)).to_equal(0)
+        expect(limit.reserve(None)).to_equal(0.1)
+        self.now = 0.05
+        expect(limit.reserve(None)).to_equal(0.05)
+        self.now = 0.1
+        expect(limit.reserve(None)).to_equal(0)
+
+    def test_method_limits_split_reads_and_writes(self):
+        reads, writes = Limit(max_in_flight=10), Limit(max_in_flight=1)
+        limits = MethodLimits(reads=reads, writes=writes)
+
+        expect(limits.for_method('get')).to_equal(reads)
+        expect(limits.for_method('HEAD')).to_equal(reads)
+        expect(limits.for_method('POST')).to_equal(writes)
+        expect(MethodLimits(reads=reads).for_method('DELETE')).to_be_null()
+
+
+class TestGandalfClientLimits(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = FakeGandalfServer(latency=0.05).start()
+        cls.server.populate('doge', files=1)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def test_bounds_the_requests_in_flight(self):
+        probe, queue_times = ConcurrencyProbe(), QueueTimes()
+        limit = Limit(max_in_flight=2)
+        gandalf = client.GandalfClient(
+            'localhost', self.server.port, probe.wrap(PooledSession()), observers=[queue_times], limit=limit
+        )
+
+        with ThreadPoolExecutor(6) as executor:
+            repositories = list(executor.map(lambda _: gandalf.repository_get('doge'), range(6)))
+
+        expect(repositories).to_length(6)
+        expect(probe.highest).to_equal(2)
+        expect(limit.in_flight).to_equal(0)
+        expect(limit.queued).to_equal(0)
+        expect(limit.throttled).to_be_greater_than(0)
+        expect(max(queue_times.times)).to_be_greater_than(0.04)
+
+    def test_limits_the_request_rate(self):
+        gandalf = client.GandalfClient('localhost', self.server.port, limit=Limit(rate=50, burst=1))
+
+        started = time.time()
+        for _ in range(5):
+            gandalf.healthcheck()
+
+        expect(time.time() - started).to_be_greater_than(0.08)
+
+
+class TestAsyncGandalfClientLimits(unittest.IsolatedAsyncioTestCase, TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = FakeGandalfServer(latency=0.05).start()
+        cls.server.populate('doge', files=1)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    async def test_asyncio_client_bounds_the_requests_in_flight(self):
+        probe = ConcurrencyProbe()
+        http_client = asyncio_cli.AsyncioHTTPClient()
+        limit = Limit(max_in_flight=3)
+        gandalf = asyncio_cli.AsyncioGandalfClient(
+            'localhost', self.server.port, probe.wrap_async(http_client.fetch), limit=limit
+        )
+
+        trees = await asyncio.gather(*[gandalf.repository_tree('doge') for _ in range(10)])
+        http_client.close()
+
+        expect(trees).to_length(10)
+        expect(probe.highest).to_equal(3)
+        expect(limit.in_flight).to_equal(0)
+        expect(limit.queued).to_equal(0)
+
+    async def test_tornado_client_limits_writes_separately(self):
+        probe = ConcurrencyProbe()
+        http_client = AsyncHTTPClient(force_instance=True)
+        gandalf = tornado_cli.AsyncTornadoGandalfClient(
+            'localhost', self.server.port, probe.wrap_tornado(http_client.fetch),
+            limit=MethodLimits(writes=Limit(max_in_flight=1))
+        )
+
+        await asyncio.gather(*[gandalf.user_new('limited-{0}'.format(i), {}) for i in range(4)])
+        writes = probe.highest
+        probe.highest = 0
+        await asyncio.gather(*[gandalf.repository_get('doge') for _ in range(4)])
+        http_client.close()
+
+        expect(writes).to_equal(1)
+        expect(probe.highest).to_be_greater_than(1)
@@ -0,0 +1,122 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import itertools
+import unittest
+
+from preggy import expect
+from tornado.httpclient import AsyncHTTPClient
+
+import gandalf.asyncio_cli as asyncio_cli
+import gandalf.client as client
+import gandalf.tornado_cli as tornado_cli
+from gandalf.testing import FakeGandalfServer
+from tests.base import TestCase
+
+COMMITS = 40
+
+
+def messages(commits):
+    return [commit['subject'] for commit in commits]
+
+
+class LogTestCase(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = FakeGandalfServer().start()
+        cls.server.create_repository('history')
+        for number in range(COMMITS):
+            files = {'counter.txt': str(number)}
+            if number % 5 == 0:
+                files['notes.txt'] = 'note {0}'.format(number)
+            cls.server.commit('history', files, message='Commit {0}'.format(number))
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def setUp(self):
+        self.server.calls.clear()
+
+    def expected(self, numbers):
+        return ['Commit {0}'.format(number) for number in numbers]
+
+
+class TestGandalfClientHistory(LogTestCase):
+
+    def test_pages_through_the_whole_history_in_growing_pages(self):
+        gandalf = client.GandalfClient('localhost', self.server.port)
+
+        commits = list(gandalf.repository_history('history'))
+
+        expect(messages(commits)).to_equal(self.expected(reversed(range(COMMITS))))
+        # Pages of 10, 20 and 40 commits
+        expect(self.server.calls['repository_log']).to_equal(3)
+
+    def test_only_fetches_the_pages_iterated_over(self):
+        gandalf = client.GandalfClient('localhost', self.server.port)
+
+        commits = list(itertools.islice(gandalf.repository_history('history', page_size=4), 5))
+
+        expect(messages(commits)).to_equal(self.expected(range(39, 34, -1)))
+        expect(self.server.calls['repository_log']).to_equal(2)
+
+    def test_caps_the_page_size(self):
+        gandalf = client.GandalfClient('localhost', self.server.port)
+
+        commits = list(gandalf.repository_history('history', 'master', page_size=4, max_page_size=8))
+
+        expect(commits).to_length(COMMITS)
+        # 4 + 8 * 5 commits, the last page is short
+        expect(self.server.calls['repository_log']).to_equal(6)
+
+    def test_filters_commits_by_path(self):
+        gandalf = client.GandalfClient('localhost', self.server.port)
+
+        commits = list(gandalf.repository_history('history', path='notes.txt', page_size=2))
+
+        expect(messages(commits)).to_equal(self.expected(range(35, -1, -5)))
+
+
+class TestAsyncGandalfClientHistory(unittest.IsolatedAsyncioTestCase, LogTestCase):
+
+    async def test_asyncio_client_pages_through_the_history(self):
+        http_client = asyncio_cli.AsyncioHTTPClient()
+        gandalf = asyncio_cli.AsyncioGandalfClient('localhost', self.server.port, http_client.fetch)
+
+        commits = [commit async for commit in gandalf.repository_history('history', path='notes.txt')]
+        first = []
+        async for commit in gandalf.repository_history('history', page_size=2):
+            first.append(commit)
+            if len(first) == 3:
+                break
+        http_client.close()
+
+        expect(messages(commits)).to_equal(self.expected(range(35, -1, -5)))
+        expect(messages(first)).to_equal(self.expected([39, 38, 37]))
+        expect(self.server.calls['repository_log']).to_equal(3)
+
+    async def test_tornado_client_pages_through_the_history(self):
+        http_client = AsyncHTTPClient(force_instance=True)
+        gandalf = tornado_cli.AsyncTornadoGandalfClient('localhost', self.server.port, http_client.fetch)
+
+        commits = [commit async for commit in gandalf.repository_history('history', page_size=3)]
+        http_client.close()
+
+        expect(messages(commits)).to_equal(self.expected(reversed(range(COMMITS))))
+        expect(self.server.calls['repository_log']).to_equal(4)
+
+    async def test_asynchronous_clients_refuse_synchronous_iteration(self):
+        http_client = asyncio_cli.AsyncioHTTPClient()
+        gandalf = asyncio_cli.AsyncioGandalfClient('localhost', self.server.port, http_client.fetch)
+
+        history = gandalf.repository_history('history', page_size=3)
+        with expect.error_to_happen(TypeError):
+            list(history)
+        # Nothing was requested, the iterator still works
+        commits = [commit async for commit in history]
+        http_client.close()
+
+        expect(commits).to_length(COMMITS)
+        expect(self.server.calls['repository_log']).to_equal(4)
@@ -0,0 +1,128 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+from preggy import expect
+
+from gandalf import GandalfException
+import gandalf.client as client
+from gandalf.metrics import GandalfMetrics, MetricsRegistry
+from gandalf.testing import FakeGandalfServer
+from tests.base import TestCase
+
+
+class TestMetricsRegistry(TestCase):
+
+    def test_renders_prometheus_text_format(self):
+        registry = MetricsRegistry()
+        counter = registry.counter('doge_total', 'Much doges.', ('name',))
+        gauge = registry.gauge('wow', 'Very wow.')
+        histogram = registry.histogram('latency_seconds', 'Such latency.', ('name',), buckets=(0.1, 1))
+
+        counter.inc(('a "quoted"\nname',))
+        counter.inc(('b',), 2)
+        gauge.inc()
+        gauge.dec(amount=3)
+        histogram.observe(0.05, ('b',))
+        histogram.observe(0.5, ('b',))
+        histogram.observe(5, ('b',))
+
+        expect(registry.render()).to_equal(
+            '# HELP doge_total Much doges.\n'
+            '# TYPE doge_total counter\n'
+            'doge_total{name="a \\"quoted\\"\\nname"} 1\n'
+            'doge_total{name="b"} 2\n'
+            '# HELP wow Very wow.\n'
+            '# TYPE wow gauge\n'
+            'wow -2\n'
+            '# HELP latency_seconds Such latency.\n'
+            '# TYPE latency_seconds histogram\n'
+            'latency_seconds_bucket{name="b",le="0.1"} 1\n'
+            'latency_seconds_bucket{name="b",le="1"} 2\n'
+            'latency_seconds_bucket{name="b",le="+Inf"} 3\n'
+            'latency_seconds_sum{name="b"} 5.55\n'
+            'latency_seconds_count{name="b"} 3\n'
+        )
+        expect(histogram.get('b')).to_equal((3, 5.55))
+
+    def test_metric_names_are_unique(self):
+        registry = MetricsRegistry()
+        registry.counter('doge_total', 'Much doges.')
+
+        with expect.error_to_happen(ValueError, message='Metric doge_total is already registered'):
+            registry.gauge('doge_total', 'Much doges.')
+
+
+class TestGandalfMetrics(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = FakeGandalfServer().start()
+        cls.server.populate('doge', files=10, size=100)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def setUp(self):
+        self.metrics = GandalfMetrics()
+        self.gandalf = client.GandalfClient('localhost', self.server.port, observers=[self.metrics])
+
+    def test_counts_requests_latency_and_bytes_per_route(self):
+        for _ in range(3):
+            self.gandalf.repository_contents('doge', 'dir0/file0.txt')
+        with expect.error_to_happen(GandalfException):
+            self.gandalf.repository_get('not-a-repository')
+
+        contents = ('repository_contents', '/repository/:name/contents')
+        get = ('repository_get', '/repository/:name')
+        expect(self.metrics.requests.get(*contents + ('200',))).to_equal(3)
+        expect(self.metrics.requests.get(*get + ('404',))).to_equal(1)
+        expect(self.metrics.errors.get(*get + ('GandalfException',))).to_equal(1)
+        expect(self.metrics.in_flight.get(*contents)).to_equal(0)
+        expect(self.metrics.latency.get(*contents)[0]).to_equal(3)
+        expect(self.metrics.decode_latency.get(*contents)[0]).to_equal(3)
+        expect(self.metrics.bytes_received.get(*contents)).to_equal(300)
+
+        rendered = self.metrics.registry.render()
+        expect(rendered).to_include(
+            'gandalf_client_requests_total{method="repository_contents",'
+            'route="/repository/:name/contents",status="200"} 3\n'
+        )
+        expect(rendered).to_include('# TYPE gandalf_client_request_duration_seconds histogram\n')
+
+    def test_tracks_requests_in_flight(self):
+        in_flight = []
+        metrics = self.metrics
+
+        class InFlight(object):
+            def request_started(self, info):
+                in_flight.append(metrics.in_flight.get('user_new', '/user'))
+
+            def request_finished(self, info):
+                pass
+
+        self.gandalf.add_observer(InFlight())
+        self.gandalf.user_new('metrics', {})
+
+        expect(in_flight).to_equal([1])
+        expect(self.metrics.in_flight.get('user_new', '/user')).to_equal(0)
+        expect(self.metrics.bytes_sent.get('user_new', '/user')).to_be_greater_than(0)
+
+    def test_transport_errors_have_no_status(self):
+        gandalf = client.GandalfClient('localhost', 1, observers=[self.metrics])
+
+        gandalf.user_delete('doge')
+
+        expect(self.metrics.requests.get('user_delete', '/user/:name', 'none')).to_equal(1)
+        expect(self.metrics.errors.get('user_delete', '/user/:name', 'ConnectionError')).to_equal(1)
+
+    def test_renders_statuses_of_responses_and_transport_errors(self):
+        self.gandalf.user_new('flaky', {})
+        self.server.fail(1, None, 'user_delete')
+
+        expect(self.gandalf.user_delete('flaky')).to_be_null()
+        expect(self.gandalf.user_delete('flaky')).to_be_true()
+
+        rendered = self.metrics.registry.render()
+        expect(rendered).to_include('route="/user/:name",status="200"} 1\n')
+        expect(rendered).to_include('route="/user/:name",status="none"} 1\n')
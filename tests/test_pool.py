@@ -0,0 +1,195 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from preggy import expect
+from tornado.httpclient import AsyncHTTPClient
+
+import gandalf.asyncio_cli as asyncio_cli
+from gandalf.breaker import CircuitBreaker
+import gandalf.client as client
+from gandalf.pool import EWMA, ServerPool
+import gandalf.tornado_cli as tornado_cli
+from gandalf.testing import FakeGandalfServer
+from tests.base import TestCase
+
+
+class TestServerPool(TestCase):
+
+    def setUp(self):
+        self.now = 0
+        self.pool = ServerPool(
+            [('gandalf-1', 8001), ('gandalf-2', 8001), ('gandalf-3', 8001)],
+            eject_after=2, eject_for=30, clock=lambda: self.now
+        )
+        self.first, self.second, self.third = self.pool.endpoints
+
+    def test_reads_go_to_the_server_with_least_outstanding_requests(self):
+        self.pool.started(self.first)
+        self.pool.started(self.second)
+
+        expect(self.pool.pick('GET')).to_equal((self.third, False))
+        self.pool.started(self.third)
+        self.pool.started(self.third)
+        expect(self.pool.pick('GET', exclude=[self.second])).to_equal((self.first, False))
+
+    def test_ewma_prefers_the_fastest_server(self):
+        pool = ServerPool([('gandalf-1', 8001), ('gandalf-2', 8001)], strategy=EWMA, ewma_weight=0.5)
+        first, second = pool.endpoints
+        for endpoint, duration in ((first, 0.4), (second, 0.1), (first, 0.2)):
+            pool.started(endpoint)
+            pool.finished(endpoint, False, duration)
+
+        expect(first.latency).to_equal(0.30000000000000004)
+        expect(pool.pick('GET')).to_equal((second, False))
+        pool.started(second)
+        pool.started(second)
+        pool.started(second)
+        expect(pool.pick('GET')).to_equal((first, False))
+
+    def test_writes_go_to_the_first_healthy_server(self):
+        self.pool.started(self.first)
+
+        expect(self.pool.pick('POST')).to_equal((self.first, False))
+        for _ in range(2):
+            self.pool.finished(self.first, True, 0.1)
+        expect(self.pool.pick('DELETE')).to_equal((self.second, False))
+
+    def test_ejects_failing_servers_until_they_are_probed_healthy(self):
+        self.pool.finished(self.first, True, 0.1)
+        self.pool.finished(self.first, False, 0.1)
+        self.pool.finished(self.first, True, 0.1)
+        expect(self.first.ejected).to_be_false()
+
+        self.pool.finished(self.first, True, 0.1)
+        expect(self.first.ejected).to_be_true()
+        expect(self.pool.pick('POST')).to_equal((self.second, False))
+
+        self.now = 30
+        expect(self.pool.pick('POST')).to_equal((self.first, True))
+        self.pool.probed(self.first, False)
+        expect(self.pool.pick('POST')).to_equal((self.second, False))
+
+        self.now = 60
+        self.pool.probed(self.first, True)
+        expect(self.pool.pick('POST')).to_equal((self.first, False))
+
+    def test_only_reads_fail_over_to_servers_not_tried(self):
+        expect(self.pool.can_failover('GET', [self.first])).to_be_true()
+        expect(self.pool.can_failover('POST', [self.first])).to_be_false()
+        expect(self.pool.can_failover('GET', self.pool.endpoints)).to_be_false()
+
+    def test_keeps_picking_servers_when_all_are_ejected(self):
+        for endpoint in self.pool.endpoints:
+            endpoint.ejected_at = 0
+
+        expect(self.pool.pick('POST')).to_equal((self.first, False))
+        expect(self.pool.pick('POST', exclude=[self.first])).to_equal((self.second, False))
+
+
+class PoolTestCase(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.servers = [FakeGandalfServer().start(), FakeGandalfServer().start()]
+        # Replicas share the same storage
+        cls.servers[1].gandalf = cls.servers[0].gandalf
+        cls.servers[0].populate('doge', files=1)
+
+    @classmethod
+    def tearDownClass(cls):
+        for server in cls.servers:
+            server.stop()
+
+    def setUp(self):
+        for server in self.servers:
+            server.calls.clear()
+            del server.faults[:]
+
+    def endpoints(self):
+        return [('localhost', server.port) for server in self.servers]
+
+    def fail_first_server(self, gandalf, status_code):
+        # The second server looks busy so reads try the first one first
+        gandalf.pool.started(gandalf.pool.endpoints[1])
+        self.servers[0].fail(1, status_code)
+
+
+class TestGandalfClientPool(PoolTestCase):
+
+    def test_spreads_reads_over_the_servers(self):
+        gandalf = client.GandalfClient.for_servers(self.endpoints())
+        for _ in range(20):
+            expect(gandalf.repository_get('doge')['name']).to_equal('doge')
+
+        for server in self.servers:
+            expect(server.calls['repository_get']).to_be_greater_than(0)
+
+    def test_fails_reads_over_to_another_server(self):
+        gandalf = client.GandalfClient.for_servers(self.endpoints())
+        self.fail_first_server(gandalf, 503)
+
+        expect(gandalf.repository_get('doge')['name']).to_equal('doge')
+        expect(self.servers[0].calls['repository_get']).to_equal(1)
+        expect(self.servers[1].calls['repository_get']).to_equal(1)
+
+    def test_sends_writes_to_the_primary_without_failing_over(self):
+        gandalf = client.GandalfClient.for_servers(self.endpoints())
+        self.servers[0].fail(1, 503)
+
+        expect(gandalf.user_new('pooled', {})).to_be_false()
+        expect(gandalf.user_new('pooled', {})).to_be_true()
+        expect(self.servers[0].calls['user_new']).to_equal(2)
+        expect(self.servers[1].calls['user_new']).to_equal(0)
+        gandalf.user_delete('pooled')
+
+    def test_ejected_server_is_probed_before_getting_requests_again(self):
+        gandalf = client.GandalfClient.for_servers(self.endpoints())
+        primary = gandalf.pool.primary
+        gandalf.pool.eject_for = 0
+        primary.ejected_at = 0
+
+        expect(gandalf.user_new('probed', {})).to_be_true()
+        expect(self.servers[0].calls['healthcheck']).to_equal(1)
+        expect(self.servers[0].calls['user_new']).to_equal(1)
+        expect(primary.ejected).to_be_false()
+        gandalf.user_delete('probed')
+
+
+    def test_refuses_a_breaker_with_the_pool(self):
+        endpoints = [('localhost', 1)] + self.endpoints()
+
+        with expect.error_to_happen(ValueError):
+            client.GandalfClient.for_servers(endpoints, breaker=CircuitBreaker(min_calls=2, open_timeout=0.2))
+
+        # The pool keeps serving reads from the healthy replicas with the
+        # primary down
+        gandalf = client.GandalfClient.for_servers(endpoints)
+        for _ in range(10):
+            expect(gandalf.repository_get('doge')['name']).to_equal('doge')
+
+
+class TestAsyncGandalfClientPool(unittest.IsolatedAsyncioTestCase, PoolTestCase):
+
+    async def test_asyncio_client_fails_over(self):
+        http_client = asyncio_cli.AsyncioHTTPClient()
+        gandalf = asyncio_cli.AsyncioGandalfClient.for_servers(self.endpoints(), http_client.fetch)
+        self.fail_first_server(gandalf, None)
+
+        result = await gandalf.repository_get('doge')
+        http_client.close()
+
+        expect(result['name']).to_equal('doge')
+        expect(self.servers[1].calls['repository_get']).to_equal(1)
+
+    async def test_tornado_client_fails_over(self):
+        http_client = AsyncHTTPClient(force_instance=True)
+        gandalf = tornado_cli.AsyncTornadoGandalfClient.for_servers(self.endpoints(), http_client.fetch)
+        self.fail_first_server(gandalf, 502)
+
+        tree = await gandalf.repository_tree('doge')
+        http_client.close()
+
+        expect(tree).to_length(1)
+        expect(self.servers[1].calls['repository_tree']).to_equal(1)
@@ -0,0 +1,192 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import tempfile
+import time
+import unittest
+
+from preggy import expect
+from tornado.httpclient import AsyncHTTPClient, HTTPError
+
+from gandalf import GandalfException
+import gandalf.asyncio_cli as asyncio_cli
+import gandalf.client as client
+from gandalf.retry import RetryBudget, RetryPolicy
+import gandalf.tornado_cli as tornado_cli
+from gandalf.testing import FakeGandalfServer
+from tests.base import TestCase
+
+
+def fast_retries(**kwargs):
+    kwargs.setdefault('backoff', 0.001)
+    return RetryPolicy(**kwargs)
+
+
+class TestRetryPolicy(TestCase):
+
+    def setUp(self):
+        self.now = 0
+
+    def test_backs_off_exponentially_with_jitter(self):
+        policy = RetryPolicy(attempts=5, backoff=1, max_backoff=3, random=lambda: 0.5)
+        retries = policy.begin()
+
+        delays = [retries.delay('GET', status=503) for _ in range(5)]
+
+        expect(delays).to_equal([0.5, 1, 1.5, 1.5, None])
+
+    def test_only_retries_idempotent_methods_and_transient_failures(self):
+        policy = RetryPolicy(jitter=False)
+
+        expect(policy.begin().delay('POST', status=503)).to_be_null()
+        expect(policy.begin().delay('GET', status=404)).to_be_null()
+        expect(policy.begin().delay('GET', error=ValueError())).to_be_null()
+        expect(policy.begin().delay('delete', status=502)).to_equal(0.1)
+        expect(policy.begin().delay('GET', error=ConnectionResetError())).to_equal(0.1)
+
+    def test_does_not_retry_past_the_deadline(self):
+        policy = RetryPolicy(backoff=1, jitter=False, deadline=2.5, clock=lambda: self.now)
+        retries = policy.begin()
+
+        self.now = 1
+        expect(retries.remaining()).to_equal(1.5)
+        expect(retries.delay('GET', status=503)).to_equal(1)
+        self.now = 2
+        expect(retries.delay('GET', status=503)).to_be_null()
+
+    def test_retries_are_limited_by_the_budget(self):
+        budget = RetryBudget(ratio=0.5, min_tokens=1)
+        policy = RetryPolicy(attempts=10, budget=budget)
+
+        expect(policy.begin().delay('GET', status=503)).not_to_be_null()
+        # 0.5 tokens were left and the new call added 0.5 more
+        retries = policy.begin()
+        expect(retries.delay('GET', status=503)).not_to_be_null()
+        expect(retries.delay('GET', status=503)).to_be_null()
+
+
+class TestGandalfClientRetries(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = FakeGandalfServer().start()
+        cls.server.populate('doge', files=1)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def setUp(self):
+        self.server.calls.clear()
+        del self.server.faults[:]
+        self.gandalf = client.GandalfClient('localhost', self.server.port, retry=fast_retries())
+
+    def test_retries_transient_status_codes(self):
+        self.server.fail(2, 503, route='repository_get')
+
+        expect(self.gandalf.repository_get('doge')['name']).to_equal('doge')
+        expect(self.server.calls['repository_get']).to_equal(3)
+
+    def test_retries_dropped_connections(self):
+        self.server.fail(1, None)
+
+        expect(self.gandalf.healthcheck()).to_be_true()
+        expect(self.server.calls['healthcheck']).to_equal(2)
+
+    def test_gives_up_after_the_last_attempt(self):
+        self.server.fail(3, 503)
+
+        with expect.error_to_happen(GandalfException, message='Injected failure (Gandalf server response HTTP 503)'):
+            self.gandalf.repository_get('doge')
+        expect(self.server.calls['repository_get']).to_equal(3)
+
+    def test_does_not_retry_writes(self):
+        self.server.fail(1, 503)
+
+        expect(self.gandalf.user_new('retried', {})).to_be_false()
+        expect(self.server.calls['user_new']).to_equal(1)
+
+    def test_attempts_are_limited_by_the_deadline(self):
+        server = FakeGandalfServer(latency=0.5)
+        with server:
+            gandalf = client.GandalfClient('localhost', server.port, retry=fast_retries(deadline=0.1))
+
+            started = time.time()
+            expect(gandalf.healthcheck()).to_be_null()
+            expect(time.time() - started).to_be_lesser_than(0.5)
+
+
+class TestAsyncGandalfClientRetries(unittest.IsolatedAsyncioTestCase, TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = FakeGandalfServer().start()
+        cls.server.populate('doge', files=1)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def setUp(self):
+        self.server.calls.clear()
+        del self.server.faults[:]
+
+    async def test_asyncio_client_retries(self):
+        http_client = asyncio_cli.AsyncioHTTPClient()
+        gandalf = asyncio_cli.AsyncioGandalfClient(
+            'localhost', self.server.port, http_client.fetch, retry=fast_retries()
+        )
+        self.server.fail(1, 502)
+        self.server.fail(1, None)
+
+        result = await gandalf.repository_get('doge')
+        http_client.close()
+
+        expect(result['name']).to_equal('doge')
+        expect(self.server.calls['repository_get']).to_equal(3)
+
+    async def test_asyncio_client_does_not_retry_streamed_downloads(self):
+        http_client = asyncio_cli.AsyncioHTTPClient()
+        gandalf = asyncio_cli.AsyncioGandalfClient(
+            'localhost', self.server.port, http_client.fetch, retry=fast_retries()
+        )
+        self.server.fail(1, 503)
+
+        with tempfile.TemporaryFile() as fileobj:
+            with expect.error_to_happen(GandalfException):
+                await gandalf.repository_archive('doge', 'master', fileobj=fileobj)
+        http_client.close()
+
+        expect(self.server.calls['repository_archive']).to_equal(1)
+
+    async def test_tornado_client_retries(self):
+        http_client = AsyncHTTPClient(force_instance=True)
+        gandalf = tornado_cli.AsyncTornadoGandalfClient(
+            'localhost', self.server.port, http_client.fetch, retry=fast_retries()
+        )
+        self.server.fail(2, 503, route='repository_tree')
+
+        tree = await gandalf.repository_tree('doge')
+        with expect.error_to_happen(GandalfException):
+            await gandalf.user_get_keys('not-a-user')
+        http_client.close()
+
+        expect(tree).to_length(1)
+        expect(self.server.calls['repository_tree']).to_equal(3)
+        expect(self.server.calls['user_get_keys']).to_equal(1)
+
+    async def test_tornado_client_raises_timeouts_past_the_deadline(self):
+        http_client = AsyncHTTPClient(force_instance=True)
+        gandalf = tornado_cli.AsyncTornadoGandalfClient(
+            'localhost', self.server.port, http_client.fetch, retry=fast_retries(deadline=0.2)
+        )
+        self.server.latency = lambda route: 0.5 if route == 'repository_get' else 0
+
+        try:
+            with expect.error_to_happen(HTTPError):
+                await gandalf.repository_get('doge')
+        finally:
+            self.server.latency = 0
+        http_client.close()
+
+        expect(self.server.calls['repository_get']).to_be_greater_or_equal_to(1)
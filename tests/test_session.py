@@ -0,0 +1,108 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import threading
+import unittest
+
+from preggy import expect
+import requests
+
+from gandalf import GandalfException
+import gandalf.client as client
+import gandalf.tornado_cli as tornado_cli
+from gandalf.session import PooledSession
+from tests.base import TestCase
+from tests.utils import start_stub_server
+
+
+class TestPooledSession(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = start_stub_server()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.server.connections = 0
+        self.server.bodies = []
+        self.session = PooledSession(pool_maxsize=2)
+        self.gandalf = client.GandalfClient('localhost', self.server.server_address[1], self.session)
+
+    def tearDown(self):
+        self.session.close()
+
+    def test_uses_pooled_session_by_default(self):
+        gandalf = client.GandalfClient('localhost', self.server.server_address[1])
+        expect(gandalf.client).to_be_instance_of(PooledSession)
+
+    def test_reuses_connections_between_calls(self):
+        for name in ('a', 'b', 'c'):
+            expect(self.gandalf.repository_get(name)).to_equal({'name': name})
+        expect(self.gandalf.healthcheck()).to_be_true()
+        expect(self.gandalf.user_new('rfloriano', {})).to_be_true()
+        expect(self.server.connections).to_equal(1)
+
+    def test_shares_pool_between_threads(self):
+        results = {}
+
+        def get(name):
+            results[name] = self.gandalf.repository_get(name)
+
+        threads = [threading.Thread(target=get, args=(str(i),)) for i in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        expect(results).to_length(10)
+        expect(self.server.connections).to_be_lesser_or_equal_to(2)
+
+    def test_map_runs_calls_in_order_and_reports_failures(self):
+        calls = [('repository_get', (str(i),)) for i in range(10)]
+        calls.insert(3, ('repository_get', ('missing',)))
+        calls.append(('user_new', ('rfloriano',), {'keys': {}}))
+
+        results = self.gandalf.map(calls, max_workers=4)
+
+        expect(results).to_length(12)
+        expect([result.call for result in results]).to_equal(calls)
+        expect(results[3].ok).to_be_false()
+        expect(results[3].error).to_be_instance_of(GandalfException)
+        expect(results[4].value).to_equal({'name': '3'})
+        expect(results[-1].value).to_be_true()
+        expect(self.server.connections).to_be_lesser_or_equal_to(2)
+
+    def test_map_reports_transport_errors(self):
+        gandalf = client.GandalfClient('localhost', 1, self.session)
+
+        results = gandalf.map([('repository_get', ('doge',)), ('healthcheck', ())])
+
+        expect(results[0].error).to_be_instance_of(requests.ConnectionError)
+        expect(results[1].error).to_be_instance_of(requests.ConnectionError)
+
+
+class TestTornadoDefaultTransport(unittest.IsolatedAsyncioTestCase, TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = start_stub_server()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    async def test_tornado_client_uses_async_http_client_by_default(self):
+        gandalf = tornado_cli.AsyncTornadoGandalfClient('localhost', self.server.server_address[1])
+
+        expect(await gandalf.repository_get('doge')).to_equal({'name': 'doge'})
+
+    async def test_refuses_map(self):
+        gandalf = tornado_cli.AsyncTornadoGandalfClient('localhost', self.server.server_address[1])
+
+        with expect.error_to_happen(TypeError):
+            gandalf.map([('repository_get', ('doge',))])
@@ -0,0 +1,290 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import io
+import json
+import tempfile
+import unittest
+import zipfile
+
+from preggy import expect
+from tornado.httpclient import AsyncHTTPClient
+
+from gandalf import GandalfException
+import gandalf.asyncio_cli as asyncio_cli
+import gandalf.client as client
+from gandalf.session import PooledSession
+from gandalf.streams import JSONItemParser, MultipartEncoder, iter_zip
+import gandalf.tornado_cli as tornado_cli
+from gandalf.testing import FakeGandalfServer
+from tests.base import TestCase
+from tests.utils import start_stub_server
+
+COMMIT_ARGS = (
+    'doge', 'Repository scaffold', 'Author Name', 'author@name.com',
+    'Committer Name', 'committer@email.com', 'master',
+)
+
+
+def iter_zip_chunks():
+    for chunk in (b'PK', b'zip', b'-content'):
+        yield chunk
+
+
+class TestMultipartEncoder(TestCase):
+
+    def test_reading_and_iterating_produce_the_same_body(self):
+        fields = {'branch': 'master', 'message': u'Mantém configuração'}
+        body = b''.join(MultipartEncoder(fields, {'zipfile': io.BytesIO(b'zip-content')}))
+        encoder = MultipartEncoder(fields, {'zipfile': io.BytesIO(b'zip-content')})
+
+        read = b''
+        for chunk in iter(lambda: encoder.read(5), b''):
+            read += chunk
+
+        expect(len(read)).to_equal(len(body))
+        expect(encoder.len).to_equal(len(body))
+        expect(body.decode('utf-8')).to_include(u'Mantém configuração')
+
+    def test_length_of_file_objects_starts_at_current_position(self):
+        with tempfile.TemporaryFile() as fileobj:
+            fileobj.write(b'ignored zip-content')
+            fileobj.seek(len(b'ignored '))
+            encoder = MultipartEncoder(files={'zipfile': fileobj})
+            body = b''.join(encoder)
+
+        expect(encoder.len).to_equal(len(body))
+        expect(body.decode('utf-8')).not_to_include('ignored')
+
+    def test_length_of_iterators_is_unknown(self):
+        encoder = MultipartEncoder(files={'zipfile': iter_zip_chunks()})
+        expect(encoder.len).to_be_null()
+        expect(b''.join(encoder).decode('utf-8')).to_include('PKzip-content\r\n')
+
+
+class TestIterZip(TestCase):
+
+    def test_builds_zip_from_dict(self):
+        body = b''.join(iter_zip({
+            'README': b'MUCH WOW',
+            'some/path/doge.txt': u'VERY COMMIT',
+            'some/path/img.jpg': io.BytesIO(b'\xff\xd8\xff'),
+            'some/path/chunks.txt': iter_zip_chunks(),
+        }))
+
+        archive = zipfile.ZipFile(io.BytesIO(body))
+        expect(archive.testzip()).to_be_null()
+        expect(archive.read('README')).to_equal(b'MUCH WOW')
+        expect(archive.read('some/path/doge.txt')).to_equal(b'VERY COMMIT')
+        expect(archive.read('some/path/img.jpg')).to_equal(b'\xff\xd8\xff')
+        expect(archive.read('some/path/chunks.txt')).to_equal(b'PKzip-content')
+
+    def test_yields_chunks_before_reading_every_entry(self):
+        read = []
+
+        def entries():
+            for path in ('a.txt', 'b.txt'):
+                read.append(path)
+                yield path, b'x' * 100000
+
+        chunks = iter_zip(entries(), chunk_size=1024)
+        next(chunks)
+        expect(read).to_equal(['a.txt'])
+        expect(list(chunks)).not_to_be_empty()
+        expect(read).to_equal(['a.txt', 'b.txt'])
+
+
+class TestJSONItemParser(TestCase):
+
+    def parse(self, document, size, **kwargs):
+        parser = JSONItemParser(**kwargs)
+        items = []
+        for start in range(0, len(document), size):
+            items.extend(parser.feed(document[start:start + size]))
+        return parser, items + parser.close()
+
+    def test_parses_array_items_split_in_any_chunks(self):
+        items = [{'path': u'dóc/{0}.txt'.format(i), 'size': i * 10, 'tags': ['a]', '{b']} for i in range(5)]
+        document = json.dumps(items, ensure_ascii=False).encode('utf-8') + b' \n'
+
+        for size in (1, 2, 7, len(document)):
+            expect(self.parse(document, size)[1]).to_equal(items)
+        expect(self.parse(b'[1, 22 , null,"x"]', 1)[1]).to_equal([1, 22, None, 'x'])
+
+    def test_waits_for_the_end_of_numbers_split_between_chunks(self):
+        numbers = [-2500.0, 1e-07, 12, -0.5, 3.25e+20, 0]
+        document = json.dumps({'items': numbers, 'next': -1.5e3}).encode('utf-8')
+
+        for size in range(1, 12):
+            parser, items = self.parse(document, size, key='items')
+            expect(items).to_equal(numbers)
+            expect(parser.fields).to_equal({'next': -1500.0})
+
+    def test_parses_items_of_an_object_member(self):
+        document = b'{"commits": [{"ref": "a"}, {"ref": "b"}], "next": "c", "total": 12}'
+
+        parser, items = self.parse(document, 3, key='commits')
+
+        expect(items).to_equal([{'ref': 'a'}, {'ref': 'b'}])
+        expect(parser.fields).to_equal({'next': 'c', 'total': 12})
+
+    def test_returns_items_as_soon_as_they_are_complete(self):
+        parser = JSONItemParser()
+
+        expect(parser.feed(b'[{"a": 1}, {"b"')).to_equal([{'a': 1}])
+        expect(parser.feed(b': 2}, 3')).to_equal([{'b': 2}])
+        expect(parser.feed(b']')).to_equal([3])
+        expect(parser.close()).to_be_empty()
+
+    def test_raises_on_invalid_or_truncated_documents(self):
+        with expect.error_to_happen(ValueError):
+            self.parse(b'[{"a": 1}', 4)
+        with expect.error_to_happen(ValueError):
+            self.parse(b'[1, 2] 3', 4)
+
+        for document in (b'[1,,2]', b'[,1]', b'[1 2]', b'[1,]', b'[,]', b'[{"a": 1}{"b": 2}]'):
+            for size in (1, len(document)):
+                with expect.error_to_happen(ValueError):
+                    self.parse(document, size)
+        for document in (b'{,"items": []}', b'{"items": [1],, "next": 2}', b'{"items": [1] "next": 2}',
+                         b'{"next": 2,}', b'{"items": [1,]}'):
+            with expect.error_to_happen(ValueError):
+                self.parse(document, 1, key='items')
+
+        parser = JSONItemParser()
+        # Written chunks may be the body of an error response
+        parser.write(b'repository not found\n')
+        with expect.error_to_happen(ValueError):
+            parser.close()
+
+
+class StreamedJSONTestCase(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = FakeGandalfServer().start()
+        cls.server.populate('big', files=50, size=16, commits=3)
+        cls.server.tag('big', '0.1.0')
+        cls.server.branch('big', 'feature')
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def expect_streamed(self, tree, log, branches, tags):
+        expect(sorted(entry['path'] for entry in tree)).to_equal(
+            sorted('dir{0}/file{1}.txt'.format(i % 10, i) for i in range(50))
+        )
+        expect([commit['subject'] for commit in log]).to_equal(['Commit 2', 'Commit 1'])
+        expect([branch['name'] for branch in branches]).to_equal(['feature', 'master'])
+        expect([tag['name'] for tag in tags]).to_equal(['0.1.0'])
+
+
+class TestGandalfClientStreamedJSON(StreamedJSONTestCase):
+
+    def test_decodes_items_while_downloading(self):
+        gandalf = client.GandalfClient('localhost', self.server.port)
+        gandalf.chunk_size = 64
+
+        tree = gandalf.repository_tree_stream('big')
+
+        expect(next(tree)['path']).to_match(r'^dir')
+        expect(list(gandalf.repository_tree_stream('big', path='dir3'))).to_equal(
+            gandalf.repository_tree('big', path='dir3')
+        )
+        self.expect_streamed(
+            gandalf.repository_tree_stream('big'), gandalf.repository_log_stream('big', 'master', 2),
+            gandalf.repository_branches_stream('big'), gandalf.repository_tags_stream('big')
+        )
+
+    def test_raises_gandalf_errors(self):
+        gandalf = client.GandalfClient('localhost', self.server.port)
+
+        with expect.error_to_happen(GandalfException):
+            list(gandalf.repository_tree_stream('nope'))
+
+
+class TestAsyncGandalfClientStreamedJSON(unittest.IsolatedAsyncioTestCase, StreamedJSONTestCase):
+
+    def expect_refused(self, gandalf):
+        calls = self.server.calls.copy()
+        streams = [
+            (gandalf.repository_tree_stream, ('big',)), (gandalf.repository_log_stream, ('big', 'master', 2)),
+            (gandalf.repository_branches_stream, ('big',)), (gandalf.repository_tags_stream, ('big',)),
+        ]
+        for stream, args in streams:
+            with expect.error_to_happen(TypeError):
+                stream(*args)
+        expect(self.server.calls).to_equal(calls)
+
+    async def test_asyncio_client_refuses_to_stream(self):
+        http_client = asyncio_cli.AsyncioHTTPClient()
+        gandalf = asyncio_cli.AsyncioGandalfClient('localhost', self.server.port, http_client.fetch)
+
+        self.expect_refused(gandalf)
+        http_client.close()
+
+    async def test_tornado_client_refuses_to_stream(self):
+        http_client = AsyncHTTPClient(force_instance=True)
+        gandalf = tornado_cli.AsyncTornadoGandalfClient('localhost', self.server.port, http_client.fetch)
+
+        self.expect_refused(gandalf)
+        http_client.close()
+
+
+class TestStreamedCommit(unittest.IsolatedAsyncioTestCase, TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = start_stub_server()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.server.bodies = []
+        self.port = self.server.server_address[1]
+
+    def expect_commit(self):
+        content_type, body = self.server.bodies[-1]
+        body = body.decode('utf-8')
+        expect(content_type).to_include('multipart/form-data; boundary=')
+        expect(body).to_include('name="committer-email"\r\n\r\ncommitter@email.com\r\n')
+        expect(body).to_include('filename="zipfile"')
+        expect(body).to_include('PKzip-content\r\n')
+
+    def test_sync_commit_streams_file_objects_and_iterators(self):
+        gandalf = client.GandalfClient('localhost', self.port, PooledSession())
+
+        for files in (io.BytesIO(b'PKzip-content'), iter_zip_chunks()):
+            expect(gandalf.repository_commit(*(COMMIT_ARGS + (files,)))).to_equal({})
+            self.expect_commit()
+
+    def test_commit_zips_dicts_on_the_fly(self):
+        gandalf = client.GandalfClient('localhost', self.port, PooledSession())
+
+        gandalf.repository_commit(*(COMMIT_ARGS + ({'README': b'MUCH WOW'},)))
+
+        content_type, body = self.server.bodies[-1]
+        expect(content_type).to_include('multipart/form-data; boundary=')
+        start = body.index(b'PK')
+        archive = zipfile.ZipFile(io.BytesIO(body[start:body.rindex(b'\r\n--')]))
+        expect(archive.read('README')).to_equal(b'MUCH WOW')
+
+    async def test_asyncio_commit_streams_iterators(self):
+        http_client = asyncio_cli.AsyncioHTTPClient()
+        gandalf = asyncio_cli.AsyncioGandalfClient('localhost', self.port, http_client.fetch)
+
+        for files in (io.BytesIO(b'PKzip-content'), iter_zip_chunks()):
+            expect(await gandalf.repository_commit(*(COMMIT_ARGS + (files,)))).to_equal({})
+            self.expect_commit()
+        http_client.close()
+
+    async def test_tornado_commit_uses_body_producer(self):
+        gandalf = tornado_cli.AsyncTornadoGandalfClient('localhost', self.port, AsyncHTTPClient().fetch)
+
+        for files in (io.BytesIO(b'PKzip-content'), iter_zip_chunks()):
+            expect(await gandalf.repository_commit(*(COMMIT_ARGS + (files,)))).to_equal({})
+            self.expect_commit()
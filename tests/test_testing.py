@@ -0,0 +1,180 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import time
+import unittest
+import uuid
+
+from preggy import expect
+
+from gandalf import GandalfException
+import gandalf.asyncio_cli as asyncio_cli
+import gandalf.client as client
+from gandalf.routes import ROUTES, match_route
+from gandalf.testing import FakeGandalfServer, git_hash
+from tests.base import TestCase
+
+
+class TestRoutes(TestCase):
+
+    def test_every_client_method_has_a_route(self):
+        names = set(route.name for route in ROUTES)
+        expect(names).to_length(len(ROUTES))
+        for name in names:
+            expect(hasattr(client.GandalfClient, name)).to_be_true()
+
+    def test_literal_routes_win_over_parameters(self):
+        route, params = match_route('DELETE', '/repository/revoke')
+        expect(route.name).to_equal('repository_revoke')
+
+        route, params = match_route('DELETE', '/repository/doge')
+        expect(route.name).to_equal('repository_delete')
+        expect(params).to_equal({'name': 'doge'})
+
+        route, params = match_route('DELETE', '/user/doge/key/wow')
+        expect(route.template).to_equal('/user/:name/key/:keyname')
+        expect(params).to_equal({'name': 'doge', 'keyname': 'wow'})
+
+        expect(match_route('GET', '/healthcheck')[0].name).to_equal('healthcheck')
+        expect(match_route('PATCH', '/repository/doge')).to_equal((None, None))
+
+
+class TestFakeGandalfServer(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = FakeGandalfServer().start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def setUp(self):
+        self.gandalf = client.GandalfClient('localhost', self.server.port)
+
+    def test_can_get_healthcheck(self):
+        expect(self.gandalf.healthcheck()).to_be_true()
+
+    def test_can_manage_users(self):
+        user = str(uuid.uuid4())
+        expect(self.gandalf.user_new(user, {})).to_be_true()
+        expect(self.gandalf.user_new(user, {})).to_be_false()
+        expect(self.gandalf.user_new(str(uuid.uuid4()), {'default': 'invalidkey'})).to_be_false()
+
+        expect(self.gandalf.user_add_key(user, {'foo': 'ssh-rsa AAAA doge@localhost'})).to_be_true()
+        expect(self.gandalf.user_get_keys(user)).to_equal({'foo': 'ssh-rsa AAAA doge@localhost'})
+        expect(self.gandalf.user_delete_key(user, 'foo')).to_be_true()
+
+        expect(self.gandalf.user_delete(user)).to_be_true()
+        expect(self.gandalf.user_delete(user)).to_be_false()
+
+    def test_can_manage_repositories(self):
+        repo = str(uuid.uuid4())
+        repo2 = str(uuid.uuid4())
+
+        expect(self.gandalf.repository_new(repo, ['rfloriano'])).to_be_true()
+        expect(self.gandalf.repository_get(repo)).to_equal({
+            'name': repo,
+            'public': False,
+            'git_url': 'git://{0}:{1}/{2}.git'.format(self.server.host, self.server.port, repo),
+            'ssh_url': 'git@{0}:{1}:{2}.git'.format(self.server.host, self.server.port, repo),
+        })
+        expect(self.gandalf.repository_update(repo, name=repo2, ispublic=True)).to_be_true()
+        expect(self.gandalf.repository_grant(['doge'], [repo2])).to_be_true()
+        expect(self.server.gandalf.repositories[repo2].users).to_equal(['rfloriano', 'doge'])
+        expect(self.gandalf.repository_revoke(['doge'], [repo2])).to_be_true()
+        expect(self.gandalf.repository_delete(repo2)).to_be_true()
+
+        with expect.error_to_happen(GandalfException, message="repository not found (Gandalf server response HTTP 404)"):
+            self.gandalf.repository_get(repo2)
+
+    def test_can_read_repository_contents(self):
+        repo = str(uuid.uuid4())
+        self.server.create_repository(repo, {'README': b'', 'some/path/doge.txt': b'FOO BAR\n'})
+        self.server.tag(repo, '0.1.0', annotation='annotated tag')
+        self.server.commit(repo, {'some/path/doge.txt': b'OTHER TEST\n'}, message='Other test')
+
+        tree = self.gandalf.repository_tree(repo, '/some/path/', '0.1.0')
+        expect(tree).to_equal([{
+            u'rawPath': u'some/path/doge.txt',
+            u'path': u'some/path/doge.txt',
+            u'filetype': u'blob',
+            u'hash': u'404727fb574ba2f8d6ceb6562190f9229a64f0dd',
+            u'permission': u'100644'
+        }])
+        expect(tree[0]['hash']).to_equal(git_hash(b'FOO BAR\n'))
+
+        expect(self.gandalf.repository_contents(repo, 'some/path/doge.txt', '0.1.0')).to_equal('FOO BAR\n')
+        expect(self.gandalf.repository_contents(repo, 'some/path/doge.txt')).to_equal('OTHER TEST\n')
+
+        tags = self.gandalf.repository_tags(repo)
+        expect(tags[0]['name']).to_equal('0.1.0')
+        expect(tags[0]['subject']).to_equal('annotated tag')
+        expect(self.gandalf.repository_branches(repo)[0]['name']).to_equal('master')
+
+        log = self.gandalf.repository_log(repo, 'master', 1, 'some/path/doge.txt')
+        expect(log['commits'][0]['subject']).to_equal('Other test')
+        expect(log['next']).to_equal(tags[0]['ref'])
+
+        diff = self.gandalf.repository_diff_commits(repo, '0.1.0', 'master')
+        expect(diff).to_equal("""diff --git a/some/path/doge.txt b/some/path/doge.txt
+index 404727f..bd82f1d 100644
+--- a/some/path/doge.txt
++++ b/some/path/doge.txt
+@@ -1 +1 @@
+-FOO BAR
++OTHER TEST
+""")
+
+        zip_ = self.gandalf.repository_archive(repo, '0.1.0')
+        expect(zip_.read('{0}-0.1.0/some/path/doge.txt'.format(repo))).to_equal(b'FOO BAR\n')
+
+    def test_can_commit_into_repo(self):
+        repo = str(uuid.uuid4())
+        self.gandalf.repository_new(repo, [])
+
+        with open('./tests/fixtures/scaffold.zip', 'rb') as scaffold:
+            result = self.gandalf.repository_commit(
+                repo, 'Repository scaffold', 'Author Name', 'author@name.com',
+                'Committer Name', 'committer@email.com', 'master', scaffold
+            )
+
+        expect(result['name']).to_equal('master')
+        expect(result['subject']).to_equal('Repository scaffold')
+        expect(result['author']['email']).to_equal('<author@name.com>')
+        expect([entry['path'] for entry in self.gandalf.repository_tree(repo)]).to_equal(
+            ['WOW/WOW.WOW', 'doge.txt', 'much.txt']
+        )
+
+    def test_counts_calls_and_adds_latency_per_route(self):
+        server = FakeGandalfServer(latency=lambda route: 0.05 if route == 'repository_get' else 0)
+        with server:
+            server.populate('doge', files=10, size=100)
+            gandalf = client.GandalfClient('localhost', server.port)
+
+            started = time.time()
+            gandalf.repository_tree('doge')
+            expect(time.time() - started).to_be_lesser_than(0.05)
+
+            started = time.time()
+            gandalf.repository_get('doge')
+            expect(time.time() - started).to_be_greater_or_equal_to(0.05)
+
+            expect(server.calls).to_equal({'repository_tree': 1, 'repository_get': 1})
+
+
+class TestFakeGandalfServerWithAsyncio(unittest.IsolatedAsyncioTestCase, TestCase):
+
+    async def test_serves_asyncio_client(self):
+        with FakeGandalfServer() as server:
+            server.populate('doge', files=20, size=2048, commits=3)
+            http_client = asyncio_cli.AsyncioHTTPClient()
+            gandalf = asyncio_cli.AsyncioGandalfClient('localhost', server.port, http_client.fetch)
+
+            tree = await gandalf.repository_tree('doge')
+            expect(tree).to_length(20)
+            content = await gandalf.repository_contents('doge', tree[0]['path'])
+            expect(content).to_length(2048)
+            log = await gandalf.repository_log('doge', 'master', 10)
+            expect(log['commits']).to_length(3)
+            http_client.close()
@@ -0,0 +1,199 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from preggy import expect
+from tornado.httpclient import AsyncHTTPClient
+
+import gandalf.asyncio_cli as asyncio_cli
+from gandalf.cache import RefCache
+import gandalf.client as client
+import gandalf.tornado_cli as tornado_cli
+from gandalf.testing import FakeGandalfServer
+from gandalf.tree import TreeDiff, TreeEntry, TreeIndex, diff_trees
+from tests.base import TestCase
+
+FILES = {
+    'README.md': 'readme',
+    'setup.py': 'setup',
+    'src/app/__init__.py': '',
+    'src/app/models.py': 'models',
+    'src/app/templates/index.html': 'index',
+    'src/tools/lint.py': 'lint',
+    'docs/index.rst': 'docs',
+}
+
+
+def paths(entries):
+    return [entry.path for entry in entries]
+
+
+class TestTreeIndex(TestCase):
+
+    def setUp(self):
+        self.index = TreeIndex(
+            {'path': path, 'filetype': 'blob', 'hash': 'hash-' + path, 'permission': '100644'}
+            for path in FILES
+        )
+
+    def test_stats_files_and_implied_directories(self):
+        expect(self.index.stat('src/app/models.py')).to_equal(
+            TreeEntry('src/app/models.py', 'blob', 'hash-src/app/models.py', '100644')
+        )
+        expect(self.index.stat('/src/app/').is_dir).to_be_true()
+        expect(self.index.stat('src/app').name).to_equal('app')
+        expect('docs' in self.index).to_be_true()
+        expect('nope' in self.index).to_be_false()
+        expect(len(self.index)).to_equal(7)
+        with expect.error_to_happen(KeyError):
+            self.index.stat('src/nope.py')
+
+    def test_lists_directories_sorted_by_name(self):
+        expect(paths(self.index.ls())).to_equal(['README.md', 'docs', 'setup.py', 'src'])
+        expect(paths(self.index.ls('src/app'))).to_equal([
+            'src/app/__init__.py', 'src/app/models.py', 'src/app/templates'
+        ])
+        expect(paths(self.index.ls('setup.py'))).to_equal(['setup.py'])
+        with expect.error_to_happen(KeyError):
+            self.index.ls('nope')
+
+    def test_globs_within_path_segments(self):
+        expect(paths(self.index.glob('*.py'))).to_equal(['setup.py'])
+        expect(paths(self.index.glob('src/*/*.py'))).to_equal([
+            'src/app/__init__.py', 'src/app/models.py', 'src/tools/lint.py'
+        ])
+        expect(paths(self.index.glob('src/ap?'))).to_equal(['src/app'])
+        expect(paths(self.index.glob('src/app/models.py/x'))).to_be_empty()
+
+    def test_globs_any_number_of_directories(self):
+        expect(paths(self.index.glob('**/index.*'))).to_equal(['docs/index.rst', 'src/app/templates/index.html'])
+        expect(paths(self.index.glob('src/**/*.py'))).to_equal([
+            'src/app/__init__.py', 'src/app/models.py', 'src/tools/lint.py'
+        ])
+        expect(paths(self.index.glob('src/app/**'))).to_equal([
+            'src/app/__init__.py', 'src/app/models.py', 'src/app/templates', 'src/app/templates/index.html'
+        ])
+
+    def test_merges_overlapping_trees(self):
+        index = TreeIndex([{'path': 'a/b.txt'}, {'path': 'a/b.txt'}, {'path': 'a/c/d.txt'}])
+
+        expect(len(index)).to_equal(2)
+        expect(paths(index.ls('a'))).to_equal(['a/b.txt', 'a/c'])
+
+
+class TestDiffTrees(TestCase):
+
+    def tree(self, **hashes):
+        return [
+            {'path': path.replace('__', '/'), 'hash': blob_hash, 'permission': '100644'}
+            for path, blob_hash in hashes.items()
+        ]
+
+    def test_reports_added_removed_and_modified_files(self):
+        diff = diff_trees(
+            self.tree(same='1', changed='2', gone='3'),
+            self.tree(same='1', changed='4', new='5')
+        )
+
+        expect(diff).to_equal(TreeDiff(['new'], ['gone'], ['changed'], []))
+        expect(diff.paths).to_equal(['changed', 'gone', 'new'])
+
+    def test_reports_removed_files_with_the_hash_of_added_ones_as_renamed(self):
+        diff = diff_trees(
+            self.tree(a='1', b='1', c='2'),
+            self.tree(docs__a='1', c='2', d='1', e='1')
+        )
+
+        expect(diff.renamed).to_equal([('a', 'd'), ('b', 'docs/a')])
+        expect(diff.added).to_equal(['e'])
+        expect(diff.removed).to_be_empty()
+
+    def test_only_pairs_blobs_as_renames(self):
+        old = [{'path': 'lib', 'filetype': 'tree', 'hash': '1'}, {'path': 'a.txt', 'filetype': 'blob', 'hash': '2'}]
+        new = [{'path': 'vendor', 'filetype': 'tree', 'hash': '1'}, {'path': 'b.txt', 'filetype': 'blob', 'hash': '2'}]
+
+        expect(diff_trees(old, new)).to_equal(TreeDiff(['vendor'], ['lib'], [], [('a.txt', 'b.txt')]))
+
+    def test_permission_changes_are_modifications(self):
+        old = self.tree(script='1')
+        new = [dict(old[0], permission='100755')]
+
+        expect(diff_trees(old, new).modified).to_equal(['script'])
+        expect(bool(diff_trees(old, old))).to_be_false()
+
+
+class TreeIndexTestCase(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = FakeGandalfServer().start()
+        cls.server.create_repository('monorepo', files=FILES)
+        cls.server.tag('monorepo', 'first')
+        cls.server.commit('monorepo', {
+            'setup.py': 'setup v2', 'docs/index.rst': None, 'docs/readme.rst': 'docs', 'CHANGES': 'changes'
+        })
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def setUp(self):
+        self.server.calls.clear()
+
+
+class TestGandalfClientTreeIndex(TreeIndexTestCase):
+
+    def test_indexes_the_whole_tree_with_one_request(self):
+        gandalf = client.GandalfClient('localhost', self.server.port)
+
+        index = gandalf.repository_tree_index('monorepo')
+
+        expect(len(index)).to_equal(8)
+        expect(paths(index.glob('**/*.py'))).to_length(4)
+        expect(self.server.calls['repository_tree']).to_equal(1)
+
+    def test_indexes_subtrees_at_the_same_commit(self):
+        gandalf = client.GandalfClient('localhost', self.server.port)
+
+        index = gandalf.repository_tree_index('monorepo', paths=['src/app', 'docs'])
+
+        expect(paths(index.ls())).to_equal(['docs', 'src'])
+        expect(paths(index.ls('src'))).to_equal(['src/app'])
+        expect(self.server.calls['repository_tree']).to_equal(2)
+
+    def test_diffs_trees_of_two_refs(self):
+        gandalf = client.GandalfClient('localhost', self.server.port, ref_cache=RefCache())
+
+        diff = gandalf.repository_tree_diff('monorepo', 'first', 'master')
+        gandalf.repository_tree_diff('monorepo', 'first', 'master')
+
+        expect(diff).to_equal(TreeDiff(['CHANGES'], [], ['setup.py'], [('docs/index.rst', 'docs/readme.rst')]))
+        # Trees are cached by commit
+        expect(self.server.calls['repository_tree']).to_equal(2)
+
+
+class TestAsyncGandalfClientTreeIndex(unittest.IsolatedAsyncioTestCase, TreeIndexTestCase):
+
+    async def test_asyncio_client_fetches_subtrees_concurrently(self):
+        http_client = asyncio_cli.AsyncioHTTPClient()
+        gandalf = asyncio_cli.AsyncioGandalfClient('localhost', self.server.port, http_client.fetch)
+
+        index = await gandalf.repository_tree_index('monorepo', paths=['src', 'docs', 'setup.py'])
+        whole = await gandalf.repository_tree_index('monorepo')
+        http_client.close()
+
+        expect(len(index)).to_equal(6)
+        expect(index.stat('setup.py').hash).to_equal(whole.stat('setup.py').hash)
+        expect(self.server.calls['repository_tree']).to_equal(4)
+
+    async def test_tornado_client_fetches_subtrees_concurrently(self):
+        http_client = AsyncHTTPClient(force_instance=True)
+        gandalf = tornado_cli.AsyncTornadoGandalfClient('localhost', self.server.port, http_client.fetch)
+
+        index = await gandalf.repository_tree_index('monorepo', 'master', ['src/tools', 'docs'])
+        diff = await gandalf.repository_tree_diff('monorepo', 'first', 'master')
+        http_client.close()
+
+        expect(paths(index.glob('**'))).to_equal(['docs', 'docs/readme.rst', 'src', 'src/tools', 'src/tools/lint.py'])
+        expect(diff.paths).to_equal(['CHANGES', 'docs/index.rst', 'docs/readme.rst', 'setup.py'])
@@ -2,11 +2,17 @@
 # -*- coding: utf-8 -*-
 
 import functools
+import json
 import os
 from os.path import join, exists, dirname
 import shutil
+import threading
+
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
 
 ROOT = '/tmp/repositories-test'
+FIXTURES = join(dirname(__file__), 'fixtures')
 
 
 def create_repository(name):
@@ -92,3 +98,70 @@ class GitEnvironVarsInjector(object):
 
 with_git_author = functools.partial(GitEnvironVarsInjector, 'author')
 with_git_committer = functools.partial(GitEnvironVarsInjector, 'committer')
+
+
+class StubGandalfHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def setup(self):
+        super(StubGandalfHandler, self).setup()
+        self.server.connections += 1
+
+    def _reply(self, code, body, chunked=False):
+        self.send_response(code)
+        if chunked:
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            for chunk in (body[:3], body[3:]):
+                self.wfile.write(('%x\r\n' % len(chunk)).encode('ascii') + chunk + b'\r\n')
+            self.wfile.write(b'0\r\n\r\n')
+            return
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if '/archive?' in self.path:
+            with open(join(FIXTURES, 'scaffold.zip'), 'rb') as archive:
+                return self._reply(200, archive.read(), chunked=True)
+        if self.path == '/healthcheck':
+            return self._reply(200, b'WORKING', chunked=True)
+        if self.path == '/repository/missing':
+            return self._reply(404, b'repository not found\n')
+        if self.path.startswith('/repository/'):
+            name = self.path.split('/')[2]
+            return self._reply(200, json.dumps({'name': name}).encode('utf-8'))
+        self._reply(404, b'not found')
+
+    def _read_body(self):
+        if self.headers.get('Transfer-Encoding') != 'chunked':
+            return self.rfile.read(int(self.headers['Content-Length']))
+        chunks = []
+        while True:
+            size = int(self.rfile.readline().strip(), 16)
+            chunks.append(self.rfile.read(size))
+            self.rfile.readline()
+            if not size:
+                return b''.join(chunks)
+
+    def do_POST(self):
+        body = self._read_body()
+        self.server.bodies.append((self.headers['Content-Type'], body))
+        self._reply(200, b'{}')
+
+
+class StubServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    connections = 0
+    bodies = []
+
+
+def start_stub_server(handler=StubGandalfHandler):
+    server = StubServer(('localhost', 0), handler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server